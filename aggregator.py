@@ -5,6 +5,7 @@ import traceback
 from .unsplash_api import build_request as u_req
 from .pexels_api import build_request as p_req
 from .pixabay_api import build_request as x_req
+from async_library import AsyncLibraryHelper, LibraryBusyError
 
 # Dictionary mapping source names to their respective build_request functions
 REQ = {"unsplash": u_req, "pexels": p_req, "pixabay": x_req}
@@ -184,4 +185,28 @@ async def multi_source(queries, sources=("unsplash", "pexels", "pixabay")):
         logging.error(f"Error in multi_source search: {str(e)}\n{error_details}")
     
     logging.info(f"Concurrent search completed with {len(results)} total results and {len(errors)} errors")
-    return results
\ No newline at end of file
+    return results
+
+async def multi_source_with_library(queries, sources=("unsplash", "pexels", "pixabay"), library_limit=50):
+    """
+    Fetch images from multiple sources and search the local library concurrently
+    
+    Args:
+        queries (list): List of search queries
+        sources (tuple): Tuple of source names to use (default: all three APIs)
+        library_limit (int): Maximum number of library matches
+        
+    Returns:
+        tuple: (combined results from all sources, matching library images)
+    """
+    async def search_library():
+        # One FTS5 query: images matching every word of any expanded query
+        try:
+            library = await AsyncLibraryHelper.search_library(list(queries), limit=library_limit)
+        except LibraryBusyError as e:
+            logging.warning(f"Skipping library search: {str(e)}")
+            return []
+        return library["images"]
+
+    remote, library = await asyncio.gather(multi_source(queries, sources), search_library())
+    return remote, library
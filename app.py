@@ -45,4 +45,9 @@ db.init_app(app)
 migrate = Migrate(app, db)
 
 # Import models here to avoid circular imports
-from models import Image, Tag, Favorite
+from models import Image, Tag, TagAlias, Favorite, ImageWeight
+
+# Pick the smart search backend from the engine dialect
+from search_backend import get_search_backend
+with app.app_context():
+    app.extensions['search_backend'] = get_search_backend(db.engine.dialect.name)
@@ -0,0 +1,76 @@
+"""Async access to the SQLite library for async views and the aggregator
+
+AsyncLibraryHelper has the same methods as LibraryHelper, as coroutines.
+Each call runs the blocking LibraryHelper method on a small dedicated
+thread pool, so an async view can await library reads alongside upstream
+HTTP fetches without stalling its event loop. Pool threads keep their
+persistent library connections (see library_db) between calls.
+
+    images, stats = await asyncio.gather(
+        AsyncLibraryHelper.search_library("koi"),
+        AsyncLibraryHelper.get_category_stats(),
+    )
+
+Calls in flight across the whole process are capped by MAX_PENDING (Flask
+runs each async view in its own event loop, so the cap cannot live on a
+loop). A call made while the cap is reached raises LibraryBusyError rather
+than queueing more work on the pool. Arguments must be usable off the
+request thread: pass Image objects with their tags already loaded.
+"""
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from models import LibraryHelper
+
+MAX_WORKERS = int(os.environ.get("LIBRARY_ASYNC_WORKERS", 4))
+MAX_PENDING = int(os.environ.get("LIBRARY_ASYNC_MAX_PENDING", 64))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="library")
+
+# Running plus queued calls, shared by every event loop in the process
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+
+
+class LibraryBusyError(RuntimeError):
+    """MAX_PENDING library calls are already in flight"""
+
+
+async def run_in_library_executor(func, *args, **kwargs):
+    """Run a blocking library function on the library thread pool
+
+    Raises:
+        LibraryBusyError: If MAX_PENDING calls are already in flight
+    """
+    if not _slots.acquire(blocking=False):
+        raise LibraryBusyError(f"{MAX_PENDING} library calls already in flight")
+    try:
+        future = _executor.submit(functools.partial(func, *args, **kwargs))
+    except BaseException:
+        _slots.release()
+        raise
+    # Freed when the work finishes, even if the awaiting view is cancelled
+    future.add_done_callback(lambda _: _slots.release())
+    return await asyncio.wrap_future(future)
+
+
+def _make_async(method):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        return await run_in_library_executor(method, *args, **kwargs)
+    return staticmethod(wrapper)
+
+
+class AsyncLibraryHelper:
+    """Coroutine versions of the LibraryHelper methods"""
+
+    # Pure computation, no database access
+    auto_categorize_image = staticmethod(LibraryHelper.auto_categorize_image)
+
+
+for _name, _method in vars(LibraryHelper).items():
+    if _name.startswith('_') or not isinstance(_method, staticmethod) or hasattr(AsyncLibraryHelper, _name):
+        continue
+    setattr(AsyncLibraryHelper, _name, _make_async(_method.__func__))
@@ -0,0 +1,157 @@
+"""Benchmark vectorized relevance scoring against the per-image loops.
+
+Scores synthetic candidate sets (1k, 10k and 100k images by default) two
+ways and reports the median time of each:
+
+  tag filter  /search with selected tags: relevance.rank_tag_filtered vs
+              the loop it replaced
+  fallback    smart-search library fallback: LibraryIndex.search vs
+              scanning every image (the index is built once, untimed)
+
+Both implementations are checked to return the same scores first.
+
+    python bench_scoring.py
+    BENCH_SIZES=1000,50000 BENCH_REPEAT=7 python bench_scoring.py
+"""
+import os
+import sys
+import time
+import random
+import statistics
+
+from app import app  # noqa: F401
+from library_index import LibraryIndex
+import relevance
+
+SIZES = [int(size) for size in os.environ.get("BENCH_SIZES", "1000,10000,100000").split(",")]
+REPEAT = int(os.environ.get("BENCH_REPEAT", 5))
+
+WORDS = [
+    "dragon", "skull", "rose", "snake", "wolf", "koi", "lotus", "dagger",
+    "butterfly", "mandala", "tiger", "eagle", "moon", "sun", "star", "wave",
+    "mountain", "feather", "compass", "anchor", "owl", "heart", "clock", "eye",
+    "blackwork", "dotwork", "traditional", "realism", "linework", "shading",
+    "portrait", "hand", "geometric", "floral", "japanese", "sketch", "stencil",
+]
+QUERY = "koi wave"
+KEYWORDS = ["koi", "wave", "japanese", "fish", "water"]
+SELECTED_TAGS = ["koi", "japanese"]
+
+
+def make_images(count, seed=42):
+    rng = random.Random(seed)
+    images = []
+    for image_id in range(1, count + 1):
+        images.append({
+            'id': image_id,
+            'unsplash_id': f"bench_{image_id}",
+            'description': ' '.join(rng.choices(WORDS, k=rng.randint(3, 12))),
+            'tags': rng.sample(WORDS, rng.randint(2, 6)),
+        })
+    return images
+
+
+def make_weights(images, seed=42):
+    rng = random.Random(seed)
+    sample = rng.sample(images, max(1, len(images) // 20))
+    keyword_scores = {image['id']: rng.random() for image in sample}
+    weight_hits = {image['unsplash_id']: {rng.choice(KEYWORDS): rng.random() * 3} for image in sample}
+    return keyword_scores, weight_hits
+
+
+def loop_tag_filter(images, selected_tags, weight_scores, query):
+    """The /search scoring loop before vectorization"""
+    filtered_images = []
+    for image in images:
+        score = 0
+        if any(tag in image['tags'] for tag in selected_tags):
+            score += 1.0
+        score += weight_scores.get(image['id'], 0.0) * 2
+        description = image.get('description', '').lower()
+        if query in description:
+            score += 0.2
+        if score > 0:
+            image['relevance_score'] = score
+            filtered_images.append(image)
+    return sorted(filtered_images, key=lambda x: x.get('relevance_score', 1.0), reverse=True)
+
+
+def loop_fallback(images, query, keywords, weight_hits, limit=50):
+    """The smart-search fallback loop before the index (boosts only)"""
+    results = []
+    for image in images:
+        score = 0
+        image_weight_hits = weight_hits.get(image.get('unsplash_id'), {})
+        description = (image.get('description', '') or '').lower()
+        tags = [t.lower() for t in image.get('tags', [])]
+        if query in description:
+            score += 3.0
+        if any(query in tag for tag in tags):
+            score += 2.5
+        for word in keywords:
+            matched = False
+            if word in image_weight_hits:
+                score += image_weight_hits[word]
+                matched = True
+            if not matched and any(word in tag for tag in tags):
+                score += 1.0
+                matched = True
+            if not matched and word in description:
+                score += 0.2
+        if score > 0:
+            results.append((score, image))
+    results.sort(key=lambda x: x[0], reverse=True)
+    return [image for _, image in results[:limit]]
+
+
+def median_ms(func):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def check(size):
+    """Both implementations agree on a small library"""
+    images = make_images(size, seed=7)
+    keyword_scores, weight_hits = make_weights(images, seed=7)
+
+    expected = {image['id']: image['relevance_score']
+                for image in loop_tag_filter([dict(image) for image in images], SELECTED_TAGS, keyword_scores, QUERY)}
+    actual = {image['id']: image['relevance_score']
+              for image in relevance.rank_tag_filtered([dict(image) for image in images], SELECTED_TAGS,
+                                                       keyword_scores, QUERY)}
+    assert expected.keys() == actual.keys() and all(abs(expected[k] - actual[k]) < 1e-9 for k in expected)
+
+    index = LibraryIndex()
+    for image in images:
+        index.add(image)
+    boosts = {image['id'] for image in loop_fallback(images, QUERY, KEYWORDS, weight_hits, limit=size)}
+    found = {image['id'] for image in index.search(QUERY, KEYWORDS, weight_hits, limit=size)}
+    assert boosts <= found
+
+
+def main():
+    check(2000)
+    print(f"{'candidates':>10}  {'scorer':<10}  {'loop ms':>9}  {'numpy ms':>9}  {'speedup':>7}")
+    for size in SIZES:
+        images = make_images(size)
+        keyword_scores, weight_hits = make_weights(images)
+
+        loop = median_ms(lambda: loop_tag_filter(images, SELECTED_TAGS, keyword_scores, QUERY))
+        vectorized = median_ms(lambda: relevance.rank_tag_filtered(images, SELECTED_TAGS, keyword_scores, QUERY))
+        print(f"{size:>10}  {'tag filter':<10}  {loop:>9.2f}  {vectorized:>9.2f}  {loop / vectorized:>6.1f}x")
+
+        index = LibraryIndex()
+        for image in images:
+            index.add(image)
+        loop = median_ms(lambda: loop_fallback(images, QUERY, KEYWORDS, weight_hits))
+        vectorized = median_ms(lambda: index.search(QUERY, KEYWORDS, weight_hits))
+        print(f"{size:>10}  {'fallback':<10}  {loop:>9.2f}  {vectorized:>9.2f}  {loop / vectorized:>6.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
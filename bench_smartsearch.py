@@ -0,0 +1,125 @@
+"""Benchmark the /api/smartsearch PostgreSQL query on a synthetic table.
+
+Seeds BENCH_ROWS synthetic images (default 1,000,000) with tags into the
+database named by BENCH_DATABASE_URL, then reports p50/p95/p99 latency of
+the ranked, hydrated full-text query. Point it at a scratch database that
+has been migrated with `flask db upgrade`; it refuses to run against
+DATABASE_URL.
+
+    BENCH_DATABASE_URL=postgresql://.../needleref_bench python bench_smartsearch.py
+"""
+import os
+import sys
+import time
+import random
+import logging
+
+# app.py reads DATABASE_URL at import time, so redirect it before importing
+bench_url = os.environ.get("BENCH_DATABASE_URL")
+if not bench_url or not bench_url.startswith("postgresql"):
+    print("❌ Set BENCH_DATABASE_URL to a scratch PostgreSQL database.")
+    sys.exit(1)
+if bench_url == os.environ.get("DATABASE_URL"):
+    print("❌ BENCH_DATABASE_URL must not be the application database.")
+    sys.exit(1)
+os.environ["DATABASE_URL"] = bench_url
+
+from sqlalchemy import text
+from app import app, db
+from search_backend import PostgresSearchBackend
+
+WORDS = [
+    "dragon", "skull", "rose", "snake", "wolf", "koi", "lotus", "dagger",
+    "butterfly", "mandala", "tiger", "eagle", "moon", "sun", "star", "wave",
+    "mountain", "feather", "compass", "anchor", "owl", "heart", "clock", "eye",
+    "blackwork", "dotwork", "traditional", "realism", "linework", "shading",
+    "portrait", "hand", "geometric", "floral", "japanese", "sketch", "stencil",
+]
+QUERIES = [
+    "dragon", "skull rose", "koi wave", "wolf moon", "snake dagger",
+    "lotus mandala", "owl feather", "tiger", "clock eye", "japanese koi",
+]
+
+
+def seed(rows, tags_per_image=3):
+    """Insert synthetic images/tags with set-based SQL; skips if already seeded"""
+    existing = db.session.execute(
+        text("SELECT COUNT(*) FROM image WHERE unsplash_id LIKE 'bench_%'")
+    ).scalar()
+    if existing >= rows:
+        logging.info(f"Benchmark table already seeded with {existing} rows")
+        return
+
+    words = "ARRAY[" + ", ".join(f"'{w}'" for w in WORDS) + "]"
+    n = len(WORDS)
+
+    db.session.execute(text(f"""
+        INSERT INTO tag (name, category)
+        SELECT w, 'Subject' FROM unnest({words}) AS w
+        ON CONFLICT (name) DO NOTHING
+    """))
+
+    # Per-row tag triggers would refresh search_vector 3x per image; seed
+    # with them off and backfill the vectors in one pass instead.
+    db.session.execute(text("ALTER TABLE image_tags DISABLE TRIGGER image_search_vector_image_tags"))
+    db.session.execute(text(f"""
+        INSERT INTO image (unsplash_id, description, url, thumbnail_url, width, height, date_added)
+        SELECT 'bench_' || g,
+               array_to_string(ARRAY[
+                   ({words})[1 + (g * 7) % {n}],
+                   ({words})[1 + (g * 13) % {n}],
+                   ({words})[1 + (g * 31) % {n}]
+               ], ' '),
+               'https://example.invalid/' || g,
+               'https://example.invalid/thumb/' || g,
+               1024, 768, now()
+        FROM generate_series(:start, :rows) AS g
+        ON CONFLICT (unsplash_id) DO NOTHING
+    """), {"start": existing + 1, "rows": rows})
+    db.session.execute(text(f"""
+        INSERT INTO image_tags (image_id, tag_id)
+        SELECT DISTINCT i.id, t.id
+        FROM image i
+        CROSS JOIN generate_series(1, :tags_per_image) AS k
+        JOIN tag t ON t.name = ({words})[1 + (i.id * (k + 3)) % {n}]
+        WHERE i.unsplash_id LIKE 'bench_%'
+        ON CONFLICT DO NOTHING
+    """), {"tags_per_image": tags_per_image})
+    db.session.execute(text("ALTER TABLE image_tags ENABLE TRIGGER image_search_vector_image_tags"))
+    db.session.execute(text("""
+        UPDATE image SET search_vector = image_search_vector(id, description)
+        WHERE unsplash_id LIKE 'bench_%'
+    """))
+    db.session.commit()
+    db.session.execute(text("ANALYZE image; ANALYZE image_tags; ANALYZE tag"))
+    db.session.commit()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(rows=1_000_000, iterations=200):
+    with app.app_context():
+        start = time.perf_counter()
+        seed(rows)
+        logging.info(f"Seeding finished in {time.perf_counter() - start:.1f}s")
+
+        backend = PostgresSearchBackend()
+        samples = []
+        for _ in range(iterations):
+            keywords = random.choice(QUERIES).split()
+            t0 = time.perf_counter()
+            backend.search(keywords, limit=50)
+            samples.append((time.perf_counter() - t0) * 1000)
+
+        print(f"smart_search on {rows:,} rows, {iterations} queries:")
+        print(f"  p50 {percentile(samples, 50):.1f} ms")
+        print(f"  p95 {percentile(samples, 95):.1f} ms")
+        print(f"  p99 {percentile(samples, 99):.1f} ms")
+
+
+if __name__ == "__main__":
+    run(rows=int(os.environ.get("BENCH_ROWS", 1_000_000)))
@@ -0,0 +1,147 @@
+"""Content-addressed storage for user-uploaded images
+
+Uploads are decoded from their data URL and written once under their
+SHA-256 digest (instance/blobs/ab/abcdef...), so identical uploads share
+one file and library rows only carry a short /media/<digest> URL. Files
+are written to a temporary name and renamed into place, so a reader never
+sees a partial blob.
+"""
+import os
+import re
+import base64
+import hashlib
+import logging
+import tempfile
+
+BLOB_ROOT = 'instance/blobs'
+MEDIA_URL_PREFIX = '/media/'
+MAX_BLOB_BYTES = 20 * 1024 * 1024
+
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+_DATA_URL_RE = re.compile(r'^data:([\w.+-]+/[\w.+-]+)?(;[^,]*)?,', re.IGNORECASE)
+
+# Leading magic bytes of the image types we accept and serve
+_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+
+def sniff_mime_type(header):
+    """Image MIME type from the first bytes of a file, or None if unsupported"""
+    for signature, mime_type in _SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def decode_data_url(data_url):
+    """Decode a base64 image data URL
+
+    Returns:
+        bytes: The image bytes
+
+    Raises:
+        ValueError: If it is not a base64 data URL of a supported image
+    """
+    match = _DATA_URL_RE.match(data_url or '')
+    if not match or ';base64' not in (match.group(2) or '').lower():
+        raise ValueError("Image must be a base64 data URL")
+
+    encoded = data_url[match.end():]
+    if len(encoded) * 3 // 4 > MAX_BLOB_BYTES:
+        raise ValueError("Image is too large")
+
+    try:
+        data = base64.b64decode(encoded, validate=True)
+    except ValueError:
+        raise ValueError("Image data is not valid base64")
+
+    if sniff_mime_type(data[:16]) is None:
+        raise ValueError("Unsupported image type")
+    return data
+
+
+def blob_path(digest):
+    """Filesystem path of a blob
+
+    Raises:
+        ValueError: If digest is not a lowercase hex SHA-256
+    """
+    if not _DIGEST_RE.match(digest or ''):
+        raise ValueError("Invalid blob digest")
+    return os.path.join(BLOB_ROOT, digest[:2], digest)
+
+
+def media_url(digest, width=None):
+    """URL the /media endpoint serves a blob under, optionally scaled to width"""
+    url = f"{MEDIA_URL_PREFIX}{digest}"
+    return f"{url}?w={width}" if width else url
+
+
+def digest_from_url(url):
+    """Blob digest referenced by a /media URL, or None"""
+    if url and url.startswith(MEDIA_URL_PREFIX):
+        digest = url[len(MEDIA_URL_PREFIX):].partition('?')[0]
+        if _DIGEST_RE.match(digest):
+            return digest
+    return None
+
+
+def put(data):
+    """Store bytes under their SHA-256 digest; a no-op if already stored
+
+    Returns:
+        str: The hex digest
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest)
+    if os.path.exists(path):
+        logging.debug(f"Blob {digest} already stored")
+        return digest
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    logging.debug(f"Stored blob {digest} ({len(data)} bytes)")
+    return digest
+
+
+def mime_type(digest):
+    """MIME type of a stored blob, sniffed from its header"""
+    with open(blob_path(digest), 'rb') as f:
+        return sniff_mime_type(f.read(16))
+
+
+def iter_digests():
+    """Digests of every stored blob"""
+    if not os.path.isdir(BLOB_ROOT):
+        return
+    for prefix in os.listdir(BLOB_ROOT):
+        directory = os.path.join(BLOB_ROOT, prefix)
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if _DIGEST_RE.match(name):
+                yield name
+
+
+def delete(digest):
+    """Remove a stored blob if present"""
+    try:
+        os.remove(blob_path(digest))
+    except FileNotFoundError:
+        pass
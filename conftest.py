@@ -0,0 +1,55 @@
+"""Shared pytest fixtures: each test gets its own library database
+
+    python -m pytest -q
+"""
+import itertools
+
+import pytest
+
+from app import app  # noqa: F401  (sets up the models before they are imported)
+import library_db
+import library_cache
+import library_index
+import library_writer
+import models
+
+_unsplash_ids = itertools.count(1)
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    """An empty, fully migrated library database in tmp_path
+
+    Writes run on the calling thread, and the snapshot cache and search
+    index are off, so every read goes to the database.
+
+    Yields:
+        LibraryHelper
+    """
+    library_db.close_connection()
+    monkeypatch.setattr(library_db, 'SQLITE_DB_PATH', str(tmp_path / 'library.db'))
+    monkeypatch.setattr(library_cache, 'ENABLED', False)
+    monkeypatch.setattr(library_index, 'ENABLED', False)
+    monkeypatch.setattr(library_writer, 'ENABLED', False)
+    models.update_sqlite_db()
+    yield models.LibraryHelper
+    library_db.close_connection()
+
+
+@pytest.fixture
+def add_image(library):
+    """Insert a library row (and its tags) directly; returns its id"""
+    def add(description='', tags=(), main_category=None, subcategory=None, width=100, height=100,
+            date_added='2026-01-01 00:00:00'):
+        with library_db.library_connection(immediate=True) as conn:
+            cursor = conn.execute('''
+            INSERT INTO library (unsplash_id, description, url, thumbnail_url, width, height,
+                                 main_category, subcategory, date_added)
+            VALUES (?, ?, 'url', 'thumb', ?, ?, ?, ?, ?)
+            ''', (f'test_{next(_unsplash_ids)}', description, width, height, main_category, subcategory,
+                  date_added))
+            library_id = cursor.lastrowid
+            conn.executemany('INSERT INTO library_tags (library_id, tag_name) VALUES (?, ?)',
+                             [(library_id, tag) for tag in tags])
+        return library_id
+    return add
@@ -23,7 +23,7 @@ def run():
                     continue
                     
                 weights = generate_weights_from_tags(image)
-                image.weights = weights  # Store as native JSON
+                image.set_weights(weights)  # JSON column + normalized image_weight rows
                 db.session.add(image)
                 updated += 1
                 
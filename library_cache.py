@@ -0,0 +1,137 @@
+"""In-process snapshot of the library for hot read paths
+
+The library is browsed far more often than it changes, so each process
+keeps one immutable snapshot of every library row, its tags and the
+category counters. Before serving from it, a dedicated probe connection
+reads PRAGMA data_version, which changes whenever any other connection,
+in this process or another worker, commits to the database. A changed
+version discards the snapshot and the next read reloads it, so cached
+reads are never staler than the last commit. The probe never writes, so
+its own changes cannot hide anyone else's.
+
+Libraries larger than MAX_SNAPSHOT_ROWS are not cached. Set
+LIBRARY_SNAPSHOT_CACHE=0 to disable the cache.
+"""
+import os
+import sqlite3
+import logging
+import threading
+
+import library_db
+from library_db import BUSY_TIMEOUT_MS, get_connection, library_connection, track
+
+ENABLED = os.environ.get("LIBRARY_SNAPSHOT_CACHE", "1") != "0"
+MAX_SNAPSHOT_ROWS = int(os.environ.get("LIBRARY_SNAPSHOT_MAX_ROWS", 50000))
+
+
+class LibrarySnapshot:
+    """Library rows, tags and category counts as of one data_version"""
+
+    def __init__(self, images, category_counts):
+        # Newest first, like the library listing
+        self.images = images
+        self.by_id = {image['id']: image for image in images}
+        self.category_counts = category_counts
+
+    @staticmethod
+    def copy_image(image):
+        """A copy callers may modify without touching the snapshot"""
+        return {**image, 'tags': list(image['tags'])}
+
+    def filter_images(self, main_category=None, subcategory=None):
+        """Copies of the images in a category, newest first (no category is Uncategorized)"""
+        return [
+            self.copy_image(image) for image in self.images
+            if (not main_category or (image['main_category'] or 'Uncategorized') == main_category)
+            and (not subcategory or (image['subcategory'] or 'Uncategorized') == subcategory)
+        ]
+
+
+_lock = threading.Lock()
+_probe = None
+_probe_key = None                # (pid, database path) the probe was opened for
+_version = None
+_snapshot = None
+
+# Stands in for the snapshot when the library was too large to cache at
+# _version, so it is only recounted after the next commit
+_TOO_LARGE = object()
+
+
+def _data_version():
+    """Current data_version as seen by this process's probe connection"""
+    global _probe, _probe_key, _snapshot
+    # The path is read on each call, so the probe watches the same database
+    # library_connection() reads even when SQLITE_DB_PATH is changed
+    key = (os.getpid(), library_db.SQLITE_DB_PATH)
+    if _probe is None or _probe_key != key:
+        # An inherited probe is left open (see library_db.track)
+        _probe = track(sqlite3.connect(key[1], timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False))
+        _probe_key = key
+        # data_version is per connection: a new probe's values say nothing
+        # about the snapshot taken under the old one
+        _snapshot = None
+    return _probe.execute('PRAGMA data_version').fetchone()[0]
+
+
+def _load():
+    """Read the whole library in one read transaction
+
+    Returns:
+        LibrarySnapshot: or _TOO_LARGE past MAX_SNAPSHOT_ROWS rows
+    """
+    with library_connection() as conn:
+        if not conn.in_transaction:
+            conn.execute('BEGIN')
+        if conn.execute('SELECT COUNT(*) FROM library').fetchone()[0] > MAX_SNAPSHOT_ROWS:
+            return _TOO_LARGE
+
+        images = [dict(row, tags=[]) for row in
+                  conn.execute('SELECT * FROM library ORDER BY date_added DESC, id DESC')]
+        by_id = {image['id']: image for image in images}
+        for row in conn.execute('SELECT library_id, tag_name FROM library_tags ORDER BY id'):
+            image = by_id.get(row['library_id'])
+            if image is not None:
+                image['tags'].append(row['tag_name'])
+
+        category_counts = [tuple(row) for row in
+                           conn.execute('SELECT main_category, subcategory, count FROM library_category_stats')]
+
+    logging.debug(f"Loaded library snapshot: {len(images)} images")
+    return LibrarySnapshot(images, category_counts)
+
+
+def get_snapshot():
+    """The current library snapshot, reloading it if the database changed
+
+    Returns:
+        LibrarySnapshot: or None when caching is disabled, the caller is in
+        a transaction, the library is too large to cache, or it could not
+        be read
+    """
+    global _version, _snapshot
+    # Inside a write transaction the caller must see its own uncommitted rows
+    if not ENABLED or get_connection().in_transaction:
+        return None
+
+    with _lock:
+        try:
+            # Read the version before loading: a commit that lands during the
+            # load bumps it again, so the next call reloads
+            version = _data_version()
+            if _snapshot is None or version != _version:
+                _snapshot = None
+                _snapshot = _load()
+                _version = version
+            return None if _snapshot is _TOO_LARGE else _snapshot
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error loading library snapshot: {str(e)}")
+            _snapshot = None
+            return None
+
+
+def invalidate():
+    """Drop the snapshot (e.g. after a schema change)"""
+    global _snapshot
+    with _lock:
+        _snapshot = None
@@ -0,0 +1,140 @@
+"""Connection management for the SQLite library database
+
+The library lives in its own SQLite file (separate from the SQLAlchemy
+database). Each thread keeps one persistent connection, opened lazily and
+tuned once with the PRAGMAs below, instead of connecting and closing on
+every LibraryHelper call. Connections are tied to the process that opened
+them, so gunicorn workers forked from a preloaded master never share one.
+
+Usage:
+
+    with library_connection() as conn:             # reads
+        conn.execute('SELECT ...')
+
+    with library_connection(immediate=True) as conn:  # writes
+        conn.execute('INSERT ...')
+
+The block commits on success and rolls back on any exception. Blocks
+nested inside an open transaction become savepoints of it.
+"""
+import os
+import sqlite3
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
+
+SQLITE_DB_PATH = 'instance/tattoo_reference.db'
+os.makedirs(os.path.dirname(SQLITE_DB_PATH), exist_ok=True)
+
+BUSY_TIMEOUT_MS = 5000           # wait for competing writers instead of failing
+CACHE_SIZE_KIB = 16384           # 16 MiB page cache per connection
+MMAP_SIZE = 256 * 1024 * 1024    # memory-map up to 256 MiB of the file
+
+_local = threading.local()
+
+# Connections that must stay open until this process closes them. SQLite
+# must not close a connection inherited across fork() in the child (that
+# releases locks the parent still holds), and dropping the last reference
+# would let garbage collection close it. A thread's connection is listed
+# only while the thread lives: when its thread-local slot goes away, the
+# entry is dropped in the process that opened it, and kept in any child
+# forked since, where it was inherited.
+_connections = {}                # id(conn) -> conn
+
+
+class _Slot:
+    """A thread's connection, owned by its thread-local storage"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.pid = os.getpid()
+        weakref.finalize(self, _release, id(conn), self.pid)
+
+
+def _release(key, pid):
+    # Dict operations are atomic, so no lock a fork could leave held
+    if os.getpid() == pid:
+        _connections.pop(key, None)
+
+
+def track(conn):
+    """Keep a process-wide library connection referenced until this process closes it"""
+    _connections[id(conn)] = conn
+    return conn
+
+
+def _connect():
+    """Open and tune a new library connection"""
+    conn = sqlite3.connect(SQLITE_DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.row_factory = sqlite3.Row
+    # WAL lets readers run concurrently with the single writer; it is
+    # persistent in the file, the rest are per-connection settings.
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA foreign_keys=ON')
+    conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KIB}')
+    conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    logging.debug(f"Opened library connection (pid {os.getpid()}, thread {threading.get_ident()})")
+    return track(conn)
+
+
+def get_connection():
+    """Return this thread's persistent library connection, opening it if needed"""
+    slot = getattr(_local, 'slot', None)
+    if slot is None or slot.pid != os.getpid():
+        # A connection inherited across fork() belongs to the parent; it
+        # stays in _connections, unused and unclosed
+        slot = _local.slot = _Slot(_connect())
+    return slot.conn
+
+
+def close_connection():
+    """Close this thread's library connection (e.g. on worker shutdown)"""
+    slot = getattr(_local, 'slot', None)
+    if slot is not None and slot.pid == os.getpid():
+        slot.conn.close()
+        _connections.pop(id(slot.conn), None)
+    _local.slot = None
+
+
+@contextmanager
+def library_connection(immediate=False):
+    """Transaction scope on this thread's persistent library connection
+
+    Args:
+        immediate (bool): Take the write lock up front (BEGIN IMMEDIATE) so
+            a read-then-write block cannot deadlock against another writer
+
+    Yields:
+        sqlite3.Connection: Connection with sqlite3.Row rows
+    """
+    conn = get_connection()
+
+    # Nested use joins the outer transaction under a savepoint: an error
+    # undoes only this block's writes, and the outer block commits
+    if conn.in_transaction:
+        conn.execute('SAVEPOINT library_nested')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK TO library_nested')
+            conn.execute('RELEASE library_nested')
+            raise
+        else:
+            conn.execute('RELEASE library_nested')
+        return
+
+    if immediate:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    else:
+        if conn.in_transaction:
+            conn.commit()
@@ -0,0 +1,477 @@
+"""In-memory inverted index for the smart-search library fallback
+
+Each process keeps postings over library descriptions and tags, so the
+fallback scores only the images that share a term with the query instead
+of every image in the library. Ranking is BM25 over description and tag
+words, plus the boosts the fallback has always applied (exact phrase in the
+description, query inside a tag, and per keyword: weight hits, then tag
+substrings, then description substrings).
+
+The index is built from the library once and then kept current from the
+library change log (see LibraryHelper.get_library_changes), which the
+library triggers append to on every write, from any process or LibraryHelper
+method. Each search first applies the changes committed since the last one.
+Set LIBRARY_SEARCH_INDEX=0 to fall back to scanning the library.
+
+Changes are applied to a copy of the index, which then replaces the shared
+one, so searches score against the index they picked up without locking;
+only catch-ups take the lock, and a search arriving mid catch-up uses the
+index already published. The copy shares every posting list and vocabulary
+entry with the original and copies one only when a change touches it.
+"""
+import os
+import re
+import math
+import logging
+import itertools
+import threading
+from collections import Counter
+
+import numpy as np
+
+from models import LibraryHelper
+import relevance
+
+ENABLED = os.environ.get("LIBRARY_SEARCH_INDEX", "1") != "0"
+CATCH_UP_PAGE_SIZE = 500
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Boosts carried over from the original scan
+PHRASE_IN_DESCRIPTION_BOOST = 3.0
+PHRASE_IN_TAG_BOOST = 2.5
+KEYWORD_IN_TAG_BOOST = 1.0
+KEYWORD_IN_DESCRIPTION_BOOST = 0.2
+
+# Substring lookups narrow the vocabulary by its n-grams up to this length
+GRAM_SIZE = 3
+CONTAINING_CACHE_SIZE = 1024
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def terms(text):
+    """Lowercase word terms of a text, for BM25"""
+    return _TERM_RE.findall((text or '').lower())
+
+
+def grams(text, size=GRAM_SIZE):
+    """The distinct substrings of text that are size characters long"""
+    return {text[start:start + size] for start in range(len(text) - size + 1)}
+
+
+def _writable(table, owned, key, empty):
+    """table[key], copied first if still shared with another index
+
+    Args:
+        table (dict): key -> set or dict
+        owned (set): Keys whose values only this table holds, or None when
+            it holds all of them; updated with key
+        empty (type): Type of a new value when key is missing
+
+    Returns:
+        The value at key, safe to change
+    """
+    value = table.get(key)
+    if value is None:
+        value = table[key] = empty()
+    elif owned is None or key in owned:
+        return value
+    else:
+        value = table[key] = value.copy()
+    if owned is not None:
+        owned.add(key)
+    return value
+
+
+class _Vocabulary:
+    """Keys (tags or description words) -> image ids, with substring lookup
+
+    Every key is listed under each of its 1- to GRAM_SIZE-grams, so the keys
+    containing a text are found by intersecting the lists of the text's
+    grams instead of testing every key. Results are cached per text until
+    the vocabulary changes.
+    """
+
+    def __init__(self):
+        self._entries = {}              # key -> set of ids
+        self._grams = {}                # n-gram -> set of keys
+        self._cache = {}                # text -> frozenset of ids
+        # Keys whose sets are not shared with a copy (None: all of them)
+        self._owned_entries = None
+        self._owned_grams = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def copy(self):
+        """A copy sharing every set with this vocabulary until either changes it"""
+        clone = _Vocabulary()
+        clone._entries = dict(self._entries)
+        clone._grams = dict(self._grams)
+        clone._owned_entries, clone._owned_grams = set(), set()
+        self._owned_entries, self._owned_grams = set(), set()
+        return clone
+
+    def add(self, key, image_id):
+        is_new = key not in self._entries
+        _writable(self._entries, self._owned_entries, key, set).add(image_id)
+        if is_new:
+            for size in range(1, GRAM_SIZE + 1):
+                for gram in grams(key, size):
+                    _writable(self._grams, self._owned_grams, gram, set).add(key)
+        self._cache.clear()
+
+    def discard(self, key, image_id):
+        if image_id not in self._entries.get(key, ()):
+            return
+        image_ids = _writable(self._entries, self._owned_entries, key, set)
+        image_ids.discard(image_id)
+        if not image_ids:
+            del self._entries[key]
+            for size in range(1, GRAM_SIZE + 1):
+                for gram in grams(key, size):
+                    keys = _writable(self._grams, self._owned_grams, gram, set)
+                    keys.discard(key)
+                    if not keys:
+                        del self._grams[gram]
+        self._cache.clear()
+
+    def containing(self, text):
+        """Ids of images with a key that contains text"""
+        found = self._cache.get(text)
+        if found is not None:
+            return found
+
+        if not text:
+            keys = self._entries.keys()
+        else:
+            keys = None
+            text_grams = grams(text, min(len(text), GRAM_SIZE))
+            for gram in sorted(text_grams, key=lambda gram: len(self._grams.get(gram, ()))):
+                matches = self._grams.get(gram, set())
+                keys = set(matches) if keys is None else keys & matches
+                if not keys:
+                    break
+            # Sharing every gram is necessary but, for longer texts, not enough
+            if len(text) > GRAM_SIZE:
+                keys = [key for key in keys if text in key]
+        found = frozenset().union(*(self._entries[key] for key in keys))
+
+        if len(self._cache) >= CONTAINING_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[text] = found
+        return found
+
+
+class LibraryIndex:
+    """Postings for BM25 plus the vocabularies the substring boosts scan"""
+
+    def __init__(self, version=0):
+        self.version = version          # last change-log version applied
+        self.images = {}                # id -> image dict
+        self._unsplash_ids = {}         # unsplash_id -> id
+        self._postings = {}             # term -> {id: term frequency}
+        self._doc_terms = {}            # id -> Counter of its terms
+        self._doc_lengths = {}          # id -> number of terms
+        self._total_length = 0
+        self._owned_postings = None     # terms not shared with a copy (None: all)
+        # Substring matching runs over these vocabularies rather than over
+        # images: a keyword without whitespace occurs in a description
+        # exactly when it occurs in one of its whitespace-separated words
+        self._words = _Vocabulary()     # description word -> ids
+        self._tags = _Vocabulary()      # tag -> ids
+
+    def __len__(self):
+        return len(self.images)
+
+    def copy(self):
+        """A copy to apply changes to while this one is searched
+
+        Posting lists and vocabulary sets are shared until a change to
+        either index touches them, so a change copies only what it touches.
+        """
+        clone = LibraryIndex(self.version)
+        clone.images = dict(self.images)
+        clone._unsplash_ids = dict(self._unsplash_ids)
+        clone._postings = dict(self._postings)
+        clone._owned_postings = set()
+        self._owned_postings = set()
+        # Counters are replaced, never changed, so they can be shared
+        clone._doc_terms = dict(self._doc_terms)
+        clone._doc_lengths = dict(self._doc_lengths)
+        clone._total_length = self._total_length
+        clone._words = self._words.copy()
+        clone._tags = self._tags.copy()
+        return clone
+
+    def add(self, image):
+        """Index an image, replacing any earlier version of it"""
+        image_id = image['id']
+        self.remove(image_id)
+
+        description = (image.get('description') or '').lower()
+        tags = {tag.lower() for tag in image.get('tags', [])}
+        doc_terms = Counter(terms(description))
+        for tag in tags:
+            doc_terms.update(terms(tag))
+
+        self.images[image_id] = image
+        if image.get('unsplash_id'):
+            self._unsplash_ids[image['unsplash_id']] = image_id
+        self._doc_terms[image_id] = doc_terms
+        self._doc_lengths[image_id] = sum(doc_terms.values())
+        self._total_length += self._doc_lengths[image_id]
+        for term, frequency in doc_terms.items():
+            _writable(self._postings, self._owned_postings, term, dict)[image_id] = frequency
+        for word in set(description.split()):
+            self._words.add(word, image_id)
+        for tag in tags:
+            self._tags.add(tag, image_id)
+
+    def remove(self, image_id):
+        """Drop an image from the index if present"""
+        image = self.images.pop(image_id, None)
+        if image is None:
+            return
+
+        if self._unsplash_ids.get(image.get('unsplash_id')) == image_id:
+            del self._unsplash_ids[image['unsplash_id']]
+        doc_terms = self._doc_terms.pop(image_id)
+        self._total_length -= self._doc_lengths.pop(image_id)
+        for term in doc_terms:
+            if image_id in self._postings.get(term, ()):
+                postings = _writable(self._postings, self._owned_postings, term, dict)
+                del postings[image_id]
+                if not postings:
+                    del self._postings[term]
+        for word in set((image.get('description') or '').lower().split()):
+            self._words.discard(word, image_id)
+        for tag in {tag.lower() for tag in image.get('tags', [])}:
+            self._tags.discard(tag, image_id)
+
+    def _bm25(self, keywords):
+        """BM25 score of every image sharing a term with the keywords"""
+        scores = {}
+        count = len(self.images)
+        if not count:
+            return scores
+        average_length = self._total_length / count or 1.0
+
+        query_terms = set()
+        for keyword in keywords:
+            query_terms.update(terms(keyword))
+        for term in query_terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for image_id, frequency in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[image_id] / average_length)
+                scores[image_id] = scores.get(image_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return scores
+
+    def search(self, query, keywords, weight_hits, limit=50):
+        """Score the library for a smart-search query
+
+        Args:
+            query (str): The lowercase query as typed
+            keywords (list): Lowercase keywords (expanded query words)
+            weight_hits (dict): unsplash_id -> {term: bucketed weight sum}
+            limit (int): Maximum number of results
+
+        Returns:
+            list: Copies of the best images, best first, each with a
+            relevance_score
+        """
+        bm25 = self._bm25(keywords)
+
+        # Exact phrase in the description: only images having every word
+        # of the phrase can contain it, so only those are checked
+        phrase_in_description = set()
+        phrase_in_tags = set()
+        phrase_words = query.split()
+        if phrase_words:
+            candidates = None
+            for word in phrase_words:
+                matches = self._words.containing(word)
+                candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    break
+            phrase_in_description = {
+                image_id for image_id in candidates or ()
+                if query in (self.images[image_id].get('description') or '').lower()
+            }
+            phrase_in_tags = self._tags.containing(query)
+
+        weighted = {}
+        for unsplash_id, hits in weight_hits.items():
+            image_id = self._unsplash_ids.get(unsplash_id)
+            if image_id is not None:
+                weighted[image_id] = hits
+        in_tags = [self._tags.containing(word) for word in keywords]
+        in_description = [self._words.containing(word) for word in keywords]
+
+        candidates = set(bm25) | phrase_in_description | phrase_in_tags | set(weighted)
+        for matches in itertools.chain(in_tags, in_description):
+            candidates |= matches
+        if not candidates:
+            return []
+
+        # One row per candidate, in id order for searchsorted
+        ids = np.array(sorted(candidates), dtype=np.int64)
+        scores = np.zeros(len(ids))
+        if bm25:
+            rows = np.searchsorted(ids, np.fromiter(bm25.keys(), dtype=np.int64, count=len(bm25)))
+            scores[rows] += np.fromiter(bm25.values(), dtype=float, count=len(bm25))
+        scores += PHRASE_IN_DESCRIPTION_BOOST * relevance.positions(ids, phrase_in_description)
+        scores += PHRASE_IN_TAG_BOOST * relevance.positions(ids, phrase_in_tags)
+
+        # Per keyword, the best available evidence: weights, tags, description
+        weights = np.full((len(ids), len(keywords)), np.nan)
+        for image_id, hits in weighted.items():
+            row = np.searchsorted(ids, image_id)
+            for column, word in enumerate(keywords):
+                if word in hits:
+                    weights[row, column] = hits[word]
+        scores += relevance.keyword_evidence(
+            weights,
+            self._keyword_matrix(ids, in_tags),
+            self._keyword_matrix(ids, in_description),
+            KEYWORD_IN_TAG_BOOST,
+            KEYWORD_IN_DESCRIPTION_BOOST
+        )
+
+        # Newest first among equal scores
+        ids, scores = ids[::-1], scores[::-1]
+        kept = np.flatnonzero(scores > 0)
+        results = []
+        for row in kept[relevance.top_k(scores[kept], limit)]:
+            image = self.images[int(ids[row])]
+            image = {**image, 'tags': list(image.get('tags', []))}
+            image['relevance_score'] = float(scores[row])
+            results.append(image)
+        return results
+
+    @staticmethod
+    def _keyword_matrix(ids, matches):
+        """(candidates, keywords) bool matrix from one id set per keyword"""
+        return np.array([relevance.positions(ids, found) for found in matches], dtype=bool) \
+            .reshape(len(matches), len(ids)).T
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def _build():
+    """Index the whole library as of the current change-log version"""
+    # Read the version first: rows committed during the load are replayed
+    # by the next catch-up, and replaying an upsert is harmless
+    version = LibraryHelper.get_library_version()
+    if version is None:
+        return None
+    index = LibraryIndex(version)
+    for image in LibraryHelper.get_all_library_images(None, None):
+        index.add(image)
+    logging.debug(f"Built library search index: {len(index)} images at version {version}")
+    return index
+
+
+def _catch_up(index, in_place=False):
+    """Apply the changes committed since the index's version
+
+    Args:
+        index (LibraryIndex): The index to bring up to date
+        in_place (bool): Change index itself; otherwise changes go to a
+            copy, leaving index intact for searches still using it
+
+    Returns:
+        LibraryIndex: The current index (index itself when nothing
+        changed), or None if the change log was compacted past the index and
+        it must be rebuilt
+    """
+    updated = index
+    while True:
+        changes = LibraryHelper.get_library_changes(since=updated.version, limit=CATCH_UP_PAGE_SIZE)
+        if not changes.get("success"):
+            # Serve the slightly stale index; the next search retries
+            return updated
+        if changes["reset"]:
+            return None
+        if changes["version"] != updated.version:
+            if updated is index and not in_place:
+                updated = index.copy()
+            for image in changes["upserts"]:
+                updated.add(image)
+            for library_id in changes["deletes"]:
+                updated.remove(library_id)
+            updated.version = changes["version"]
+        if not changes["has_more"]:
+            return updated
+
+
+def get_index():
+    """The library search index, current as of the last commit
+
+    The returned index is never changed afterwards, so it can be searched
+    without holding the lock.
+
+    Returns:
+        LibraryIndex: or None when disabled or the library could not be read
+    """
+    global _index
+    if not ENABLED:
+        return None
+
+    index = _index
+    if index is not None:
+        if not _lock.acquire(blocking=False):
+            # Another thread is catching up; use the index it started from
+            return index
+    else:
+        _lock.acquire()
+    try:
+        index = _index
+        if index is not None:
+            index = _catch_up(index)
+            if index is None:
+                logging.info("Library change log was compacted past the search index; rebuilding")
+        if index is None:
+            index = _build()
+            if index is not None:
+                index = _catch_up(index, in_place=True) or index
+        _index = index
+        return index
+    finally:
+        _lock.release()
+
+
+def search(query, keywords, weights, limit=50):
+    """Smart-search the library (see LibraryIndex.search)
+
+    Uses the shared index, or a throwaway one over the whole library when
+    the index is disabled or could not be built.
+
+    Args:
+        weights (callable): Given the library's unsplash_ids, returns their
+            weight_hits, so only library images are looked up
+
+    Returns:
+        list: Scored images, best first
+    """
+    index = get_index()
+    if index is None:
+        index = LibraryIndex()
+        for image in LibraryHelper.get_all_library_images(None, None):
+            index.add(image)
+    return index.search(query, keywords, weights(index._unsplash_ids.keys()), limit)
+
+
+def invalidate():
+    """Drop the index; the next search rebuilds it"""
+    global _index
+    with _lock:
+        _index = None
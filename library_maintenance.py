@@ -0,0 +1,115 @@
+"""Maintenance commands for the SQLite library database
+
+    python library_maintenance.py compact
+    python library_maintenance.py rebuild-stats
+    python library_maintenance.py externalize-uploads
+    python library_maintenance.py prune-blobs
+    python library_maintenance.py thumbnails
+"""
+import sys
+import logging
+import argparse
+from app import app  # noqa: F401
+from models import LibraryHelper, update_sqlite_db
+import thumbnails
+
+
+def compact():
+    """Compact the change log, remove orphaned tags, ANALYZE and reclaim free pages"""
+    changes = LibraryHelper.compact_change_log()
+    if not changes.get("success"):
+        print(f"❌ {changes.get('message')}")
+        return 1
+    print(f"✅ Removed {changes['removed']} change-log entries "
+          f"(compacted through version {changes['compacted_through']}).")
+
+    result = LibraryHelper.compact_library()
+    if not result.get("success"):
+        print(f"❌ {result.get('message')}")
+        return 1
+
+    print(f"✅ Removed {result['orphans_removed']} orphaned tags.")
+    print(f"✅ Reclaimed {result['reclaimed_pages']} pages "
+          f"({result['pages_before']} -> {result['pages_after']}).")
+    return 0
+
+
+def rebuild_stats():
+    """Recompute the per-category counters"""
+    result = LibraryHelper.rebuild_category_stats()
+    if not result.get("success"):
+        print(f"❌ {result.get('message')}")
+        return 1
+
+    print(f"✅ Rebuilt counters for {result['categories']} categories "
+          f"({result['corrected']} corrected).")
+    return 0
+
+
+def externalize_uploads():
+    """Move inline data-URL uploads into the blob store"""
+    result = LibraryHelper.externalize_uploads()
+    if not result.get("success"):
+        print(f"❌ {result.get('message')}")
+        return 1
+
+    print(f"✅ Moved {result['moved']} uploads to the blob store.")
+    if result['failed']:
+        print(f"⚠️ {result['failed']} uploads could not be decoded and were left inline.")
+    return 0
+
+
+def prune_blobs():
+    """Delete blobs no library image references"""
+    result = LibraryHelper.prune_blobs()
+    if not result.get("success"):
+        print(f"❌ {result.get('message')}")
+        return 1
+
+    print(f"✅ Removed {result['removed']} unreferenced blobs.")
+    return 0
+
+
+def render_thumbnails():
+    """Render variants for uploads that do not have them yet"""
+    digests = LibraryHelper.get_unrendered_blobs()
+    if digests and thumbnails.PILImage is None:
+        print("❌ Pillow is not installed.")
+        return 1
+
+    failed = 0
+    for digest in digests:
+        try:
+            thumbnails.generate(digest)
+        except Exception as e:
+            logging.error(f"Could not render {digest}: {str(e)}")
+            failed += 1
+
+    print(f"✅ Rendered thumbnails for {len(digests) - failed} uploads.")
+    if failed:
+        print(f"⚠️ {failed} uploads could not be rendered.")
+    return 0
+
+
+COMMANDS = {
+    "compact": compact,
+    "rebuild-stats": rebuild_stats,
+    "externalize-uploads": externalize_uploads,
+    "prune-blobs": prune_blobs,
+    "thumbnails": render_thumbnails,
+}
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description="SQLite library maintenance")
+    parser.add_argument("command", choices=sorted(COMMANDS), help="Maintenance task to run")
+    args = parser.parse_args(argv)
+
+    # Make sure the schema is current before touching it
+    update_sqlite_db()
+    logging.info(f"Running library maintenance: {args.command}")
+    return COMMANDS[args.command]()
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,183 @@
+"""Single-writer queue for library writes
+
+SQLite allows one writer at a time. Rather than every request thread
+racing for the write lock (and timing out with SQLITE_BUSY under load),
+each process funnels its library writes through one writer thread. The
+writer drains whatever is queued, runs it inside a single BEGIN IMMEDIATE
+transaction with a savepoint per write, and commits once (group commit).
+Readers are unaffected and keep running concurrently under WAL.
+
+Write methods opt in with @serialized_write; callers still get the
+method's return value (or exception) synchronously. Set
+LIBRARY_SINGLE_WRITER=0 to run writes on the calling thread instead.
+"""
+import os
+import queue
+import logging
+import threading
+import functools
+from concurrent.futures import Future
+
+from flask import current_app, has_app_context
+
+from library_db import get_connection
+
+ENABLED = os.environ.get("LIBRARY_SINGLE_WRITER", "1") != "0"
+MAX_BATCH_SIZE = int(os.environ.get("LIBRARY_WRITE_BATCH", 64))
+
+
+class LibraryWriter:
+    """Writer thread that applies queued writes in batched transactions"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()      # guards the thread and _stats
+        self._thread = None
+        self._pid = None
+        self._stats = {
+            "batches": 0,
+            "writes": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+            "max_queue_depth": 0,
+            "fallbacks": 0,
+        }
+
+    def _ensure_started(self):
+        with self._lock:
+            # A thread does not survive fork(); each worker starts its own
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name="library-writer", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def is_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a write
+
+        Returns:
+            Future: Resolves to func's return value
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        depth = self._queue.qsize()
+        with self._lock:
+            if depth > self._stats["max_queue_depth"]:
+                self._stats["max_queue_depth"] = depth
+        return future
+
+    def metrics(self):
+        """Queue depth and commit batch statistics for this process"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["enabled"] = ENABLED
+        stats["queue_depth"] = self._queue.qsize()
+        stats["mean_batch_size"] = round(stats["writes"] / stats["batches"], 2) if stats["batches"] else 0.0
+        return stats
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < MAX_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._apply(batch)
+            except Exception as e:  # never let the writer die
+                logging.error(f"Library writer failed a batch: {str(e)}")
+                for future, *_ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _apply(self, batch):
+        conn = get_connection()
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for future, func, args, kwargs in batch:
+                # A failing write only undoes its own savepoint
+                conn.execute('SAVEPOINT library_write')
+                try:
+                    outcomes.append((True, func(*args, **kwargs)))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO library_write')
+                    outcomes.append((False, e))
+                conn.execute('RELEASE library_write')
+            conn.commit()
+        except Exception as e:
+            # Could not take the lock or commit: undo everything and give
+            # each write its own transaction instead
+            logging.warning(f"Library group commit of {len(batch)} writes failed ({str(e)}); retrying individually")
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                self._stats["fallbacks"] += 1
+            self._apply_individually(batch)
+            return
+
+        self._record_batch(len(batch))
+        for (future, *_), (ok, value) in zip(batch, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _apply_individually(self, batch):
+        for future, func, args, kwargs in batch:
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            self._record_batch(1)
+
+    def _record_batch(self, size):
+        with self._lock:
+            stats = self._stats
+            stats["batches"] += 1
+            stats["writes"] += size
+            stats["last_batch_size"] = size
+            if size > stats["max_batch_size"]:
+                stats["max_batch_size"] = size
+
+
+writer = LibraryWriter()
+
+
+def serialized_write(func):
+    """Run a library write method on this process's writer thread"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # Run in place when disabled, when already on the writer, or when the
+        # caller holds an open transaction (queueing would deadlock on it)
+        if not ENABLED or writer.is_writer_thread() or get_connection().in_transaction:
+            return func(*args, **kwargs)
+        return writer.submit(_with_app_context(func), *args, **kwargs).result()
+    return wrapper
+
+
+def _with_app_context(func):
+    """Carry the caller's Flask app over to the writer thread
+
+    Write methods may lazy-load relationships (e.g. Image.tags), which
+    needs an app context on the thread doing the loading.
+    """
+    if not has_app_context():
+        return func
+    app = current_app._get_current_object()
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        with app.app_context():
+            return func(*args, **kwargs)
+    return run
+
+
+def metrics():
+    """Writer metrics for this process"""
+    return writer.metrics()
@@ -1,6 +1,12 @@
 from app import db
 from datetime import datetime
-import os
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from library_db import library_connection
+from library_writer import serialized_write
+import library_cache
+import tag_canonical
+import taxonomy
 import sqlite3
 
 # Association table for many-to-many relationship between images and tags
@@ -9,39 +15,11 @@ image_tags = db.Table('image_tags',
     db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
 )
 
-# Create a SQLite connection for the Library model (separate from PostgreSQL)
-SQLITE_DB_PATH = 'instance/tattoo_reference.db'
-os.makedirs(os.path.dirname(SQLITE_DB_PATH), exist_ok=True)
+# The Library lives in a separate SQLite database; connections are managed by
+# library_db (persistent per-thread WAL connections)
 
-# Predefined categories for tattoo references
-TATTOO_CATEGORIES = {
-    "Anatomy & Body Parts": [
-        "Faces", "Front", "Side", "¾ Angle", "Expressions",
-        "Hands", "Gestures", "Grips", "Poses",
-        "Arms & Legs", "Torsos & Backs", "Feet", "Skulls"
-    ],
-    "Nature": [
-        "Flowers", "Roses", "Peonies", "Lotuses", "Wildflowers",
-        "Plants & Leaves", "Animals", "Snakes", "Birds", "Wolves",
-        "Big Cats", "Insects", "Natural Scenes"
-    ],
-    "Myth & Fantasy": [
-        "Dragons", "Demons", "Gods/Goddesses", "Mythical Creatures", "Angels & Wings"
-    ],
-    "Objects": [
-        "Daggers", "Clocks", "Jewelry", "Weapons", "Sacred Geometry", "Crystals"
-    ],
-    "Symbolism & Spiritual": [
-        "Eyes", "Hands of Fatima", "Tarot-inspired", "Mandalas", "Religious Symbols"
-    ],
-    "Style-Based": [
-        "Traditional", "Neo-Traditional", "Blackwork", "Realism", 
-        "Dotwork", "Minimalist", "Surreal"
-    ],
-    "My References": [
-        "Uploaded Images", "Sketches", "Reference Photos"
-    ]
-}
+# Predefined categories for tattoo references, maintained in taxonomy.json
+TATTOO_CATEGORIES = taxonomy.CATEGORIES
 
 # Flattened list of all subcategories
 ALL_SUBCATEGORIES = []
@@ -49,97 +27,374 @@ for main_category, subcategories in TATTOO_CATEGORIES.items():
     for subcategory in subcategories:
         ALL_SUBCATEGORIES.append(subcategory)
 
-# Create and update the library table in SQLite
-def update_sqlite_db():
-    """Initialize or update the SQLite database schema"""
+# Library schema migrations, applied in order. PRAGMA user_version records the
+# last one applied, so each runs exactly once per database file.
+def _library_schema_v1(cursor):
+    """Base library and library_tags tables"""
     import logging
-    logging.info("Initializing/updating SQLite database schema")
-    conn = sqlite3.connect(SQLITE_DB_PATH)
-    cursor = conn.cursor()
+    # Databases created before versioning may already have the tables, so
+    # this step also fills in any columns they are missing
+
+    # Check if library table exists
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='library'")
+    library_exists = cursor.fetchone() is not None
+
+    if not library_exists:
+        logging.info("Creating library table")
+        # Create library table with category fields
+        cursor.execute('''
+        CREATE TABLE library (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            unsplash_id TEXT NOT NULL UNIQUE,
+            description TEXT,
+            url TEXT NOT NULL,
+            thumbnail_url TEXT NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            author TEXT,
+            author_username TEXT,
+            main_category TEXT,
+            subcategory TEXT,
+            date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
     
-    try:
-        # Check if library table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='library'")
-        library_exists = cursor.fetchone() is not None
-        
-        if not library_exists:
-            logging.info("Creating library table")
-            # Create library table with category fields
-            cursor.execute('''
-            CREATE TABLE library (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                unsplash_id TEXT NOT NULL UNIQUE,
-                description TEXT,
-                url TEXT NOT NULL,
-                thumbnail_url TEXT NOT NULL,
-                width INTEGER NOT NULL,
-                height INTEGER NOT NULL,
-                author TEXT,
-                author_username TEXT,
-                main_category TEXT,
-                subcategory TEXT,
-                date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            ''')
-            
-            # Create library_tags table
+        # Create library_tags table
+        cursor.execute('''
+        CREATE TABLE library_tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            library_id INTEGER,
+            tag_name TEXT NOT NULL,
+            is_custom INTEGER DEFAULT 0, -- 0 = imported tag, 1 = custom user tag
+            FOREIGN KEY (library_id) REFERENCES library (id) ON DELETE CASCADE
+        )
+        ''')
+    else:
+        # Check if we need to add the category columns
+        cursor.execute("PRAGMA table_info(library)")
+        columns = cursor.fetchall()
+        column_names = [col[1] for col in columns]
+    
+        if 'main_category' not in column_names:
+            logging.info("Adding main_category column to library table")
+            cursor.execute("ALTER TABLE library ADD COLUMN main_category TEXT")
+    
+        if 'subcategory' not in column_names:
+            logging.info("Adding subcategory column to library table")
+            cursor.execute("ALTER TABLE library ADD COLUMN subcategory TEXT")
+    
+        # Check if library_tags table exists
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='library_tags'")
+        tags_exists = cursor.fetchone() is not None
+    
+        if not tags_exists:
+            logging.info("Creating library_tags table")
             cursor.execute('''
             CREATE TABLE library_tags (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 library_id INTEGER,
                 tag_name TEXT NOT NULL,
-                is_custom INTEGER DEFAULT 0, -- 0 = imported tag, 1 = custom user tag
+                is_custom INTEGER DEFAULT 0,
                 FOREIGN KEY (library_id) REFERENCES library (id) ON DELETE CASCADE
             )
             ''')
         else:
-            # Check if we need to add the category columns
-            cursor.execute("PRAGMA table_info(library)")
-            columns = cursor.fetchall()
-            column_names = [col[1] for col in columns]
-            
-            if 'main_category' not in column_names:
-                logging.info("Adding main_category column to library table")
-                cursor.execute("ALTER TABLE library ADD COLUMN main_category TEXT")
-            
-            if 'subcategory' not in column_names:
-                logging.info("Adding subcategory column to library table")
-                cursor.execute("ALTER TABLE library ADD COLUMN subcategory TEXT")
+            # Check if we need to add the is_custom column to library_tags
+            cursor.execute("PRAGMA table_info(library_tags)")
+            tag_columns = cursor.fetchall()
+            tag_column_names = [col[1] for col in tag_columns]
+        
+            if 'is_custom' not in tag_column_names:
+                logging.info("Adding is_custom column to library_tags table")
+                cursor.execute("ALTER TABLE library_tags ADD COLUMN is_custom INTEGER DEFAULT 0")
+
+def _library_schema_v2(cursor):
+    """Category, tag and uniqueness indexes"""
+    # Older databases can hold duplicate tags; keep the first of each so the
+    # unique index can be built
+    cursor.execute('''
+    DELETE FROM library_tags
+    WHERE id NOT IN (SELECT MIN(id) FROM library_tags GROUP BY library_id, tag_name)
+    ''')
+    # Category filters + ORDER BY date_added, and the per-category counts
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_library_category ON library (main_category, subcategory, date_added)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_library_tags_image_tag ON library_tags (library_id, tag_name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_library_tags_tag_name ON library_tags (tag_name)')
+
+# Space-joined tag names of one library image, for the FTS index
+LIBRARY_FTS_TAGS = "COALESCE((SELECT group_concat(tag_name, ' ') FROM library_tags WHERE library_id = {library_id}), '')"
+
+def _library_schema_v3(cursor):
+    """Full-text index over descriptions and tags"""
+    # library_fts.rowid is library.id; triggers keep it in step with both tables
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS library_fts USING fts5(
+        description, tags,
+        tokenize = 'porter unicode61',
+        prefix = '2 3'
+    )
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_fts_insert AFTER INSERT ON library BEGIN
+        INSERT INTO library_fts (rowid, description, tags)
+        VALUES (NEW.id, COALESCE(NEW.description, ''), {LIBRARY_FTS_TAGS.format(library_id='NEW.id')});
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS library_fts_update AFTER UPDATE OF description ON library BEGIN
+        UPDATE library_fts SET description = COALESCE(NEW.description, '') WHERE rowid = NEW.id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS library_fts_delete AFTER DELETE ON library BEGIN
+        DELETE FROM library_fts WHERE rowid = OLD.id;
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_fts_tags_insert AFTER INSERT ON library_tags BEGIN
+        UPDATE library_fts SET tags = {LIBRARY_FTS_TAGS.format(library_id='NEW.library_id')}
+        WHERE rowid = NEW.library_id;
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_fts_tags_delete AFTER DELETE ON library_tags BEGIN
+        UPDATE library_fts SET tags = {LIBRARY_FTS_TAGS.format(library_id='OLD.library_id')}
+        WHERE rowid = OLD.library_id;
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_fts_tags_update AFTER UPDATE OF library_id, tag_name ON library_tags BEGIN
+        UPDATE library_fts SET tags = {LIBRARY_FTS_TAGS.format(library_id='OLD.library_id')}
+        WHERE rowid = OLD.library_id;
+        UPDATE library_fts SET tags = {LIBRARY_FTS_TAGS.format(library_id='NEW.library_id')}
+        WHERE rowid = NEW.library_id;
+    END
+    ''')
+    # Index what is already there
+    cursor.execute('DELETE FROM library_fts')
+    cursor.execute(f'''
+    INSERT INTO library_fts (rowid, description, tags)
+    SELECT l.id, COALESCE(l.description, ''), {LIBRARY_FTS_TAGS.format(library_id='l.id')}
+    FROM library l
+    ''')
+
+# Keyset sort orders for the library listing, as (expression, direction)
+# pairs. Each ends in l.id so the order is total, and each has a matching
+# index in _library_schema_v4.
+LIBRARY_SORTS = {
+    'date_added': [('l.date_added', 'DESC'), ('l.id', 'DESC')],
+    'category': [("COALESCE(l.main_category, '')", 'ASC'), ("COALESCE(l.subcategory, '')", 'ASC'),
+                 ('l.date_added', 'DESC'), ('l.id', 'DESC')],
+    'dimensions': [('l.width * l.height', 'DESC'), ('l.id', 'DESC')],
+}
+
+def _library_schema_v4(cursor):
+    """Indexes for the paginated library sort orders"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_library_date_added ON library (date_added, id)')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_library_category_sort ON library (
+        COALESCE(main_category, ''), COALESCE(subcategory, ''), date_added DESC, id DESC
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_library_pixels ON library (width * height, id)')
+
+# Per-category image counts recomputed from scratch; missing categories are
+# counted as "Uncategorized", as in get_category_stats()
+LIBRARY_CATEGORY_STATS_REBUILD = [
+    'DELETE FROM library_category_stats',
+    '''
+    INSERT INTO library_category_stats (main_category, subcategory, count)
+    SELECT COALESCE(main_category, 'Uncategorized'), COALESCE(subcategory, 'Uncategorized'), COUNT(*)
+    FROM library
+    GROUP BY 1, 2
+    ''',
+]
+
+def _library_schema_v5(cursor):
+    """Trigger-maintained per-category counters"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS library_category_stats (
+        main_category TEXT NOT NULL,
+        subcategory TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (main_category, subcategory)
+    ) WITHOUT ROWID
+    ''')
+    # Rows whose count drops to zero are removed, so a missing row means the
+    # category combination is new
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS library_category_stats_insert AFTER INSERT ON library BEGIN
+        INSERT INTO library_category_stats (main_category, subcategory, count)
+        VALUES (COALESCE(NEW.main_category, 'Uncategorized'), COALESCE(NEW.subcategory, 'Uncategorized'), 1)
+        ON CONFLICT (main_category, subcategory) DO UPDATE SET count = count + 1;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS library_category_stats_delete AFTER DELETE ON library BEGIN
+        UPDATE library_category_stats SET count = count - 1
+        WHERE main_category = COALESCE(OLD.main_category, 'Uncategorized')
+          AND subcategory = COALESCE(OLD.subcategory, 'Uncategorized');
+        DELETE FROM library_category_stats
+        WHERE main_category = COALESCE(OLD.main_category, 'Uncategorized')
+          AND subcategory = COALESCE(OLD.subcategory, 'Uncategorized')
+          AND count <= 0;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS library_category_stats_update AFTER UPDATE OF main_category, subcategory ON library
+    WHEN COALESCE(OLD.main_category, 'Uncategorized') IS NOT COALESCE(NEW.main_category, 'Uncategorized')
+      OR COALESCE(OLD.subcategory, 'Uncategorized') IS NOT COALESCE(NEW.subcategory, 'Uncategorized')
+    BEGIN
+        UPDATE library_category_stats SET count = count - 1
+        WHERE main_category = COALESCE(OLD.main_category, 'Uncategorized')
+          AND subcategory = COALESCE(OLD.subcategory, 'Uncategorized');
+        DELETE FROM library_category_stats
+        WHERE main_category = COALESCE(OLD.main_category, 'Uncategorized')
+          AND subcategory = COALESCE(OLD.subcategory, 'Uncategorized')
+          AND count <= 0;
+        INSERT INTO library_category_stats (main_category, subcategory, count)
+        VALUES (COALESCE(NEW.main_category, 'Uncategorized'), COALESCE(NEW.subcategory, 'Uncategorized'), 1)
+        ON CONFLICT (main_category, subcategory) DO UPDATE SET count = count + 1;
+    END
+    ''')
+    for statement in LIBRARY_CATEGORY_STATS_REBUILD:
+        cursor.execute(statement)
+
+def _library_schema_v6(cursor):
+    """Dimensions and downscaled variants of uploaded blobs"""
+    # A blob_images row means the source has been rendered, even when it is
+    # too small to need any variants
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS blob_images (
+        digest TEXT PRIMARY KEY,
+        width INTEGER NOT NULL,
+        height INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS blob_variants (
+        source_digest TEXT NOT NULL REFERENCES blob_images (digest) ON DELETE CASCADE,
+        width INTEGER NOT NULL,
+        height INTEGER NOT NULL,
+        digest TEXT NOT NULL,
+        PRIMARY KEY (source_digest, width)
+    ) WITHOUT ROWID
+    ''')
+
+# Logs a change to one library image (its row or its tags) while it still exists
+LIBRARY_CHANGE_UPSERT = '''
+        INSERT INTO library_changes (library_id, op)
+        SELECT {library_id}, 'upsert' WHERE EXISTS (SELECT 1 FROM library WHERE id = {library_id});'''
+
+def _library_schema_v7(cursor):
+    """Change log for delta sync"""
+    # One row per change; version only grows (AUTOINCREMENT never reuses ids)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS library_changes (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        library_id INTEGER NOT NULL,
+        op TEXT NOT NULL -- 'upsert' or 'delete'
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_library_changes_library_id ON library_changes (library_id, version)')
+    # The last version each sync client has acknowledged; the log is only
+    # compacted past what every recently seen client has read
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS library_sync_clients (
+        client_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,
+        last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS library_meta (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS library_changes_insert AFTER INSERT ON library BEGIN
+        INSERT INTO library_changes (library_id, op) VALUES (NEW.id, 'upsert');
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS library_changes_update AFTER UPDATE ON library BEGIN
+        INSERT INTO library_changes (library_id, op) VALUES (NEW.id, 'upsert');
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS library_changes_delete AFTER DELETE ON library BEGIN
+        INSERT INTO library_changes (library_id, op) VALUES (OLD.id, 'delete');
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_changes_tags_insert AFTER INSERT ON library_tags BEGIN
+        {LIBRARY_CHANGE_UPSERT.format(library_id='NEW.library_id')}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_changes_tags_delete AFTER DELETE ON library_tags BEGIN
+        {LIBRARY_CHANGE_UPSERT.format(library_id='OLD.library_id')}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_changes_tags_update AFTER UPDATE ON library_tags BEGIN
+        {LIBRARY_CHANGE_UPSERT.format(library_id='OLD.library_id')}
+        {LIBRARY_CHANGE_UPSERT.format(library_id='NEW.library_id')}
+    END
+    ''')
+    # Existing images are the first entries, so a client syncing from 0 gets them all
+    cursor.execute("INSERT INTO library_changes (library_id, op) SELECT id, 'upsert' FROM library ORDER BY id")
+
+# Category filters see a missing category as "Uncategorized", as the
+# library_category_stats counters do, so a filtered listing matches its count
+LIBRARY_CATEGORY_FILTERS = {
+    'main_category': "COALESCE(l.main_category, 'Uncategorized')",
+    'subcategory': "COALESCE(l.subcategory, 'Uncategorized')",
+}
+
+def _library_schema_v8(cursor):
+    """Index the category filter expressions"""
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_library_category_filter ON library (
+        COALESCE(main_category, 'Uncategorized'), COALESCE(subcategory, 'Uncategorized'), date_added
+    )
+    ''')
+    # Only served filters on the raw columns, which nothing queries any more
+    cursor.execute('DROP INDEX IF EXISTS idx_library_category')
+
+LIBRARY_MIGRATIONS = [
+    _library_schema_v1,
+    _library_schema_v2,
+    _library_schema_v3,
+    _library_schema_v4,
+    _library_schema_v5,
+    _library_schema_v6,
+    _library_schema_v7,
+    _library_schema_v8,
+]
+
+# Create and update the library table in SQLite
+def update_sqlite_db():
+    """Initialize or update the SQLite database schema"""
+    import logging
+    logging.info("Initializing/updating SQLite database schema")
+    try:
+        with library_connection(immediate=True) as conn:
+            cursor = conn.cursor()
             
-            # Check if library_tags table exists
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='library_tags'")
-            tags_exists = cursor.fetchone() is not None
+            cursor.execute('PRAGMA user_version')
+            version = cursor.fetchone()[0]
             
-            if not tags_exists:
-                logging.info("Creating library_tags table")
-                cursor.execute('''
-                CREATE TABLE library_tags (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    library_id INTEGER,
-                    tag_name TEXT NOT NULL,
-                    is_custom INTEGER DEFAULT 0,
-                    FOREIGN KEY (library_id) REFERENCES library (id) ON DELETE CASCADE
-                )
-                ''')
-            else:
-                # Check if we need to add the is_custom column to library_tags
-                cursor.execute("PRAGMA table_info(library_tags)")
-                tag_columns = cursor.fetchall()
-                tag_column_names = [col[1] for col in tag_columns]
-                
-                if 'is_custom' not in tag_column_names:
-                    logging.info("Adding is_custom column to library_tags table")
-                    cursor.execute("ALTER TABLE library_tags ADD COLUMN is_custom INTEGER DEFAULT 0")
+            for number, migration in enumerate(LIBRARY_MIGRATIONS[version:], start=version + 1):
+                logging.info(f"Applying library schema migration {number}: {migration.__doc__}")
+                migration(cursor)
+                cursor.execute(f'PRAGMA user_version = {number}')
         
-        conn.commit()
         logging.info("SQLite database schema initialized/updated successfully")
         
     except sqlite3.Error as e:
-        conn.rollback()
         logging.error(f"Error initializing/updating SQLite database: {str(e)}")
-        
-    finally:
-        conn.close()
 
 # Initialize SQLite database
 update_sqlite_db()
@@ -157,13 +412,35 @@ class Image(db.Model):
     author_username = db.Column(db.String(100), nullable=True)
     date_added = db.Column(db.DateTime, default=datetime.utcnow)
     weights = db.Column(db.JSON, nullable=True)  # Store weights as native JSON
+    # Description + tag names, maintained by PostgreSQL triggers (migration 1f3c2a9d4e7b)
+    search_vector = db.deferred(db.Column(TSVECTOR().with_variant(db.Text(), 'sqlite'), nullable=True))
     
     # Relationships
     tags = db.relationship('Tag', secondary=image_tags, backref=db.backref('images', lazy='dynamic'))
     favorites = db.relationship('Favorite', backref='image', lazy='dynamic', cascade="all, delete-orphan")
+    weight_rows = db.relationship('ImageWeight', lazy='select', cascade="all, delete-orphan")
+    
+    def set_weights(self, weights):
+        """Set the JSON weights and keep the normalized image_weight rows in sync
+        
+        Args:
+            weights (dict): {"category.term": weight}
+        """
+        self.weights = weights
+        self.weight_rows = [
+            ImageWeight(category=category, term=term, weight=float(weight))
+            for (category, term), weight in ImageWeight.split_keys(weights or {}).items()
+        ]
     
-    def to_dict(self):
-        """Convert image to dictionary for JSON serialization"""
+    def to_dict(self, is_favorite=None):
+        """Convert image to dictionary for JSON serialization
+        
+        Args:
+            is_favorite (bool, optional): Known favorite state; skips the
+                favorites query when the caller already has it
+        """
+        if is_favorite is None:
+            is_favorite = len(self.favorites.all()) > 0
         return {
             'id': self.id,
             'unsplash_id': self.unsplash_id,
@@ -176,7 +453,35 @@ class Image(db.Model):
             'author_username': self.author_username,
             'tags': [tag.name for tag in self.tags],
             'date_added': self.date_added.isoformat() if self.date_added else None,
-            'is_favorite': len(self.favorites.all()) > 0
+            'is_favorite': is_favorite
+        }
+    
+    @staticmethod
+    def row_to_dict(row):
+        """Build the to_dict() payload from a result row that already carries
+        the image columns plus aggregated `tags` and an `is_favorite` flag,
+        avoiding the ORM load and lazy tag/favorite queries per image"""
+        row = row._mapping
+        tags = row['tags'] or []
+        if isinstance(tags, str):
+            # SQLite group_concat() output, joined with the unit separator
+            tags = tags.split('\x1f')
+        date_added = row['date_added']
+        if isinstance(date_added, str):
+            date_added = datetime.fromisoformat(date_added)
+        return {
+            'id': row['id'],
+            'unsplash_id': row['unsplash_id'],
+            'description': row['description'],
+            'url': row['url'],
+            'thumbnail_url': row['thumbnail_url'],
+            'width': row['width'],
+            'height': row['height'],
+            'author': row['author'],
+            'author_username': row['author_username'],
+            'tags': list(tags),
+            'date_added': date_added.isoformat() if date_added else None,
+            'is_favorite': bool(row['is_favorite'])
         }
 
 class Tag(db.Model):
@@ -187,6 +492,177 @@ class Tag(db.Model):
     
     def __repr__(self):
         return f'<Tag {self.name}>'
+    
+    @staticmethod
+    def canonical(raw_name, category=None):
+        """Find or create the canonical Tag for a raw tag name
+        
+        The name is looked up in tag_alias first; otherwise it is
+        canonicalized (see tag_canonical) and, if that changed it, recorded as
+        an alias so later imports of the same spelling are a single lookup.
+        
+        Args:
+            raw_name (str): Tag name as it came from the source
+            category (str, optional): Category for a new tag; defaults to the
+                taxonomy's guess from the name
+            
+        Returns:
+            Tag: The canonical tag (pending in the session if new), or None
+            if the name is empty
+        """
+        name = tag_canonical.normalize(raw_name)
+        if not name:
+            return None
+        
+        alias = TagAlias.query.filter_by(alias=name).first()
+        if alias:
+            return alias.tag
+        
+        canonical_name = tag_canonical.lemmatize(name)
+        if canonical_name != name:
+            # The lemma itself may be an alias ("rose flowers" -> "rose flower" -> "rose")
+            alias = TagAlias.query.filter_by(alias=canonical_name).first()
+        tag = alias.tag if alias else Tag.query.filter_by(name=canonical_name).first()
+        if not tag:
+            tag = Tag(name=canonical_name, category=category or taxonomy.tag_category(canonical_name))
+            db.session.add(tag)
+        if name != tag.name:
+            db.session.add(TagAlias(alias=name, tag=tag))
+        return tag
+    
+    def add_alias(self, alias_name):
+        """Map another spelling to this tag
+        
+        If a Tag already uses that spelling it is merged into this one: its
+        images and aliases move here and the duplicate is deleted.
+        
+        Args:
+            alias_name (str): The other spelling
+            
+        Returns:
+            TagAlias: The alias (pending in the session), or None if the
+            name is empty or already this tag's name
+        """
+        name = tag_canonical.normalize(alias_name)
+        if not name or name == self.name:
+            return None
+        
+        duplicate = Tag.query.filter_by(name=name).first()
+        if duplicate is not None:
+            for image in duplicate.images:
+                if self not in image.tags:
+                    image.tags.append(self)
+            for alias in duplicate.aliases:
+                alias.tag = self
+            # Flush the moves first, or deleting the duplicate cascades to its aliases
+            db.session.flush()
+            db.session.delete(duplicate)
+        
+        alias = TagAlias.query.filter_by(alias=name).first()
+        if alias is None:
+            alias = TagAlias(alias=name)
+            db.session.add(alias)
+        alias.tag = self
+        return alias
+
+class TagAlias(db.Model):
+    """Alternative spelling of a tag, mapped to its canonical Tag"""
+    __tablename__ = 'tag_alias'
+    alias = db.Column(db.String(50), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), nullable=False, index=True)
+    
+    tag = db.relationship('Tag', backref=db.backref('aliases', lazy='dynamic', cascade="all, delete-orphan"))
+    
+    def __repr__(self):
+        return f'<TagAlias {self.alias} -> {self.tag_id}>'
+
+class ImageWeight(db.Model):
+    """Normalized Image.weights: one row per "category.term" key"""
+    __tablename__ = 'image_weight'
+    image_id = db.Column(db.Integer, db.ForeignKey('image.id', ondelete='CASCADE'), primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)  # subject, style, technique, ...
+    term = db.Column(db.String(100), primary_key=True)
+    weight = db.Column(db.Float, nullable=False, default=1.0)
+    
+    # Lookups go by (category, term); image_id and weight make it covering
+    __table_args__ = (
+        db.Index('ix_image_weight_category_term', 'category', 'term', 'image_id', 'weight'),
+    )
+    
+    # Score multipliers for the smart search buckets
+    BUCKET_MULTIPLIERS = {'subject': 3.0, 'style': 2.0, 'technique': 1.5}
+    
+    @staticmethod
+    def split_keys(weights):
+        """Split {"category.term": weight} into {(category, term): weight}"""
+        split = {}
+        for key, weight in weights.items():
+            if not key:
+                continue
+            category, dot, term = key.lower().partition('.')
+            if not dot:
+                category, term = 'general', category
+            split[(category, term)] = weight
+        return split
+    
+    @staticmethod
+    def keyword_scores(image_ids, keywords):
+        """Sum the weights whose "category.term" key contains any keyword
+        
+        Args:
+            image_ids (list): Image ids to score
+            keywords (list): Lowercase query words
+            
+        Returns:
+            dict: image_id -> summed weight (images without matches are omitted)
+        """
+        if not image_ids or not keywords:
+            return {}
+        
+        key = func.lower(ImageWeight.category + '.' + ImageWeight.term)
+        rows = db.session.query(ImageWeight.image_id, func.sum(ImageWeight.weight)) \
+            .filter(ImageWeight.image_id.in_(image_ids)) \
+            .filter(or_(*[key.contains(word.lower(), autoescape=True) for word in keywords])) \
+            .group_by(ImageWeight.image_id) \
+            .all()
+        return {image_id: float(total) for image_id, total in rows}
+    
+    @staticmethod
+    def bucket_scores(keywords, buckets, unsplash_ids):
+        """Weighted sums of subject.*, style.* and technique.* weights per image
+        
+        Args:
+            keywords (list): Lowercase query words
+            buckets (dict): category -> set of known terms for that bucket
+            unsplash_ids (iterable): Only score these images (the library's)
+            
+        Returns:
+            dict: unsplash_id -> {term: sum(weight * bucket multiplier)}
+        """
+        conditions = []
+        for category in ImageWeight.BUCKET_MULTIPLIERS:
+            terms = [word for word in keywords if word in buckets.get(category, ())]
+            if terms:
+                conditions.append(and_(ImageWeight.category == category, ImageWeight.term.in_(terms)))
+        
+        unsplash_ids = list(unsplash_ids)
+        if not conditions or not unsplash_ids:
+            return {}
+        
+        multiplier = case(ImageWeight.BUCKET_MULTIPLIERS, value=ImageWeight.category, else_=0.0)
+        scores = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(unsplash_ids), 500):
+            batch = unsplash_ids[start:start + 500]
+            rows = db.session.query(Image.unsplash_id, ImageWeight.term, func.sum(ImageWeight.weight * multiplier)) \
+                .join(Image, Image.id == ImageWeight.image_id) \
+                .filter(Image.unsplash_id.in_(batch)) \
+                .filter(or_(*conditions)) \
+                .group_by(Image.unsplash_id, ImageWeight.term) \
+                .all()
+            for unsplash_id, term, total in rows:
+                scores.setdefault(unsplash_id, {})[term] = float(total)
+        return scores
 
 class Favorite(db.Model):
     """Model for user's favorite images"""
@@ -194,6 +670,12 @@ class Favorite(db.Model):
     image_id = db.Column(db.Integer, db.ForeignKey('image.id'), nullable=False)
     date_added = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Keyset pagination walks (date_added, id); favorite lookups go by image_id
+    __table_args__ = (
+        db.Index('ix_favorite_date_added_id', 'date_added', 'id'),
+        db.Index('ix_favorite_image_id', 'image_id'),
+    )
+    
     def __repr__(self):
         return f'<Favorite {self.id}>'
 
@@ -204,6 +686,7 @@ class Favorite(db.Model):
 # SQLite Library Helper Functions
 class LibraryHelper:
     @staticmethod
+    @serialized_write
     def add_to_library(image, main_category=None, subcategory=None):
         """Add an image to the SQLite library
         
@@ -215,77 +698,73 @@ class LibraryHelper:
         import logging
         logging.debug(f"Adding image to library: {image.id} (Unsplash ID: {image.unsplash_id})")
         
-        conn = sqlite3.connect(SQLITE_DB_PATH)
-        cursor = conn.cursor()
-        
         try:
-            # Check if the image already exists in the library
-            cursor.execute('SELECT id FROM library WHERE unsplash_id = ?', (image.unsplash_id,))
-            existing = cursor.fetchone()
-            
-            if existing:
-                # Image already in library
-                logging.debug(f"Image already in library with ID: {existing[0]}")
-                return {"success": False, "message": "Image already in library", "existing_id": existing[0]}
-            
-            # Try to auto-categorize based on tags if no category provided
-            if not main_category or not subcategory:
-                auto_categorized = LibraryHelper.auto_categorize_image(image.tags)
-                main_category = main_category or auto_categorized.get('main_category')
-                subcategory = subcategory or auto_categorized.get('subcategory')
-                logging.debug(f"Auto-categorized image as: {main_category}/{subcategory}")
-                
-                # If we still couldn't determine a category, use "Uncategorized"
-                if not main_category:
-                    main_category = "Uncategorized"
-                if not subcategory:
-                    subcategory = "Uncategorized"
-                logging.debug(f"Final category assignment: {main_category}/{subcategory}")
-            
-            # Check if this category/subcategory combination is new
-            cursor.execute(
-                'SELECT COUNT(*) FROM library WHERE main_category = ? AND subcategory = ?',
-                (main_category, subcategory)
-            )
-            category_count = cursor.fetchone()[0]
-            is_new_category = category_count == 0
-            logging.debug(f"Is new category/subcategory combination: {is_new_category}")
+            with library_connection(immediate=True) as conn:
+                cursor = conn.cursor()
+                
+                # Check if the image already exists in the library
+                cursor.execute('SELECT id FROM library WHERE unsplash_id = ?', (image.unsplash_id,))
+                existing = cursor.fetchone()
+                
+                if existing:
+                    # Image already in library
+                    logging.debug(f"Image already in library with ID: {existing[0]}")
+                    return {"success": False, "message": "Image already in library", "existing_id": existing[0]}
+                
+                # Try to auto-categorize based on tags if no category provided
+                if not main_category or not subcategory:
+                    auto_categorized = LibraryHelper.auto_categorize_image(image.tags)
+                    main_category = main_category or auto_categorized.get('main_category')
+                    subcategory = subcategory or auto_categorized.get('subcategory')
+                    logging.debug(f"Auto-categorized image as: {main_category}/{subcategory}")
+                    
+                    # If we still couldn't determine a category, use "Uncategorized"
+                    if not main_category:
+                        main_category = "Uncategorized"
+                    if not subcategory:
+                        subcategory = "Uncategorized"
+                    logging.debug(f"Final category assignment: {main_category}/{subcategory}")
+                
+                # Check if this category/subcategory combination is new
+                cursor.execute(
+                    'SELECT 1 FROM library_category_stats WHERE main_category = ? AND subcategory = ?',
+                    (main_category, subcategory)
+                )
+                is_new_category = cursor.fetchone() is None
+                logging.debug(f"Is new category/subcategory combination: {is_new_category}")
+                
+                # Insert image into library with categories
+                logging.debug(f"Inserting image into library with categories: {main_category}/{subcategory}")
+                cursor.execute('''
+                INSERT INTO library (
+                    unsplash_id, description, url, thumbnail_url, 
+                    width, height, author, author_username,
+                    main_category, subcategory
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    image.unsplash_id,
+                    image.description,
+                    image.url,
+                    image.thumbnail_url,
+                    image.width,
+                    image.height,
+                    image.author,
+                    image.author_username,
+                    main_category,
+                    subcategory
+                ))
+                
+                # Get the newly inserted library_id
+                library_id = cursor.lastrowid
+                logging.debug(f"New library ID: {library_id}")
+                
+                # Insert tags for the image
+                cursor.executemany('INSERT OR IGNORE INTO library_tags (library_id, tag_name) VALUES (?, ?)',
+                                   [(library_id, tag.name) for tag in image.tags])
+                
+                logging.debug(f"Added {cursor.rowcount} tags to the image")
             
-            # Insert image into library with categories
-            logging.debug(f"Inserting image into library with categories: {main_category}/{subcategory}")
-            cursor.execute('''
-            INSERT INTO library (
-                unsplash_id, description, url, thumbnail_url, 
-                width, height, author, author_username,
-                main_category, subcategory
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                image.unsplash_id,
-                image.description,
-                image.url,
-                image.thumbnail_url,
-                image.width,
-                image.height,
-                image.author,
-                image.author_username,
-                main_category,
-                subcategory
-            ))
-            
-            # Get the newly inserted library_id
-            library_id = cursor.lastrowid
-            logging.debug(f"New library ID: {library_id}")
-            
-            # Insert tags for the image
-            tag_count = 0
-            for tag in image.tags:
-                cursor.execute('INSERT INTO library_tags (library_id, tag_name) VALUES (?, ?)',
-                              (library_id, tag.name))
-                tag_count += 1
-            
-            logging.debug(f"Added {tag_count} tags to the image")
-            conn.commit()
             logging.debug("Successfully saved image to library")
             
             return {
@@ -298,17 +777,125 @@ class LibraryHelper:
             }
         
         except sqlite3.Error as e:
-            conn.rollback()
             logging.error(f"SQLite error when saving to library: {str(e)}")
             return {"success": False, "message": f"Error saving to library: {str(e)}"}
         
         except Exception as e:
-            conn.rollback()
             logging.error(f"Unexpected error when saving to library: {str(e)}", exc_info=True)
             return {"success": False, "message": f"Unexpected error: {str(e)}"}
+    
+    @staticmethod
+    @serialized_write
+    def add_many_to_library(images, main_category=None, subcategory=None):
+        """Add a batch of images to the SQLite library in one transaction
+        
+        Images already in the library (or repeated within the batch) are
+        reported per item and skipped; the rest are inserted together.
+        
+        Args:
+            images (list): Image objects (from PostgreSQL or unsaved uploads)
+            main_category (str, optional): Category for every image; auto-categorized if omitted
+            subcategory (str, optional): Subcategory for every image; auto-categorized if omitted
+            
+        Returns:
+            dict: Overall result and one result per image, in input order
+        """
+        import logging
+        logging.debug(f"Adding {len(images)} images to library in one batch")
+        
+        results = [None] * len(images)
+        pending = {}  # unsplash_id -> index of the first occurrence
+        for index, image in enumerate(images):
+            if image.unsplash_id in pending:
+                results[index] = {"success": False, "message": "Duplicate in batch",
+                                  "unsplash_id": image.unsplash_id}
+            else:
+                pending[image.unsplash_id] = index
+        
+        # Categorize up front; nothing here needs the database
+        categories = {}
+        for unsplash_id, index in pending.items():
+            image_main, image_sub = main_category, subcategory
+            if not image_main or not image_sub:
+                auto_categorized = LibraryHelper.auto_categorize_image(images[index].tags)
+                image_main = image_main or auto_categorized.get('main_category') or "Uncategorized"
+                image_sub = image_sub or auto_categorized.get('subcategory') or "Uncategorized"
+            categories[unsplash_id] = (image_main, image_sub)
+        
+        try:
+            with library_connection(immediate=True) as conn:
+                cursor = conn.cursor()
+                
+                # Drop images that are already in the library
+                unsplash_ids = list(pending)
+                for start in range(0, len(unsplash_ids), 500):
+                    batch = unsplash_ids[start:start + 500]
+                    cursor.execute(f'SELECT id, unsplash_id FROM library WHERE unsplash_id IN ({", ".join("?" * len(batch))})',
+                                   batch)
+                    for row in cursor.fetchall():
+                        index = pending.pop(row['unsplash_id'])
+                        results[index] = {"success": False, "message": "Image already in library",
+                                          "unsplash_id": row['unsplash_id'], "existing_id": row['id']}
+                
+                # Category combinations that exist before this batch
+                cursor.execute('SELECT main_category, subcategory FROM library_category_stats')
+                known_categories = {(row[0], row[1]) for row in cursor.fetchall()}
+                
+                cursor.executemany('''
+                INSERT INTO library (
+                    unsplash_id, description, url, thumbnail_url,
+                    width, height, author, author_username,
+                    main_category, subcategory
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(
+                    image.unsplash_id,
+                    image.description,
+                    image.url,
+                    image.thumbnail_url,
+                    image.width,
+                    image.height,
+                    image.author,
+                    image.author_username,
+                    *categories[image.unsplash_id]
+                ) for image in (images[index] for index in pending.values())])
+                
+                # executemany() gives no per-row lastrowid; look the new ids up
+                library_ids = {}
+                unsplash_ids = list(pending)
+                for start in range(0, len(unsplash_ids), 500):
+                    batch = unsplash_ids[start:start + 500]
+                    cursor.execute(f'SELECT id, unsplash_id FROM library WHERE unsplash_id IN ({", ".join("?" * len(batch))})',
+                                   batch)
+                    library_ids.update((row['unsplash_id'], row['id']) for row in cursor.fetchall())
+                
+                cursor.executemany('INSERT OR IGNORE INTO library_tags (library_id, tag_name) VALUES (?, ?)', [
+                    (library_ids[unsplash_id], tag.name)
+                    for unsplash_id, index in pending.items()
+                    for tag in images[index].tags
+                ])
+            
+            for unsplash_id, index in pending.items():
+                image_main, image_sub = categories[unsplash_id]
+                results[index] = {
+                    "success": True,
+                    "message": "Image saved to library",
+                    "unsplash_id": unsplash_id,
+                    "library_id": library_ids[unsplash_id],
+                    "main_category": image_main,
+                    "subcategory": image_sub,
+                    "new_category": (image_main, image_sub) not in known_categories
+                }
+                # Only the first image of a new combination counts as new
+                known_categories.add((image_main, image_sub))
+            
+            logging.debug(f"Added {len(pending)} of {len(images)} images to library")
+            return {"success": True, "added": len(pending), "results": results}
         
-        finally:
-            conn.close()
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error in batch add to library: {str(e)}")
+            return {"success": False, "message": f"Error saving images to library: {str(e)}",
+                    "added": 0, "results": []}
     
     @staticmethod
     def auto_categorize_image(tags):
@@ -328,130 +915,7 @@ class LibraryHelper:
             else:
                 tag_names.append(str(tag).lower())
         
-        # Map of keywords to subcategories
-        keyword_to_subcategory = {
-            # Anatomy
-            "face": "Faces",
-            "portrait": "Faces",
-            "hand": "Hands",
-            "finger": "Hands",
-            "arm": "Arms & Legs",
-            "leg": "Arms & Legs",
-            "foot": "Feet",
-            "feet": "Feet",
-            "skull": "Skulls",
-            "bone": "Skulls",
-            "torso": "Torsos & Backs",
-            "back": "Torsos & Backs",
-            
-            # Nature
-            "flower": "Flowers",
-            "rose": "Roses",
-            "peony": "Peonies",
-            "lotus": "Lotuses",
-            "plant": "Plants & Leaves",
-            "leaf": "Plants & Leaves",
-            "leaves": "Plants & Leaves",
-            "animal": "Animals",
-            "snake": "Snakes",
-            "serpent": "Snakes",
-            "bird": "Birds",
-            "wolf": "Wolves",
-            "lion": "Big Cats",
-            "tiger": "Big Cats",
-            "cat": "Big Cats",
-            "insect": "Insects",
-            "bug": "Insects",
-            "butterfly": "Insects",
-            "mountain": "Natural Scenes",
-            "ocean": "Natural Scenes",
-            "wave": "Natural Scenes",
-            "tree": "Natural Scenes",
-            
-            # Myth & Fantasy
-            "dragon": "Dragons",
-            "demon": "Demons",
-            "devil": "Demons",
-            "god": "Gods/Goddesses",
-            "goddess": "Gods/Goddesses",
-            "deity": "Gods/Goddesses",
-            "mythical": "Mythical Creatures",
-            "fantasy": "Mythical Creatures",
-            "angel": "Angels & Wings",
-            "wing": "Angels & Wings",
-            
-            # Objects
-            "dagger": "Daggers",
-            "knife": "Daggers",
-            "clock": "Clocks",
-            "time": "Clocks",
-            "jewelry": "Jewelry",
-            "ring": "Jewelry",
-            "necklace": "Jewelry",
-            "weapon": "Weapons",
-            "sword": "Weapons",
-            "gun": "Weapons",
-            "sacred geometry": "Sacred Geometry",
-            "geometric": "Sacred Geometry",
-            "crystal": "Crystals",
-            "gem": "Crystals",
-            
-            # Symbolism & Spiritual
-            "eye": "Eyes",
-            "hamsa": "Hands of Fatima",
-            "fatima": "Hands of Fatima",
-            "tarot": "Tarot-inspired",
-            "card": "Tarot-inspired",
-            "mandala": "Mandalas",
-            "religious": "Religious Symbols",
-            "cross": "Religious Symbols",
-            
-            # Style-Based
-            "traditional": "Traditional",
-            "old school": "Traditional",
-            "neo-traditional": "Neo-Traditional",
-            "blackwork": "Blackwork",
-            "realistic": "Realism",
-            "realism": "Realism",
-            "dotwork": "Dotwork",
-            "minimal": "Minimalist",
-            "minimalist": "Minimalist",
-            "surreal": "Surreal",
-            "abstract": "Surreal"
-        }
-        
-        # Map of subcategories to main categories
-        subcategory_to_main = {}
-        for main_cat, subcats in TATTOO_CATEGORIES.items():
-            for subcat in subcats:
-                subcategory_to_main[subcat] = main_cat
-        
-        # Check for keyword matches in tags
-        matched_subcategories = {}
-        
-        for tag in tag_names:
-            for keyword, subcategory in keyword_to_subcategory.items():
-                if keyword in tag:
-                    matched_subcategories[subcategory] = matched_subcategories.get(subcategory, 0) + 1
-        
-        # Find the most common subcategory
-        best_subcategory = None
-        highest_count = 0
-        
-        for subcategory, count in matched_subcategories.items():
-            if count > highest_count:
-                highest_count = count
-                best_subcategory = subcategory
-        
-        # Get the main category for this subcategory
-        main_category = None
-        if best_subcategory:
-            main_category = subcategory_to_main.get(best_subcategory)
-        
-        return {
-            "main_category": main_category,
-            "subcategory": best_subcategory
-        }
+        return taxonomy.categorize(tag_names)
     
     @staticmethod
     def get_all_library_images(main_category=None, subcategory=None):
@@ -467,54 +931,44 @@ class LibraryHelper:
         import logging
         logging.debug(f"Getting library images (filters: main_category={main_category}, subcategory={subcategory})")
         
-        conn = sqlite3.connect(SQLITE_DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        snapshot = library_cache.get_snapshot()
+        if snapshot is not None:
+            return snapshot.filter_images(main_category, subcategory)
         
         try:
-            # Build the query based on filters
-            query = 'SELECT * FROM library'
-            params = []
-            
-            # Add category filters if provided
-            where_clauses = []
-            if main_category:
-                where_clauses.append('main_category = ?')
-                params.append(main_category)
-            
-            if subcategory:
-                where_clauses.append('subcategory = ?')
-                params.append(subcategory)
-            
-            # Add WHERE clause if we have filters
-            if where_clauses:
-                query += ' WHERE ' + ' AND '.join(where_clauses)
-            
-            # Add ORDER BY
-            query += ' ORDER BY date_added DESC'
-            
-            logging.debug(f"Executing query: {query} with params: {params}")
-            
-            # Execute the query
-            cursor.execute(query, params)
-            images = cursor.fetchall()
-            logging.debug(f"Found {len(images)} images in library")
-            
-            # Check if we can see the structure of the first image
-            if images and len(images) > 0:
-                sample_img = images[0]
-                logging.debug(f"Sample image data: {dict(sample_img)}")
+            with library_connection() as conn:
+                cursor = conn.cursor()
                 
-            result = []
-            for img in images:
-                # Get tags for this image
-                cursor.execute('SELECT tag_name FROM library_tags WHERE library_id = ?', (img['id'],))
-                tags = [row['tag_name'] for row in cursor.fetchall()]
+                # Build the filters shared by the image and tag queries
+                where_clauses, params = LibraryHelper._category_filter(main_category, subcategory)
                 
-                # Convert to dictionary
-                image_dict = dict(img)
-                image_dict['tags'] = tags
-                result.append(image_dict)
+                where = ' WHERE ' + ' AND '.join(where_clauses) if where_clauses else ''
+                query = f'SELECT l.* FROM library l{where} ORDER BY l.date_added DESC'
+                
+                logging.debug(f"Executing query: {query} with params: {params}")
+                
+                # Execute the query
+                cursor.execute(query, params)
+                images = cursor.fetchall()
+                logging.debug(f"Found {len(images)} images in library")
+                
+                # Tags for every matching image in one statement
+                cursor.execute(f'''
+                SELECT t.library_id, t.tag_name
+                FROM library_tags t
+                JOIN library l ON l.id = t.library_id{where}
+                ORDER BY t.id
+                ''', params)
+                tags_by_image = {}
+                for row in cursor.fetchall():
+                    tags_by_image.setdefault(row['library_id'], []).append(row['tag_name'])
+                
+                result = []
+                for img in images:
+                    # Convert to dictionary
+                    image_dict = dict(img)
+                    image_dict['tags'] = tags_by_image.get(img['id'], [])
+                    result.append(image_dict)
             
             logging.debug(f"Returning {len(result)} processed images")
             return result
@@ -526,184 +980,542 @@ class LibraryHelper:
         except Exception as e:
             logging.error(f"Unexpected error getting library images: {str(e)}", exc_info=True)
             return []
-        
-        finally:
-            conn.close()
     
     @staticmethod
-    def get_category_stats():
-        """Get statistics about categories in the library
+    def _category_filter(main_category=None, subcategory=None):
+        """Build the WHERE clauses for the library category filters
+        
+        Args:
+            main_category (str, optional): Main category, "Uncategorized" for none
+            subcategory (str, optional): Subcategory, "Uncategorized" for none
         
         Returns:
-            dict: Counts of images in each category and subcategory
+            tuple: (clauses on the library table aliased as l, their params)
         """
-        conn = sqlite3.connect(SQLITE_DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        try:
-            # Initialize category structure with all subcategories
-            categories = {}
-            for main_cat, subcats in TATTOO_CATEGORIES.items():
-                categories[main_cat] = {
-                    "count": 0,
-                    "subcategories": {subcat: 0 for subcat in subcats}
-                }
-            
-            # Add "Uncategorized" category
-            categories["Uncategorized"] = {
-                "count": 0,
-                "subcategories": {"Uncategorized": 0}
-            }
-            
-            # Get counts by main category
-            cursor.execute('''
-            SELECT main_category, COUNT(*) as count 
-            FROM library 
-            GROUP BY main_category
-            ''')
-            
-            for row in cursor.fetchall():
-                main_cat = row['main_category'] or "Uncategorized"
-                count = row['count']
-                
-                if main_cat not in categories:
-                    categories[main_cat] = {
-                        "count": 0,
-                        "subcategories": {}
-                    }
-                
-                categories[main_cat]["count"] = count
-            
-            # Get counts by subcategory
-            cursor.execute('''
-            SELECT main_category, subcategory, COUNT(*) as count 
-            FROM library 
-            GROUP BY main_category, subcategory
-            ''')
-            
-            for row in cursor.fetchall():
-                main_cat = row['main_category'] or "Uncategorized"
-                subcat = row['subcategory'] or "Uncategorized"
-                count = row['count']
-                
-                if main_cat not in categories:
-                    categories[main_cat] = {
-                        "count": 0,
-                        "subcategories": {}
-                    }
-                
-                if "subcategories" not in categories[main_cat]:
-                    categories[main_cat]["subcategories"] = {}
-                
-                categories[main_cat]["subcategories"][subcat] = count
-            
-            # Get total count
-            cursor.execute('SELECT COUNT(*) as total FROM library')
-            total = cursor.fetchone()['total']
-            
-            return {
-                "total": total,
-                "categories": categories
-            }
-        
-        except sqlite3.Error as e:
-            return {"total": 0, "categories": {}}
-        
-        finally:
-            conn.close()
+        where_clauses = []
+        params = []
+        if main_category:
+            where_clauses.append(f"{LIBRARY_CATEGORY_FILTERS['main_category']} = ?")
+            params.append(main_category)
+        if subcategory:
+            where_clauses.append(f"{LIBRARY_CATEGORY_FILTERS['subcategory']} = ?")
+            params.append(subcategory)
+        return where_clauses, params
     
     @staticmethod
-    def get_library_image(library_id):
-        """Get a specific image from the library"""
-        conn = sqlite3.connect(SQLITE_DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+    def _fetch_tags(cursor, library_ids):
+        """Tags for a set of library images with batched IN lookups
         
-        try:
-            # Get the image from library
-            cursor.execute('SELECT * FROM library WHERE id = ?', (library_id,))
-            img = cursor.fetchone()
-            
-            if not img:
-                return None
-            
-            # Get tags for this image
-            cursor.execute('SELECT tag_name FROM library_tags WHERE library_id = ?', (img['id'],))
-            tags = [row['tag_name'] for row in cursor.fetchall()]
-            
-            # Convert to dictionary
-            image_dict = dict(img)
-            image_dict['tags'] = tags
-            
-            return image_dict
+        Returns:
+            dict: library_id -> list of tag names
+        """
+        tags_by_image = {library_id: [] for library_id in library_ids}
+        library_ids = list(tags_by_image)
         
-        except sqlite3.Error:
-            return None
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(library_ids), 500):
+            batch = library_ids[start:start + 500]
+            placeholders = ', '.join('?' * len(batch))
+            cursor.execute(f'SELECT library_id, tag_name FROM library_tags WHERE library_id IN ({placeholders}) ORDER BY id',
+                           batch)
+            for row in cursor.fetchall():
+                tags_by_image[row['library_id']].append(row['tag_name'])
         
-        finally:
-            conn.close()
+        return tags_by_image
     
     @staticmethod
-    def delete_from_library(library_id):
-        """Delete an image from the library"""
-        conn = sqlite3.connect(SQLITE_DB_PATH)
-        cursor = conn.cursor()
+    def _keyset_filter(sort_columns, after):
+        """WHERE fragment selecting rows that sort after a keyset position
         
-        try:
-            # Delete image from library (will cascade delete tags)
-            cursor.execute('DELETE FROM library WHERE id = ?', (library_id,))
-            conn.commit()
+        Args:
+            sort_columns (list): (expression, direction) pairs from LIBRARY_SORTS
+            after (tuple): Sort-key values of the last row already returned
             
-            return {"success": True, "message": "Image removed from library"}
+        Returns:
+            tuple: (sql, params)
+        """
+        expressions = [expr for expr, _ in sort_columns]
+        directions = {direction for _, direction in sort_columns}
         
-        except sqlite3.Error as e:
-            conn.rollback()
-            return {"success": False, "message": f"Error removing from library: {str(e)}"}
+        # An explicit bound on the leading key lets SQLite range-scan the
+        # index; it does not derive one from row values over expressions
+        first_expr, first_direction = sort_columns[0]
+        sql = f"{first_expr} {'<=' if first_direction == 'DESC' else '>='} ?"
+        params = [after[0]]
+        
+        if len(directions) == 1:
+            # Uniform direction: a single row-value comparison
+            op = '<' if directions == {'DESC'} else '>'
+            return f"{sql} AND ({', '.join(expressions)}) {op} ({', '.join('?' * len(after))})", params + list(after)
         
-        finally:
-            conn.close()
+        # Mixed directions: expand to (a > ?) OR (a = ? AND b < ?) OR ...
+        alternatives = []
+        for i, (expr, direction) in enumerate(sort_columns):
+            terms = [f'{prev} = ?' for prev in expressions[:i]]
+            terms.append(f"{expr} {'<' if direction == 'DESC' else '>'} ?")
+            alternatives.append('(' + ' AND '.join(terms) + ')')
+            params.extend(after[:i + 1])
+        return f"{sql} AND ({' OR '.join(alternatives)})", params
     
     @staticmethod
-    def add_custom_tags(library_id, tags_string):
-        """Add custom tags to a library image
+    def get_library_page(main_category=None, subcategory=None, sort='date_added', limit=50, after=None):
+        """Get one page of library images in a keyset-paginated sort order
         
         Args:
-            library_id (int): The ID of the library image
-            tags_string (str): Comma-separated tags string
+            main_category (str, optional): Filter by main category
+            subcategory (str, optional): Filter by subcategory
+            sort (str): A key of LIBRARY_SORTS
+            limit (int): Page size
+            after (tuple, optional): next_key from the previous page
             
         Returns:
-            dict: Result of the operation
+            dict: Images, whether more remain, and next_key (the sort key of
+            the last image, to pass back as `after`)
         """
-        if not tags_string or not tags_string.strip():
-            return {"success": False, "message": "No tags provided"}
+        import logging
+        sort_columns = LIBRARY_SORTS[sort]
         
-        # Parse and clean tags
-        tags = [tag.strip().lower() for tag in tags_string.split(',') if tag.strip()]
+        where_clauses, params = LibraryHelper._category_filter(main_category, subcategory)
+        if after:
+            keyset_sql, keyset_params = LibraryHelper._keyset_filter(sort_columns, after)
+            where_clauses.append(keyset_sql)
+            params.extend(keyset_params)
+        
+        where = ' WHERE ' + ' AND '.join(where_clauses) if where_clauses else ''
+        sort_keys = ', '.join(f'{expr} AS _sort_{i}' for i, (expr, _) in enumerate(sort_columns))
+        order_by = ', '.join(f'{expr} {direction}' for expr, direction in sort_columns)
+        
+        try:
+            with library_connection() as conn:
+                cursor = conn.cursor()
+                # One extra row tells us whether there is another page
+                cursor.execute(f'SELECT l.*, {sort_keys} FROM library l{where} ORDER BY {order_by} LIMIT ?',
+                               params + [limit + 1])
+                images = cursor.fetchall()
+                
+                has_more = len(images) > limit
+                images = images[:limit]
+                tags_by_image = LibraryHelper._fetch_tags(cursor, [img['id'] for img in images])
+            
+            result = []
+            next_key = None
+            for img in images:
+                image_dict = dict(img)
+                next_key = tuple(image_dict.pop(f'_sort_{i}') for i in range(len(sort_columns)))
+                image_dict['tags'] = tags_by_image[img['id']]
+                result.append(image_dict)
+            
+            return {"images": result, "has_more": has_more, "next_key": next_key}
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error getting library page: {str(e)}")
+            return {"images": [], "has_more": False, "next_key": None}
+    
+    @staticmethod
+    def count_library_images(main_category=None, subcategory=None):
+        """Count library images, optionally filtered by category
+        
+        Args:
+            main_category (str, optional): Filter by main category
+            subcategory (str, optional): Filter by subcategory
+            
+        Returns:
+            int: Number of matching images
+        """
+        import logging
+        where_clauses = []
+        params = []
+        if main_category:
+            where_clauses.append('main_category = ?')
+            params.append(main_category)
+        if subcategory:
+            where_clauses.append('subcategory = ?')
+            params.append(subcategory)
+        where = ' WHERE ' + ' AND '.join(where_clauses) if where_clauses else ''
+        
+        try:
+            with library_connection() as conn:
+                # One row per category combination, not per image
+                return conn.execute(f'SELECT COALESCE(SUM(count), 0) FROM library_category_stats{where}',
+                                    params).fetchone()[0]
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error counting library images: {str(e)}")
+            return 0
+    
+    @staticmethod
+    def search_library(search_query, main_category=None, subcategory=None, limit=50, offset=0):
+        """Ranked full-text search of the library
+        
+        Every word of the query must match, as a prefix, in the description or
+        tags ("ros" finds "roses"). Given several queries (e.g. a query and its
+        expansions), an image matching every word of any one of them matches.
+        Category filters, ranking and pagination all run in the same FTS5 query.
+        
+        Args:
+            search_query (str or list): Free-text query, or several queries
+            main_category (str, optional): Filter by main category
+            subcategory (str, optional): Filter by subcategory
+            limit (int): Page size
+            offset (int): Number of ranked results to skip
+            
+        Returns:
+            dict: Matching images (best first) and whether more remain
+        """
+        import logging
+        from search_backend import fts5_match_expression
+        
+        queries = [search_query] if isinstance(search_query, str) else search_query
+        groups = [fts5_match_expression(query, operator='AND', prefix=True) for query in queries]
+        groups = list(dict.fromkeys(group for group in groups if group))
+        if not groups:
+            return {"images": [], "has_more": False}
+        match = groups[0] if len(groups) == 1 else ' OR '.join(f'({group})' for group in groups)
+        
+        where_clauses, params = LibraryHelper._category_filter(main_category, subcategory)
+        where_clauses.insert(0, 'library_fts MATCH ?')
+        params.insert(0, match)
+        
+        try:
+            with library_connection() as conn:
+                cursor = conn.cursor()
+                
+                # bm25() is lower-is-better; tag hits weigh double. One extra row
+                # tells us whether there is another page.
+                cursor.execute(f'''
+                SELECT l.*
+                FROM library_fts
+                JOIN library l ON l.id = library_fts.rowid
+                WHERE {' AND '.join(where_clauses)}
+                ORDER BY bm25(library_fts, 1.0, 2.0)
+                LIMIT ? OFFSET ?
+                ''', params + [limit + 1, offset])
+                images = cursor.fetchall()
+                
+                has_more = len(images) > limit
+                images = images[:limit]
+                tags_by_image = LibraryHelper._fetch_tags(cursor, [img['id'] for img in images])
+            
+            result = []
+            for img in images:
+                image_dict = dict(img)
+                image_dict['tags'] = tags_by_image[img['id']]
+                result.append(image_dict)
+            
+            return {"images": result, "has_more": has_more}
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error searching library: {str(e)}")
+            return {"images": [], "has_more": False}
+    
+    @staticmethod
+    def get_library_changes(since=0, limit=500):
+        """Library changes after a change-log version, for delta sync
+        
+        Several changes to one image collapse into its latest state: the
+        current row (with tags) if it still exists, else its id in deletes.
+        
+        Args:
+            since (int): Last version the client has applied (0 for everything)
+            limit (int): Maximum number of images per response
+            
+        Returns:
+            dict: version to pass as `since` next time, has_more, upserts and
+            deletes; or reset=True if entries after `since` were compacted
+            away and the client must reload the full library first
+        """
+        import logging
+        try:
+            with library_connection() as conn:
+                # One read transaction so the version and the rows agree
+                if not conn.in_transaction:
+                    conn.execute('BEGIN')
+                cursor = conn.cursor()
+                
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'library_changes'")
+                row = cursor.fetchone()
+                current_version = row[0] if row else 0
+                
+                cursor.execute("SELECT value FROM library_meta WHERE name = 'changes_compacted_through'")
+                row = cursor.fetchone()
+                if since < (row[0] if row else 0):
+                    return {"success": True, "reset": True, "version": current_version,
+                            "has_more": False, "upserts": [], "deletes": []}
+                
+                # Each changed image once, at its latest version
+                cursor.execute('''
+                SELECT library_id, MAX(version) AS version
+                FROM library_changes
+                WHERE version > ?
+                GROUP BY library_id
+                ORDER BY version
+                LIMIT ?
+                ''', (since, limit + 1))
+                changed = cursor.fetchall()
+                
+                has_more = len(changed) > limit
+                changed = changed[:limit]
+                version = changed[-1]['version'] if has_more else current_version
+                
+                library_ids = [row['library_id'] for row in changed]
+                rows = {}
+                for start in range(0, len(library_ids), 500):
+                    batch = library_ids[start:start + 500]
+                    cursor.execute(f'SELECT * FROM library WHERE id IN ({", ".join("?" * len(batch))})', batch)
+                    rows.update((row['id'], dict(row)) for row in cursor.fetchall())
+                tags_by_image = LibraryHelper._fetch_tags(cursor, list(rows))
+            
+            upserts = []
+            deletes = []
+            for library_id in library_ids:
+                image = rows.get(library_id)
+                if image is None:
+                    deletes.append(library_id)
+                else:
+                    image['tags'] = tags_by_image[library_id]
+                    upserts.append(image)
+            
+            return {
+                "success": True,
+                "reset": False,
+                "version": version,
+                "has_more": has_more,
+                "upserts": upserts,
+                "deletes": deletes
+            }
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error reading library changes: {str(e)}")
+            return {"success": False, "message": f"Error reading library changes: {str(e)}"}
+    
+    @staticmethod
+    def get_library_version():
+        """Latest change-log version (0 if nothing has changed yet)
+        
+        Returns:
+            int: The version, or None if it could not be read
+        """
+        import logging
+        try:
+            with library_connection() as conn:
+                row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'library_changes'").fetchone()
+            return row[0] if row else 0
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error reading library version: {str(e)}")
+            return None
+    
+    @staticmethod
+    @serialized_write
+    def record_sync_client(client_id, version):
+        """Remember the last change-log version a sync client has applied"""
+        import logging
+        try:
+            with library_connection(immediate=True) as conn:
+                conn.execute('''
+                INSERT INTO library_sync_clients (client_id, version, last_seen)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (client_id) DO UPDATE SET version = excluded.version, last_seen = excluded.last_seen
+                ''', (client_id, version))
+            return {"success": True, "message": "Sync client recorded"}
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error recording sync client: {str(e)}")
+            return {"success": False, "message": f"Error recording sync client: {str(e)}"}
+    
+    @staticmethod
+    @serialized_write
+    def compact_change_log(client_ttl_days=30):
+        """Drop change-log entries that no sync client still needs
+        
+        Superseded entries (an image changed again later) are always
+        removed. Entries up to the oldest version acknowledged by a client
+        seen in the last client_ttl_days are removed too; clients idle for
+        longer are forgotten and must reload when they return.
+        
+        Returns:
+            dict: Result of the operation, with the number of entries removed
+        """
+        import logging
+        try:
+            with library_connection(immediate=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM library_sync_clients WHERE last_seen < datetime('now', ?)",
+                               (f'-{int(client_ttl_days)} days',))
+                stale_clients = cursor.rowcount
+                
+                cursor.execute('''
+                DELETE FROM library_changes
+                WHERE version NOT IN (SELECT MAX(version) FROM library_changes GROUP BY library_id)
+                ''')
+                superseded = cursor.rowcount
+                
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'library_changes'")
+                row = cursor.fetchone()
+                floor = row[0] if row else 0
+                cursor.execute('SELECT MIN(version) FROM library_sync_clients')
+                oldest_client = cursor.fetchone()[0]
+                if oldest_client is not None:
+                    floor = min(floor, oldest_client)
+                
+                # Delete markers are only needed by clients that have not seen
+                # them; upserts below the floor go too, since a client that is
+                # reset reloads the full library anyway
+                cursor.execute('DELETE FROM library_changes WHERE version <= ?', (floor,))
+                trimmed = cursor.rowcount
+                cursor.execute('''
+                INSERT INTO library_meta (name, value) VALUES ('changes_compacted_through', ?)
+                ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)
+                ''', (floor,))
+            
+            logging.info(f"Compacted library change log: {superseded} superseded, {trimmed} trimmed, "
+                         f"{stale_clients} stale clients")
+            return {
+                "success": True,
+                "message": "Change log compacted",
+                "removed": superseded + trimmed,
+                "compacted_through": floor,
+                "stale_clients": stale_clients
+            }
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error compacting change log: {str(e)}")
+            return {"success": False, "message": f"Error compacting change log: {str(e)}"}
+    
+    @staticmethod
+    def get_category_stats():
+        """Get statistics about categories in the library
+        
+        Returns:
+            dict: Counts of images in each category and subcategory
+        """
+        try:
+            with library_connection() as conn:
+                cursor = conn.cursor()
+                
+                # Initialize category structure with all subcategories
+                categories = {}
+                for main_cat, subcats in TATTOO_CATEGORIES.items():
+                    categories[main_cat] = {
+                        "count": 0,
+                        "subcategories": {subcat: 0 for subcat in subcats}
+                    }
+                
+                # Add "Uncategorized" category
+                categories["Uncategorized"] = {
+                    "count": 0,
+                    "subcategories": {"Uncategorized": 0}
+                }
+                
+                # Counters are kept current by triggers on library
+                snapshot = library_cache.get_snapshot()
+                if snapshot is not None:
+                    category_counts = snapshot.category_counts
+                else:
+                    cursor.execute('SELECT main_category, subcategory, count FROM library_category_stats')
+                    category_counts = cursor.fetchall()
+                
+                total = 0
+                for main_cat, subcat, count in category_counts:
+                    if main_cat not in categories:
+                        categories[main_cat] = {
+                            "count": 0,
+                            "subcategories": {}
+                        }
+                    
+                    categories[main_cat]["count"] += count
+                    categories[main_cat]["subcategories"][subcat] = count
+                    total += count
+            
+            return {
+                "total": total,
+                "categories": categories
+            }
+        
+        except sqlite3.Error as e:
+            return {"total": 0, "categories": {}}
+    
+    @staticmethod
+    def get_library_image(library_id):
+        """Get a specific image from the library"""
+        snapshot = library_cache.get_snapshot()
+        if snapshot is not None:
+            image = snapshot.by_id.get(library_id)
+            return snapshot.copy_image(image) if image else None
+        
+        try:
+            with library_connection() as conn:
+                cursor = conn.cursor()
+                
+                # Get the image from library
+                cursor.execute('SELECT * FROM library WHERE id = ?', (library_id,))
+                img = cursor.fetchone()
+                
+                if not img:
+                    return None
+                
+                # Get tags for this image
+                cursor.execute('SELECT tag_name FROM library_tags WHERE library_id = ?', (img['id'],))
+                tags = [row['tag_name'] for row in cursor.fetchall()]
+            
+            # Convert to dictionary
+            image_dict = dict(img)
+            image_dict['tags'] = tags
+            
+            return image_dict
+        
+        except sqlite3.Error:
+            return None
+    
+    @staticmethod
+    @serialized_write
+    def delete_from_library(library_id):
+        """Delete an image from the library"""
+        try:
+            with library_connection(immediate=True) as conn:
+                # Delete the tags explicitly in the same transaction rather than
+                # relying only on ON DELETE CASCADE, which SQLite ignores on any
+                # connection that has not enabled PRAGMA foreign_keys
+                conn.execute('DELETE FROM library_tags WHERE library_id = ?', (library_id,))
+                conn.execute('DELETE FROM library WHERE id = ?', (library_id,))
+            
+            return {"success": True, "message": "Image removed from library"}
+        
+        except sqlite3.Error as e:
+            return {"success": False, "message": f"Error removing from library: {str(e)}"}
+    
+    @staticmethod
+    @serialized_write
+    def add_custom_tags(library_id, tags_string):
+        """Add custom tags to a library image
+        
+        Args:
+            library_id (int): The ID of the library image
+            tags_string (str): Comma-separated tags string
+            
+        Returns:
+            dict: Result of the operation
+        """
+        if not tags_string or not tags_string.strip():
+            return {"success": False, "message": "No tags provided"}
+        
+        # Parse and clean tags
+        tags = [tag.strip().lower() for tag in tags_string.split(',') if tag.strip()]
         
         if not tags:
             return {"success": False, "message": "No valid tags provided"}
         
-        conn = sqlite3.connect(SQLITE_DB_PATH)
-        cursor = conn.cursor()
-        
         try:
-            # Check if image exists
-            cursor.execute('SELECT id FROM library WHERE id = ?', (library_id,))
-            if not cursor.fetchone():
-                return {"success": False, "message": "Image not found in library"}
-                
-            # Add each tag
-            for tag in tags:
-                # Check if tag already exists for this image
-                cursor.execute('SELECT id FROM library_tags WHERE library_id = ? AND tag_name = ?', 
-                             (library_id, tag))
+            with library_connection(immediate=True) as conn:
+                cursor = conn.cursor()
+                
+                # Check if image exists
+                cursor.execute('SELECT id FROM library WHERE id = ?', (library_id,))
                 if not cursor.fetchone():
-                    # Add new tag
-                    cursor.execute('INSERT INTO library_tags (library_id, tag_name, is_custom) VALUES (?, ?, 1)',
-                                 (library_id, tag))
+                    return {"success": False, "message": "Image not found in library"}
+                    
+                # Add all tags at once; UNIQUE(library_id, tag_name) skips existing ones
+                cursor.executemany('INSERT OR IGNORE INTO library_tags (library_id, tag_name, is_custom) VALUES (?, ?, 1)',
+                                   [(library_id, tag) for tag in tags])
             
-            conn.commit()
             return {
                 "success": True, 
                 "message": f"Added {len(tags)} custom tags", 
@@ -711,11 +1523,171 @@ class LibraryHelper:
             }
             
         except sqlite3.Error as e:
-            conn.rollback()
             return {"success": False, "message": f"Error adding custom tags: {str(e)}"}
+    
+    @staticmethod
+    def _clean_tag_names(tags):
+        """Lowercased, stripped, de-duplicated tag names from a list or comma-separated string"""
+        if isinstance(tags, str):
+            tags = tags.split(',')
+        cleaned = []
+        for tag in tags or []:
+            tag = str(tag).strip().lower()
+            if tag and tag not in cleaned:
+                cleaned.append(tag)
+        return cleaned
+    
+    @staticmethod
+    @serialized_write
+    def merge_tags(source_tags, target_tag):
+        """Merge one or more tags into another across the whole library
+        
+        Images that already carry the target keep their existing target tag;
+        the source rows that would duplicate it are dropped.
+        
+        Args:
+            source_tags (list or str): Tags to fold into the target
+            target_tag (str): Tag to keep
             
-        finally:
-            conn.close()
+        Returns:
+            dict: Result of the operation, with row counts
+        """
+        import logging
+        sources = LibraryHelper._clean_tag_names(source_tags)
+        targets = LibraryHelper._clean_tag_names([target_tag])
+        if not targets:
+            return {"success": False, "message": "No target tag provided"}
+        target = targets[0]
+        sources = [tag for tag in sources if tag != target]
+        if not sources:
+            return {"success": False, "message": "No source tags provided"}
+        
+        placeholders = ', '.join('?' * len(sources))
+        try:
+            with library_connection(immediate=True) as conn:
+                cursor = conn.cursor()
+                # Rows whose image already has the target (or got it from an
+                # earlier source) hit UNIQUE(library_id, tag_name) and are skipped...
+                cursor.execute(f'UPDATE OR IGNORE library_tags SET tag_name = ? WHERE tag_name IN ({placeholders})',
+                               [target] + sources)
+                renamed = cursor.rowcount
+                # ...and are now redundant
+                cursor.execute(f'DELETE FROM library_tags WHERE tag_name IN ({placeholders})', sources)
+                duplicates = cursor.rowcount
+            
+            logging.info(f"Merged {sources} into '{target}': {renamed} renamed, {duplicates} duplicates removed")
+            return {
+                "success": True,
+                "message": f"Merged {len(sources)} tags into '{target}'",
+                "target": target,
+                "renamed": renamed,
+                "duplicates_removed": duplicates
+            }
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error merging tags: {str(e)}")
+            return {"success": False, "message": f"Error merging tags: {str(e)}"}
+    
+    @staticmethod
+    def rename_tag(old_tag, new_tag):
+        """Rename a tag across the whole library (merging into new_tag if it exists)
+        
+        Returns:
+            dict: Result of the operation, with row counts
+        """
+        return LibraryHelper.merge_tags([old_tag], new_tag)
+    
+    @staticmethod
+    @serialized_write
+    def delete_tags(tags):
+        """Remove tags from every library image
+        
+        Args:
+            tags (list or str): Tags to remove
+            
+        Returns:
+            dict: Result of the operation, with the number of rows removed
+        """
+        import logging
+        tags = LibraryHelper._clean_tag_names(tags)
+        if not tags:
+            return {"success": False, "message": "No tags provided"}
+        
+        try:
+            with library_connection(immediate=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'DELETE FROM library_tags WHERE tag_name IN ({", ".join("?" * len(tags))})', tags)
+                removed = cursor.rowcount
+            
+            logging.info(f"Deleted tags {tags} from {removed} images")
+            return {"success": True, "message": f"Removed {removed} tags", "removed": removed}
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error deleting tags: {str(e)}")
+            return {"success": False, "message": f"Error deleting tags: {str(e)}"}
+    
+    @staticmethod
+    @serialized_write
+    def apply_tags(tags, main_category=None, subcategory=None, search_query=None, library_ids=None,
+                   all_images=False):
+        """Add custom tags to every library image matching the filters
+        
+        At least one filter is required unless all_images is set, so a
+        request that lost its filters cannot tag the whole library.
+        
+        Args:
+            tags (list or str): Tags to add
+            main_category (str, optional): Only images in this main category
+            subcategory (str, optional): Only images in this subcategory
+            search_query (str, optional): Only images matching this full-text query
+            library_ids (list, optional): Only these images
+            all_images (bool): Tag every image when no filter is given
+            
+        Returns:
+            dict: Result of the operation, with the number of tags added
+        """
+        import logging
+        from search_backend import fts5_match_expression
+        
+        tags = LibraryHelper._clean_tag_names(tags)
+        if not tags:
+            return {"success": False, "message": "No tags provided"}
+        if not (main_category or subcategory or search_query or library_ids is not None or all_images):
+            return {"success": False, "message": "No filter given; pass all to tag every image"}
+        
+        where_clauses, params = LibraryHelper._category_filter(main_category, subcategory)
+        if search_query:
+            match = fts5_match_expression(search_query, operator='AND', prefix=True)
+            if not match:
+                return {"success": False, "message": "Search query has no searchable words"}
+            where_clauses.append('l.id IN (SELECT rowid FROM library_fts WHERE library_fts MATCH ?)')
+            params.append(match)
+        if library_ids is not None:
+            library_ids = [int(library_id) for library_id in library_ids]
+            if not library_ids:
+                return {"success": False, "message": "No images selected"}
+            where_clauses.append(f'l.id IN ({", ".join("?" * len(library_ids))})')
+            params.extend(library_ids)
+        where = ' WHERE ' + ' AND '.join(where_clauses) if where_clauses else ''
+        
+        try:
+            with library_connection(immediate=True) as conn:
+                cursor = conn.cursor()
+                # One INSERT ... SELECT per tag; images that already have it are skipped
+                added = 0
+                for tag in tags:
+                    cursor.execute(f'''
+                    INSERT OR IGNORE INTO library_tags (library_id, tag_name, is_custom)
+                    SELECT l.id, ?, 1 FROM library l{where}
+                    ''', [tag] + params)
+                    added += cursor.rowcount
+            
+            logging.info(f"Applied tags {tags}: {added} added")
+            return {"success": True, "message": f"Added {added} tags", "tags": tags, "added": added}
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error applying tags: {str(e)}")
+            return {"success": False, "message": f"Error applying tags: {str(e)}"}
     
     @staticmethod
     def get_library_tags(library_id):
@@ -727,18 +1699,17 @@ class LibraryHelper:
         Returns:
             dict: Original and custom tags
         """
-        conn = sqlite3.connect(SQLITE_DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
         try:
-            # Get original tags
-            cursor.execute('SELECT tag_name FROM library_tags WHERE library_id = ? AND is_custom = 0', (library_id,))
-            original_tags = [row['tag_name'] for row in cursor.fetchall()]
-            
-            # Get custom tags
-            cursor.execute('SELECT tag_name FROM library_tags WHERE library_id = ? AND is_custom = 1', (library_id,))
-            custom_tags = [row['tag_name'] for row in cursor.fetchall()]
+            with library_connection() as conn:
+                cursor = conn.cursor()
+                
+                # Get original tags
+                cursor.execute('SELECT tag_name FROM library_tags WHERE library_id = ? AND is_custom = 0', (library_id,))
+                original_tags = [row['tag_name'] for row in cursor.fetchall()]
+                
+                # Get custom tags
+                cursor.execute('SELECT tag_name FROM library_tags WHERE library_id = ? AND is_custom = 1', (library_id,))
+                custom_tags = [row['tag_name'] for row in cursor.fetchall()]
             
             return {
                 "original_tags": original_tags,
@@ -748,11 +1719,9 @@ class LibraryHelper:
             
         except sqlite3.Error:
             return {"original_tags": [], "custom_tags": [], "all_tags": []}
-            
-        finally:
-            conn.close()
     
     @staticmethod
+    @serialized_write
     def update_image_category(library_id, main_category, subcategory):
         """Update the category for a library image
         
@@ -777,34 +1746,320 @@ class LibraryHelper:
         if not valid_subcategory:
             return {"success": False, "message": f"Invalid subcategory: {subcategory} for {main_category}"}
         
-        conn = sqlite3.connect(SQLITE_DB_PATH)
-        cursor = conn.cursor()
-        
         try:
-            # Check if image exists
-            cursor.execute('SELECT id FROM library WHERE id = ?', (library_id,))
-            if not cursor.fetchone():
-                return {"success": False, "message": "Image not found in library"}
-            
-            # Update category
-            cursor.execute('''
-            UPDATE library 
-            SET main_category = ?, subcategory = ?
-            WHERE id = ?
-            ''', (main_category, subcategory, library_id))
+            with library_connection(immediate=True) as conn:
+                cursor = conn.cursor()
+                
+                # Check if image exists
+                cursor.execute('SELECT id FROM library WHERE id = ?', (library_id,))
+                if not cursor.fetchone():
+                    return {"success": False, "message": "Image not found in library"}
+                
+                # Update category
+                cursor.execute('''
+                UPDATE library 
+                SET main_category = ?, subcategory = ?
+                WHERE id = ?
+                ''', (main_category, subcategory, library_id))
             
-            conn.commit()
             return {
                 "success": True,
                 "message": f"Updated category to {main_category} / {subcategory}"
             }
         
         except sqlite3.Error as e:
-            conn.rollback()
             return {"success": False, "message": f"Error updating category: {str(e)}"}
+    
+    @staticmethod
+    @serialized_write
+    def rebuild_category_stats():
+        """Recompute the category counters from the library table
+        
+        The triggers keep them exact; this repairs drift from writes made
+        with the triggers missing (e.g. by an older build or by hand).
+        
+        Returns:
+            dict: Result of the operation, with the number of corrected categories
+        """
+        import logging
+        try:
+            with library_connection(immediate=True) as conn:
+                before = {(row[0], row[1]): row[2] for row in
+                          conn.execute('SELECT main_category, subcategory, count FROM library_category_stats')}
+                for statement in LIBRARY_CATEGORY_STATS_REBUILD:
+                    conn.execute(statement)
+                after = {(row[0], row[1]): row[2] for row in
+                         conn.execute('SELECT main_category, subcategory, count FROM library_category_stats')}
+            
+            corrected = sum(1 for key in before.keys() | after.keys() if before.get(key) != after.get(key))
+            logging.info(f"Rebuilt category stats: {len(after)} categories, {corrected} corrected")
+            return {
+                "success": True,
+                "message": "Category stats rebuilt",
+                "categories": len(after),
+                "corrected": corrected
+            }
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error rebuilding category stats: {str(e)}")
+            return {"success": False, "message": f"Error rebuilding category stats: {str(e)}"}
+    
+    @staticmethod
+    def externalize_uploads():
+        """Move uploads stored inline as data URLs into the blob store
         
-        finally:
-            conn.close()
+        Rows written before the blob store held the whole base64 image in
+        url and thumbnail_url; they are rewritten to /media/<digest> URLs.
+        
+        Returns:
+            dict: Result of the operation, with moved and failed row counts
+        """
+        import logging
+        import blob_store
+        
+        moved = 0
+        failed = 0
+        try:
+            with library_connection() as conn:
+                rows = conn.execute("SELECT id, url FROM library WHERE url LIKE 'data:%'").fetchall()
+            
+            # Blob writes happen here, off the writer thread; each row is then
+            # repointed on its own so one bad upload does not block the rest
+            for row in rows:
+                try:
+                    digest = blob_store.put(blob_store.decode_data_url(row['url']))
+                except ValueError as e:
+                    logging.warning(f"Skipping library image {row['id']}: {str(e)}")
+                    failed += 1
+                    continue
+                
+                LibraryHelper._repoint_upload(row['id'], digest)
+                moved += 1
+            
+            return {
+                "success": True,
+                "message": f"Moved {moved} uploads to the blob store",
+                "moved": moved,
+                "failed": failed
+            }
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error externalizing uploads: {str(e)}")
+            return {"success": False, "message": f"Error externalizing uploads: {str(e)}"}
+    
+    @staticmethod
+    @serialized_write
+    def _repoint_upload(library_id, digest):
+        """Point a library image's URLs at its stored blob"""
+        import blob_store
+        from thumbnails import THUMBNAIL_WIDTH
+        with library_connection(immediate=True) as conn:
+            conn.execute('UPDATE library SET url = ?, thumbnail_url = ? WHERE id = ?',
+                         (blob_store.media_url(digest), blob_store.media_url(digest, THUMBNAIL_WIDTH), library_id))
+    
+    @staticmethod
+    @serialized_write
+    def record_blob_variants(digest, width, height, variants):
+        """Record the rendered variants and real dimensions of an uploaded blob
+        
+        Args:
+            digest (str): Digest of the source blob
+            width (int): Source width in pixels
+            height (int): Source height in pixels
+            variants (list): (width, height, digest) of each variant
+            
+        Returns:
+            dict: Result of the operation
+        """
+        import logging
+        import blob_store
+        try:
+            with library_connection(immediate=True) as conn:
+                conn.execute('''
+                INSERT INTO blob_images (digest, width, height) VALUES (?, ?, ?)
+                ON CONFLICT (digest) DO UPDATE SET width = excluded.width, height = excluded.height
+                ''', (digest, width, height))
+                conn.execute('DELETE FROM blob_variants WHERE source_digest = ?', (digest,))
+                conn.executemany(
+                    'INSERT INTO blob_variants (source_digest, width, height, digest) VALUES (?, ?, ?, ?)',
+                    [(digest, w, h, variant) for w, h, variant in variants]
+                )
+                # Uploads were stored with unknown (0x0) dimensions
+                conn.execute('UPDATE library SET width = ?, height = ? WHERE url = ?',
+                             (width, height, blob_store.media_url(digest)))
+            
+            logging.debug(f"Recorded {len(variants)} variants for blob {digest}")
+            return {"success": True, "message": "Variants recorded"}
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error recording variants for {digest}: {str(e)}")
+            return {"success": False, "message": f"Error recording variants: {str(e)}"}
+    
+    @staticmethod
+    def get_blob_variant(digest, width):
+        """Pick the blob to serve for a request of the given width
+        
+        Args:
+            digest (str): Digest of the source blob
+            width (int): Requested display width in pixels
+            
+        Returns:
+            tuple: (digest to serve, whether that choice is final). Until the
+            source has been rendered the original is served, not final.
+        """
+        import logging
+        try:
+            with library_connection() as conn:
+                row = conn.execute('''
+                SELECT digest FROM blob_variants
+                WHERE source_digest = ? AND width >= ?
+                ORDER BY width
+                LIMIT 1
+                ''', (digest, width)).fetchone()
+                if row:
+                    return row['digest'], True
+                
+                rendered = conn.execute('SELECT 1 FROM blob_images WHERE digest = ?', (digest,)).fetchone()
+                return digest, rendered is not None
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error looking up variants for {digest}: {str(e)}")
+            return digest, False
+    
+    @staticmethod
+    def get_unrendered_blobs():
+        """Digests of uploaded library images that have no variants recorded yet
+        
+        Returns:
+            list: Source blob digests
+        """
+        import logging
+        import blob_store
+        try:
+            with library_connection() as conn:
+                rows = conn.execute(f"""
+                SELECT DISTINCT url FROM library
+                WHERE url LIKE '{blob_store.MEDIA_URL_PREFIX}%'
+                """).fetchall()
+                rendered = {row[0] for row in conn.execute('SELECT digest FROM blob_images')}
+            
+            digests = {blob_store.digest_from_url(row[0]) for row in rows}
+            return sorted(d for d in digests if d and d not in rendered)
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error listing unrendered blobs: {str(e)}")
+            return []
+    
+    @staticmethod
+    def prune_blobs(min_age_seconds=3600):
+        """Delete stored blobs that no library image references
+        
+        Args:
+            min_age_seconds (int): Keep blobs younger than this, since an
+                upload stores its blob just before inserting its row
+            
+        Returns:
+            dict: Result of the operation, with the number of blobs removed
+        """
+        import os
+        import time
+        import logging
+        import blob_store
+        
+        try:
+            with library_connection() as conn:
+                rows = conn.execute(f"""
+                SELECT url FROM library WHERE url LIKE '{blob_store.MEDIA_URL_PREFIX}%'
+                UNION
+                SELECT thumbnail_url FROM library WHERE thumbnail_url LIKE '{blob_store.MEDIA_URL_PREFIX}%'
+                """).fetchall()
+            referenced = {blob_store.digest_from_url(row[0]) for row in rows}
+            
+            # Variants live as long as their source does
+            with library_connection() as conn:
+                for row in conn.execute('SELECT source_digest, digest FROM blob_variants').fetchall():
+                    if row['source_digest'] in referenced:
+                        referenced.add(row['digest'])
+            
+            removed = []
+            cutoff = time.time() - min_age_seconds
+            for digest in list(blob_store.iter_digests()):
+                if digest in referenced:
+                    continue
+                if os.path.getmtime(blob_store.blob_path(digest)) > cutoff:
+                    continue
+                blob_store.delete(digest)
+                removed.append(digest)
+            
+            LibraryHelper._forget_blobs(removed)
+            removed = len(removed)
+            
+            logging.info(f"Pruned {removed} unreferenced blobs")
+            return {"success": True, "message": f"Removed {removed} blobs", "removed": removed}
+        
+        except (sqlite3.Error, OSError) as e:
+            logging.error(f"Error pruning blobs: {str(e)}")
+            return {"success": False, "message": f"Error pruning blobs: {str(e)}"}
+    
+    @staticmethod
+    @serialized_write
+    def _forget_blobs(digests):
+        """Drop the recorded dimensions of deleted blobs"""
+        with library_connection(immediate=True) as conn:
+            conn.executemany('DELETE FROM blob_images WHERE digest = ?', [(d,) for d in digests])
+    
+    @staticmethod
+    def compact_library():
+        """Remove orphaned tags, refresh planner statistics and reclaim free pages
+        
+        The first run switches the database to incremental auto-vacuum, which
+        needs one full VACUUM; later runs use PRAGMA incremental_vacuum.
+        
+        Returns:
+            dict: Orphans removed and page counts before/after
+        """
+        import logging
+        
+        try:
+            with library_connection(immediate=True) as conn:
+                cursor = conn.execute('''
+                DELETE FROM library_tags
+                WHERE library_id IS NULL OR library_id NOT IN (SELECT id FROM library)
+                ''')
+                orphans_removed = cursor.rowcount
+                conn.execute('ANALYZE')
+            
+            # VACUUM cannot run inside a transaction
+            with library_connection() as conn:
+                pages_before = conn.execute('PRAGMA page_count').fetchone()[0]
+                free_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                
+                if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:  # 2 = INCREMENTAL
+                    logging.info("Switching library database to incremental auto-vacuum (full VACUUM)")
+                    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                    conn.execute('VACUUM')
+                else:
+                    # execute() steps this pragma once (one page); executescript()
+                    # runs it to completion
+                    conn.executescript('PRAGMA incremental_vacuum;')
+                
+                conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+                pages_after = conn.execute('PRAGMA page_count').fetchone()[0]
+            
+            logging.info(f"Library compacted: {orphans_removed} orphaned tags removed, "
+                         f"{pages_before - pages_after} pages reclaimed")
+            return {
+                "success": True,
+                "orphans_removed": orphans_removed,
+                "free_pages_before": free_before,
+                "pages_before": pages_before,
+                "pages_after": pages_after,
+                "reclaimed_pages": pages_before - pages_after
+            }
+        
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error compacting library: {str(e)}")
+            return {"success": False, "message": f"Error compacting library: {str(e)}"}
     
     @staticmethod
     def get_available_categories():
@@ -0,0 +1,59 @@
+"""Opaque keyset-pagination cursors
+
+A cursor is the sort key of the last row on a page (for example
+(date_added, id)), JSON-encoded and base64url-wrapped so clients treat it
+as an opaque token and pass it back verbatim.
+"""
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(*values):
+    """Encode sort-key values (datetimes, numbers, strings, None) as a cursor"""
+    payload = [
+        {'dt': value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Decode a cursor produced by encode_cursor()
+
+    Args:
+        cursor (str): The opaque cursor
+        size (int): Number of sort-key values expected
+
+    Returns:
+        tuple: The sort-key values
+
+    Raises:
+        ValueError: If the cursor is malformed or has the wrong shape
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+    if not isinstance(payload, list) or len(payload) != size:
+        raise ValueError("Invalid cursor")
+
+    values = []
+    for value in payload:
+        if isinstance(value, dict):
+            if 'dt' not in value:
+                raise ValueError("Invalid cursor")
+            value = datetime.fromisoformat(value['dt'])
+        values.append(value)
+    return tuple(values)
+
+
+def parse_limit(value, default, maximum):
+    """Parse a page-size query parameter, clamped to [1, maximum]"""
+    try:
+        return min(maximum, max(1, int(value)))
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,212 @@
+"""Vectorized relevance scoring for /search and the smart-search fallback
+
+Candidates are encoded as arrays (one row per image): tag membership,
+description hits and per-keyword weight matrices, each filled in a single
+pass, so a whole result set is scored in a handful of NumPy operations
+instead of a Python loop with an any(...) scan per image and keyword.
+top_k() picks the best rows with argpartition rather than sorting every
+candidate.
+
+rerank() orders merged /search results by how well their description and
+tags fuzzily match the query and its expansions (RapidFuzz cdist on all
+cores), blended with their weight scores, within RERANK_BUDGET_MS per
+request. Without RapidFuzz results keep their weight-score order.
+
+bench_scoring.py compares these against the per-image loops.
+"""
+import os
+import time
+import logging
+
+import numpy as np
+
+try:
+    from rapidfuzz import fuzz, process, utils as fuzz_utils
+except ImportError:  # pragma: no cover - depends on the environment
+    process = None
+
+# Fuzzy match (0-1) is added to the base score with this weight
+RERANK_FUZZY_WEIGHT = 1.0
+# Matches against an expansion count slightly less than against the query
+RERANK_EXPANSION_DISCOUNT = 0.9
+RERANK_MAX_QUERIES = 8
+RERANK_MAX_TEXT_LENGTH = 300
+RERANK_CHUNK_SIZE = 256
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", 50))
+
+
+def top_k(scores, k=None):
+    """Indices of the k highest scores, best first
+
+    Ties keep input order, as a stable sort would. Only the candidates at
+    or above the k-th score are sorted.
+
+    Args:
+        scores (array): One score per candidate
+        k (int, optional): How many to return (all when None)
+
+    Returns:
+        ndarray: Candidate indices
+    """
+    scores = np.asarray(scores, dtype=float)
+    if k is None or k >= len(scores):
+        candidates = np.arange(len(scores))
+    elif k <= 0:
+        return np.empty(0, dtype=np.intp)
+    else:
+        # Everything tied with the k-th best stays in, so the stable tie
+        # order below matches a full sort
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = np.flatnonzero(scores >= kth)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:k]
+
+
+def any_member(groups, targets):
+    """Per group (e.g. an image's tags), whether any item is in targets
+
+    Args:
+        groups (list): Lists of strings
+        targets (iterable): Strings to look for
+
+    Returns:
+        ndarray: bool, one per group
+    """
+    targets = frozenset(targets)
+    return np.fromiter((not targets.isdisjoint(group) for group in groups), dtype=bool, count=len(groups))
+
+
+def contains(texts, needle):
+    """Per text, whether needle occurs in it
+
+    Returns:
+        ndarray: bool, one per text
+    """
+    return np.fromiter((needle in text for text in texts), dtype=bool, count=len(texts))
+
+
+def positions(ids, subset):
+    """Mask of the entries of ids (sorted, unique ints) that are in subset"""
+    if not subset:
+        return np.zeros(len(ids), dtype=bool)
+    return np.isin(ids, np.fromiter(subset, dtype=np.int64, count=len(subset)), assume_unique=True)
+
+
+def keyword_evidence(weights, in_tags, in_description, tag_boost, description_boost):
+    """Sum over keywords of the best evidence each image has for it
+
+    Per (image, keyword): the weight if there is one, else tag_boost for a
+    tag match, else description_boost for a description match, else 0.
+
+    Args:
+        weights (ndarray): (images, keywords) weights, NaN where absent
+        in_tags (ndarray): (images, keywords) bool
+        in_description (ndarray): (images, keywords) bool
+
+    Returns:
+        ndarray: One score per image
+    """
+    fallback = np.where(in_tags, tag_boost, np.where(in_description, description_boost, 0.0))
+    return np.where(np.isnan(weights), fallback, weights).sum(axis=1)
+
+
+def rank_tag_filtered(images, selected_tags, weight_scores, query):
+    """Score and order /search results when tags are selected
+
+    Each image scores 1.0 if it has a selected tag, twice its keyword weight
+    sum, and 0.2 if the query occurs in its description. Images scoring 0
+    are dropped; the rest get relevance_score and come back best first.
+
+    Args:
+        images (list): Image dicts
+        selected_tags (list): Tag names picked by the user
+        weight_scores (dict): image id -> summed keyword weight
+        query (str): The search query
+
+    Returns:
+        list: The kept images, best first
+    """
+    if not images:
+        return []
+
+    scores = any_member([image['tags'] for image in images], selected_tags).astype(float)
+    scores += 2 * np.fromiter((weight_scores.get(image['id'], 0.0) for image in images),
+                              dtype=float, count=len(images))
+    scores += 0.2 * contains([(image.get('description', '') or '').lower() for image in images], query)
+
+    kept = np.flatnonzero(scores > 0)
+    ranked = []
+    for index in kept[top_k(scores[kept])]:
+        image = images[index]
+        image['relevance_score'] = float(scores[index])
+        ranked.append(image)
+    return ranked
+
+
+def fuzzy_scores(query, expansions, texts, budget_ms=RERANK_BUDGET_MS):
+    """Best fuzzy match of each text against the query or an expansion
+
+    Texts are scored in chunks, each one rapidfuzz.process.cdist call
+    across all cores. The first chunk always runs; once budget_ms has
+    passed, the remaining texts score 0.
+
+    Args:
+        query (str): The search query
+        expansions (list): Expanded queries
+        texts (list): Texts to score
+        budget_ms (float): Time budget for the whole call
+
+    Returns:
+        ndarray: Scores from 0 to 1, one per text
+    """
+    scores = np.zeros(len(texts))
+    if process is None or not texts:
+        return scores
+
+    queries = list(dict.fromkeys([query] + [expansion for expansion in expansions if expansion]))
+    queries = queries[:RERANK_MAX_QUERIES]
+    discount = np.full((len(queries), 1), RERANK_EXPANSION_DISCOUNT)
+    discount[0] = 1.0
+    # token_set_ratio grows with text length; long descriptions add little
+    texts = [text[:RERANK_MAX_TEXT_LENGTH] for text in texts]
+
+    deadline = time.perf_counter() + budget_ms / 1000
+    for start in range(0, len(texts), RERANK_CHUNK_SIZE):
+        if start and time.perf_counter() > deadline:
+            logging.warning(f"Rerank budget of {budget_ms} ms spent after {start} of {len(texts)} results")
+            break
+        chunk = texts[start:start + RERANK_CHUNK_SIZE]
+        matrix = process.cdist(queries, chunk, scorer=fuzz.token_set_ratio,
+                               processor=fuzz_utils.default_process, workers=-1)
+        scores[start:start + len(chunk)] = (matrix * discount).max(axis=0) / 100
+    return scores
+
+
+def rerank(images, query, expansions, base_scores):
+    """Order merged search results by fuzzy text match plus base score
+
+    Each image's relevance_score becomes its base score plus
+    RERANK_FUZZY_WEIGHT times the fuzzy match of its description and tags
+    against the query and its expansions.
+
+    Args:
+        images (list): Image dicts
+        query (str): The search query
+        expansions (list): Expanded queries
+        base_scores (list): One base (weight) score per image
+
+    Returns:
+        list: The images, best first
+    """
+    if not images:
+        return []
+
+    texts = [' '.join([image.get('description') or '', *image.get('tags', [])]) for image in images]
+    scores = np.asarray(base_scores, dtype=float) + RERANK_FUZZY_WEIGHT * fuzzy_scores(query, expansions, texts)
+
+    ranked = []
+    for index in top_k(scores):
+        image = images[index]
+        image['relevance_score'] = float(scores[index])
+        ranked.append(image)
+    return ranked
@@ -1,10 +1,22 @@
-from flask import render_template, request, jsonify, redirect, url_for, flash, session
+from flask import render_template, request, jsonify, redirect, url_for, flash, session, send_file
 from app import app, db
-from models import Image, Tag, Favorite, LibraryHelper
+from models import Image, Tag, Favorite, ImageWeight, LibraryHelper, LIBRARY_SORTS
 from NeedleRef.apis.unsplash_api import search_unsplash, get_image_details
 from NeedleRef.apis.pexels_api import search_pexels, get_image_details as get_pexels_image_details
 from NeedleRef.apis.pixabay_api import search_pixabay, get_image_details as get_pixabay_image_details
+from NeedleRef.apis.aggregator import multi_source_with_library
 from NeedleRef.keyword_expander import expand
+from pagination import encode_cursor, decode_cursor, parse_limit
+import blob_store
+import library_index
+import library_writer
+import relevance
+import tag_canonical
+import taxonomy
+import thumbnails
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import joinedload, selectinload
+import os
 import logging
 import requests
 import random
@@ -179,23 +191,9 @@ def search():
                                     # Extract and add tags
                                     if image_data.get('tags'):
                                         for tag_data in image_data['tags']:
-                                            tag_name = tag_data.get('title', '').lower()
-                                            if tag_name:
-                                                # Find or create tag efficiently
-                                                tag = Tag.query.filter_by(name=tag_name).first()
-                                                if not tag:
-                                                    # Try to determine category
-                                                    category = 'Other'
-                                                    if any(emotion in tag_name for emotion in ['happy', 'sad', 'angry', 'fear', 'surprise']):
-                                                        category = 'Emotion'
-                                                    elif any(angle in tag_name for angle in ['front', 'side', 'back', 'top', 'bottom']):
-                                                        category = 'Angle'
-                                                    else:
-                                                        category = 'Subject'
-
-                                                    tag = Tag(name=tag_name, category=category)
-                                                    db.session.add(tag)
-
+                                            # Canonical tag: "Roses" and "rose" share one row
+                                            tag = Tag.canonical(tag_data.get('title', ''))
+                                            if tag:
                                                 # Add tag to image if not already present
                                                 if tag not in image.tags:
                                                     image.tags.append(tag)
@@ -244,43 +242,27 @@ def search():
                 logging.error(f"Error processing batch: {str(batch_error)}")
                 continue
 
+        # Sum of weights whose "category.term" key contains a keyword,
+        # computed in SQL from image_weight for the whole page at once
+        keywords = query.lower().split()
+        weight_scores = ImageWeight.keyword_scores([image['id'] for image in saved_images], keywords)
+
         # Filter by tags if selected
         if selected_tags:
-            filtered_images = []
-            keywords = query.lower().split()
-            for image in saved_images:
-                # Calculate relevance score
-                score = 0
-
-                # Primary relevance from tags
-                if any(tag in image['tags'] for tag in selected_tags):
-                    score += 1.0
-
-                # Check weights (highest priority)
-                weights = image.get("weights") or {}
-                for key, weight in weights.items():
-                    if key and any(word.lower() in key.lower() for word in keywords):
-                        score += weight * 2
-
-                # Fallback to description text (lower priority)
-                description = image.get('description', '').lower()
-                if query in description:
-                    score += 0.2
-
-                if score > 0:
-                    image['relevance_score'] = score
-                    filtered_images.append(image)
-
-            saved_images = filtered_images
-
-        # Sort images by relevance score
-        sorted_images = sorted(saved_images, 
-                                 key=lambda x: x.get('relevance_score', 1.0),
-                                 reverse=True)
+            # Tag match, weights and description hit scored as arrays; images
+            # scoring 0 are dropped
+            saved_images = relevance.rank_tag_filtered(saved_images, selected_tags, weight_scores, query)
+            base_scores = [image['relevance_score'] for image in saved_images]
+        else:
+            base_scores = [weight_scores.get(image['id'], 0.0) * 2 for image in saved_images]
+
+        # Rerank the merged sources by fuzzy match against the query and its
+        # expansions, blended with the scores above
+        saved_images = relevance.rerank(saved_images, query, expand(query), base_scores)
 
         # Return the search results with metadata
         return jsonify({
-            'images': sorted_images,
+            'images': saved_images,
             'page': page,
             'total_pages': total_pages,
             'has_more': page < total_pages,
@@ -315,12 +297,47 @@ def favorites():
     """Display user's favorite images"""
     return render_template('favorites.html')
 
+FAVORITES_PAGE_SIZE = 24
+MAX_FAVORITES_PAGE_SIZE = 100
+
 @app.route('/api/favorites')
 def get_favorites():
-    """API endpoint to get favorite images"""
-    favorites = Favorite.query.order_by(Favorite.date_added.desc()).all()
-    favorite_images = [fav.image.to_dict() for fav in favorites]
-    return jsonify({'images': favorite_images})
+    """API endpoint to get favorite images, newest first
+    
+    Keyset-paginated on (date_added, id): pass `limit` for the page size and
+    the previous response's `next_cursor` as `cursor` for the next page. The
+    total count is only computed for the first page.
+    """
+    limit = parse_limit(request.args.get('limit'), FAVORITES_PAGE_SIZE, MAX_FAVORITES_PAGE_SIZE)
+    cursor = request.args.get('cursor')
+
+    # One joined query: favorite -> image -> tags
+    query = Favorite.query \
+        .options(joinedload(Favorite.image).joinedload(Image.tags)) \
+        .order_by(Favorite.date_added.desc(), Favorite.id.desc())
+
+    if cursor:
+        try:
+            date_added, favorite_id = decode_cursor(cursor, 2)
+        except ValueError:
+            return jsonify({'error': True, 'message': 'Invalid cursor'}), 400
+        query = query.filter(tuple_(Favorite.date_added, Favorite.id) < (date_added, favorite_id))
+
+    # Fetch one extra row to know whether another page exists
+    favorites = query.limit(limit + 1).all()
+    has_more = len(favorites) > limit
+    favorites = favorites[:limit]
+
+    response = {
+        'images': [fav.image.to_dict(is_favorite=True) for fav in favorites],
+        'has_more': has_more,
+        'next_cursor': encode_cursor(favorites[-1].date_added, favorites[-1].id) if has_more else None
+    }
+    if not cursor:
+        # Index-only count on ix_favorite_date_added_id
+        response['total'] = db.session.query(func.count(Favorite.id)).scalar()
+
+    return jsonify(response)
 
 @app.route('/api/favorites/add/<int:image_id>', methods=['POST'])
 def add_favorite(image_id):
@@ -358,36 +375,152 @@ def get_tags():
     tags = Tag.query.all()
     return jsonify({'tags': [{'id': tag.id, 'name': tag.name, 'category': tag.category} for tag in tags]})
 
+@app.route('/api/tags/aliases', methods=['POST'])
+def add_tag_alias():
+    """Map another spelling to a tag, merging any tag that already uses it"""
+    data = request.json or {}
+    tag = Tag.query.filter_by(name=tag_canonical.normalize(data.get('tag', ''))).first()
+    if not tag:
+        return jsonify({'success': False, 'message': 'Tag not found'}), 404
+
+    alias = tag.add_alias(data.get('alias', ''))
+    if alias is None:
+        return jsonify({'success': False, 'message': 'Alias must be a different, non-empty name'}), 400
+    db.session.commit()
+
+    return jsonify({'success': True, 'alias': alias.alias, 'tag': {'id': tag.id, 'name': tag.name}})
+
 @app.route('/library')
 def library():
     """Display user's local library images"""
     return render_template('library.html')
 
+LIBRARY_PAGE_SIZE = 50
+LIBRARY_SEARCH_PAGE_SIZE = 50
+MAX_LIBRARY_PAGE_SIZE = 200
+
 @app.route('/api/library')
 def get_library():
-    """API endpoint to get library images"""
+    """API endpoint to get library images
+    
+    With `search`, results come ranked from the library full-text index and
+    are paginated with `limit`/`offset`.
+    
+    Otherwise, passing any of `sort` (date_added, category or dimensions),
+    `limit` or `cursor` returns one keyset-paginated page plus `next_cursor`;
+    without them the whole library is returned, newest first. The total is
+    available from /api/library/count.
+    """
     main_category = request.args.get('main_category')
     subcategory = request.args.get('subcategory')
-    search_query = request.args.get('search', '').lower()
+    search_query = request.args.get('search', '').lower().strip()
 
-    library_images = LibraryHelper.get_all_library_images(main_category, subcategory)
-
-    # Filter by search query if provided
     if search_query:
-        filtered_images = []
-        for image in library_images:
-            tags = [tag.lower() for tag in image.get('tags', [])]
-            if any(search_query in tag for tag in tags):
-                filtered_images.append(image)
-        library_images = filtered_images
+        limit = parse_limit(request.args.get('limit'), LIBRARY_SEARCH_PAGE_SIZE, MAX_LIBRARY_PAGE_SIZE)
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+        except ValueError:
+            offset = 0
+
+        result = LibraryHelper.search_library(search_query, main_category, subcategory, limit, offset)
+        return jsonify(result)
+
+    sort = request.args.get('sort')
+    cursor = request.args.get('cursor')
+    if sort or cursor or request.args.get('limit'):
+        sort = sort or 'date_added'
+        if sort not in LIBRARY_SORTS:
+            return jsonify({'error': True, 'message': f"Unknown sort '{sort}'"}), 400
+        limit = parse_limit(request.args.get('limit'), LIBRARY_PAGE_SIZE, MAX_LIBRARY_PAGE_SIZE)
+
+        after = None
+        if cursor:
+            # The cursor carries its sort order so it cannot be replayed against another
+            try:
+                cursor_sort, *after = decode_cursor(cursor, len(LIBRARY_SORTS[sort]) + 1)
+            except ValueError:
+                return jsonify({'error': True, 'message': 'Invalid cursor'}), 400
+            if cursor_sort != sort:
+                return jsonify({'error': True, 'message': 'Invalid cursor'}), 400
+
+        page = LibraryHelper.get_library_page(main_category, subcategory, sort, limit, after)
+        return jsonify({
+            'images': page['images'],
+            'has_more': page['has_more'],
+            'next_cursor': encode_cursor(sort, *page['next_key']) if page['has_more'] else None
+        })
+
+    library_images = LibraryHelper.get_all_library_images(main_category, subcategory)
 
     return jsonify({'images': library_images})
 
+LIBRARY_CHANGES_PAGE_SIZE = 500
+MAX_LIBRARY_CHANGES_PAGE_SIZE = 2000
+
+@app.route('/api/library/changes')
+def get_library_changes():
+    """API endpoint for delta sync of the library
+    
+    Pass the `version` from the previous response as `since` (0 the first
+    time) and a stable `client` id. Returns the images added or changed
+    since then as `upserts` and removed ones as `deletes`; repeat while
+    `has_more`. `reset` means the log no longer reaches back to `since`:
+    reload /api/library and continue from the returned `version`.
+    """
+    since = request.args.get('since', 0, type=int)
+    client_id = request.args.get('client', '').strip()[:64]
+    limit = parse_limit(request.args.get('limit'), LIBRARY_CHANGES_PAGE_SIZE, MAX_LIBRARY_CHANGES_PAGE_SIZE)
+
+    result = LibraryHelper.get_library_changes(max(0, since), limit)
+    if not result.get('success'):
+        return jsonify(result), 500
+
+    # The client has applied everything up to `since`; older log entries
+    # can be compacted once every client is past them
+    if client_id:
+        LibraryHelper.record_sync_client(client_id, since)
+
+    return jsonify(result)
+
+@app.route('/api/library/count')
+def count_library():
+    """API endpoint to get the number of library images, optionally per category"""
+    main_category = request.args.get('main_category')
+    subcategory = request.args.get('subcategory')
+
+    return jsonify({'total': LibraryHelper.count_library_images(main_category, subcategory)})
+
 @app.route('/api/library/categories')
 def get_library_categories():
     """Get all available categories for organization"""
     return jsonify(LibraryHelper.get_available_categories())
 
+def _store_upload(upload):
+    """Store an uploaded data URL and wrap it in an unsaved Image
+
+    The bytes are stored once under their hash, so re-uploading the same
+    file maps to the same ID and is reported as already in library. The
+    real dimensions are filled in once the thumbnail pipeline has rendered it.
+
+    Returns:
+        tuple: (Image, blob digest)
+
+    Raises:
+        ValueError: If the upload is not a supported image
+    """
+    digest = blob_store.put(blob_store.decode_data_url(upload.get('image')))
+    temp_image = Image(
+        unsplash_id=f"user_{digest}",
+        description=upload.get('description', 'User uploaded image'),
+        url=blob_store.media_url(digest),
+        thumbnail_url=blob_store.media_url(digest, thumbnails.THUMBNAIL_WIDTH),
+        width=0,
+        height=0,
+        author='User',
+        author_username='user'
+    )
+    return temp_image, digest
+
 @app.route('/api/library/add-user-image', methods=['POST'])
 def add_user_image():
     """Add a user-uploaded image to the library"""
@@ -396,24 +529,15 @@ def add_user_image():
         return jsonify({"success": False, "message": "No image data provided"})
 
     try:
-        # Create a unique ID for the image
-        import uuid
-        unique_id = f"user_{str(uuid.uuid4())}"
-
-        # Create a temporary Image object
-        temp_image = Image(
-            unsplash_id=unique_id,
-            description=data.get('description', 'User uploaded image'),
-            url=data['image'],
-            thumbnail_url=data['image'],
-            width=0,
-            height=0,
-            author='User',
-            author_username='user'
-        )
-        
+        try:
+            temp_image, digest = _store_upload(data)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)})
+
         # Add to library
         result = LibraryHelper.add_to_library(temp_image, data.get('main_category'), data.get('subcategory'))
+        if result.get('success'):
+            thumbnails.enqueue(digest)
 
         return jsonify(result)
 
@@ -424,6 +548,114 @@ def add_user_image():
             "message": "Failed to save image to library"
         })
 
+MAX_LIBRARY_BATCH_SIZE = 500
+
+@app.route('/api/library/add-batch', methods=['POST'])
+def add_library_batch():
+    """Add many images to the library in one transaction
+
+    Body: {"image_ids": [...], "uploads": [{"image": <data URL>, "description": ...}],
+    "main_category": ..., "subcategory": ...}. Categories apply to the whole
+    batch and are auto-detected per image when omitted. Each item gets its
+    own result (keyed by image_id or upload_index); a bad item does not stop
+    the others.
+    """
+    data = request.json or {}
+    image_ids = data.get('image_ids') or []
+    uploads = data.get('uploads') or []
+
+    if not isinstance(image_ids, list) or not isinstance(uploads, list):
+        return jsonify({"success": False, "message": "image_ids and uploads must be lists"}), 400
+    if not image_ids and not uploads:
+        return jsonify({"success": False, "message": "No images provided"}), 400
+    if len(image_ids) + len(uploads) > MAX_LIBRARY_BATCH_SIZE:
+        return jsonify({"success": False,
+                        "message": f"At most {MAX_LIBRARY_BATCH_SIZE} images per batch"}), 400
+
+    # Results follow the request: image_ids first, then uploads
+    results = [{"image_id": image_id} for image_id in image_ids] + \
+              [{"upload_index": index} for index in range(len(uploads))]
+    images = []
+    positions = []  # index into results of each entry of `images`
+
+    # One query for all requested images and their tags
+    found = {}
+    valid_ids = [image_id for image_id in image_ids
+                 if isinstance(image_id, int) and not isinstance(image_id, bool)]
+    if valid_ids:
+        query = Image.query.options(selectinload(Image.tags)).filter(Image.id.in_(valid_ids))
+        found = {image.id: image for image in query}
+    for position, image_id in enumerate(image_ids):
+        if not isinstance(image_id, int) or isinstance(image_id, bool):
+            results[position].update({"success": False, "message": "Invalid image id"})
+            continue
+        image = found.get(image_id)
+        if image is None:
+            results[position].update({"success": False, "message": "Image not found"})
+            continue
+        images.append(image)
+        positions.append(position)
+
+    digests = {}
+    for index, upload in enumerate(uploads):
+        position = len(image_ids) + index
+        try:
+            temp_image, digest = _store_upload(upload if isinstance(upload, dict) else {})
+        except ValueError as e:
+            results[position].update({"success": False, "message": str(e)})
+            continue
+        digests[temp_image.unsplash_id] = digest
+        images.append(temp_image)
+        positions.append(position)
+
+    batch = LibraryHelper.add_many_to_library(images, data.get('main_category'), data.get('subcategory'))
+    if not batch.get('success'):
+        return jsonify(batch), 500
+
+    for position, result in zip(positions, batch['results']):
+        results[position].update(result)
+        if result.get('success') and result['unsplash_id'] in digests:
+            thumbnails.enqueue(digests[result['unsplash_id']])
+
+    return jsonify({
+        "success": True,
+        "added": batch['added'],
+        "failed": len(results) - batch['added'],
+        "results": results
+    })
+
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+
+@app.route('/media/<digest>')
+def serve_media(digest):
+    """Serve a stored upload; content-addressed, so it can be cached forever
+    
+    With `w`, serves the smallest rendered variant at least that wide.
+    """
+    cacheable = True
+    width = request.args.get('w', type=int)
+    if width:
+        # The original stands in until the variants exist; don't let
+        # browsers keep that answer
+        digest, cacheable = LibraryHelper.get_blob_variant(digest, width)
+
+    try:
+        path = os.path.abspath(blob_store.blob_path(digest))
+    except ValueError:
+        return jsonify({"error": "Not found"}), 404
+    if not os.path.exists(path):
+        return jsonify({"error": "Not found"}), 404
+
+    response = send_file(path, mimetype=blob_store.mime_type(digest), etag=digest,
+                         conditional=True, max_age=MEDIA_MAX_AGE if cacheable else 0)
+    response.cache_control.immutable = cacheable
+    return response
+
+@app.route('/api/library/writer-stats')
+def get_library_writer_stats():
+    """Queue depth and group-commit batch sizes of this worker's library writer"""
+    return jsonify(library_writer.metrics())
+
 @app.route('/api/library/stats')
 def get_library_stats():
     """Get statistics about the library categories"""
@@ -466,6 +698,49 @@ def add_library_tags(library_id):
     result = LibraryHelper.add_custom_tags(library_id, tags_string)
     return jsonify(result)
 
+@app.route('/api/library/tags/rename', methods=['POST'])
+def rename_library_tag():
+    """Rename a tag on every library image"""
+    data = request.json or {}
+    return jsonify(LibraryHelper.rename_tag(data.get('from', ''), data.get('to', '')))
+
+@app.route('/api/library/tags/merge', methods=['POST'])
+def merge_library_tags():
+    """Merge several tags into one on every library image"""
+    data = request.json or {}
+    return jsonify(LibraryHelper.merge_tags(data.get('sources', []), data.get('target', '')))
+
+@app.route('/api/library/tags/delete', methods=['POST'])
+def delete_library_tags():
+    """Remove tags from every library image"""
+    data = request.json or {}
+    return jsonify(LibraryHelper.delete_tags(data.get('tags', [])))
+
+@app.route('/api/library/tags/apply', methods=['POST'])
+def apply_library_tags():
+    """Add tags to every library image matching category/search/id filters"""
+    data = request.json or {}
+    library_ids = data.get('library_ids')
+    if library_ids is not None and not isinstance(library_ids, list):
+        return jsonify({"success": False, "message": "library_ids must be a list"}), 400
+    all_images = data.get('all') is True
+    if not (data.get('main_category') or data.get('subcategory') or data.get('search')
+            or library_ids is not None or all_images):
+        return jsonify({"success": False,
+                        "message": "Give main_category, subcategory, search or library_ids, or all: true"}), 400
+    try:
+        result = LibraryHelper.apply_tags(
+            data.get('tags', []),
+            main_category=data.get('main_category'),
+            subcategory=data.get('subcategory'),
+            search_query=data.get('search'),
+            library_ids=library_ids,
+            all_images=all_images
+        )
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "library_ids must be integers"}), 400
+    return jsonify(result)
+
 @app.route('/api/library/image/<int:library_id>', methods=['GET'])
 def get_library_image(library_id):
     """Get a specific image from the library"""
@@ -505,7 +780,6 @@ def smart_search():
     import hashlib
     import time
     import logging
-    from sqlalchemy import text
     
     query = request.args.get('query', '').lower().strip()
     use_cache = request.args.get('cache', 'true').lower() == 'true'
@@ -542,7 +816,8 @@ def smart_search():
     else:
         expanded_queries = [query]  # Just use the original query
     
-    # First, try the PostgreSQL database with full-text search
+    # First, try the database full-text search backend
+    backend = app.extensions['search_backend']
     try:
         # Use all expanded queries for search
         all_keywords = []
@@ -554,43 +829,13 @@ def smart_search():
         for kw in all_keywords:
             if kw not in unique_keywords:
                 unique_keywords.append(kw)
-                
-        search_terms = ' | '.join(unique_keywords)  # OR search
-        
-        # Use proper parameterized SQL for security
-        sql = text("""
-            SELECT i.*, 
-                ts_rank_cd(to_tsvector('english', COALESCE(i.description, '')), 
-                          to_tsquery('english', :search_terms)) AS rank
-            FROM image i
-            LEFT JOIN image_tags it ON i.id = it.image_id
-            LEFT JOIN tag t ON it.tag_id = t.id
-            WHERE to_tsvector('english', COALESCE(i.description, '')) @@ to_tsquery('english', :search_terms)
-               OR LOWER(t.name) LIKE ANY(ARRAY[:tag_terms])
-            GROUP BY i.id
-            ORDER BY rank DESC
-            LIMIT 50
-        """)
-        
-        # Prepare tag search terms with wildcards
-        tag_terms = [f"%{kw}%" for kw in unique_keywords]
         
-        # Execute query
-        result = db.session.execute(sql, {'search_terms': search_terms, 'tag_terms': tag_terms})
-        rows = result.fetchall()
+        # Ranked and fully hydrated in a single statement
+        db_images = backend.search(unique_keywords, limit=50)
         
-        # Process results
-        db_images = []
-        for row in rows:
-            image = Image.query.get(row[0])  # Get full image object
-            if image:
-                image_dict = image.to_dict()
-                image_dict['rank'] = float(row[-1])  # Add rank score
-                db_images.append(image_dict)
-        
-        # If postgres search returned results, use those directly
+        # If the database search returned results, use those directly
         if db_images:
-            logging.info(f"PostgreSQL fulltext search found {len(db_images)} results for '{query}'")
+            logging.info(f"{backend.name} fulltext search found {len(db_images)} results for '{query}'")
             
             # Update cache with LRU management
             if use_cache:
@@ -621,23 +866,11 @@ def smart_search():
             })
     
     except Exception as e:
-        logging.error(f"PostgreSQL fulltext search error: {str(e)}")
+        logging.error(f"{backend.name} fulltext search error: {str(e)}")
         # Continue to fallback implementation
     
     # Fallback: Enhanced library search with weighted scores
     try:
-        # Define your smart tag buckets
-        KNOWN_SUBJECTS = {"dog", "cat", "skull", "rose", "dragon", "snake", "butterfly", "koi", "wolf"}
-        KNOWN_STYLES = {"blackwork", "fine line", "dotwork", "drawing", "realism", "line art", "sketch"}
-        KNOWN_TECHNIQUES = {"shading", "stippling", "crosshatching", "stencil", "engraving"}
-        
-        # Add more terms than before
-        for art_style in ["traditional", "neo-traditional", "japanese", "geometric", "watercolor"]:
-            KNOWN_STYLES.add(art_style)
-            
-        for subject in ["flower", "bird", "tree", "mountain", "animal", "fish", "lotus", "moon", "sun", "star"]:
-            KNOWN_SUBJECTS.add(subject)
-        
         # Process all keywords from expanded queries if expansion is enabled
         all_keywords = []
         if use_expansion:
@@ -653,75 +886,14 @@ def smart_search():
         else:
             keywords = query.split()
             
-        results = []
+        # Bucketed weight sums (subject x3, style x2, technique x1.5) per
+        # library image and keyword, computed in SQL from image_weight
+        def weight_hits(unsplash_ids):
+            return ImageWeight.bucket_scores(keywords, taxonomy.SEARCH_BUCKETS, unsplash_ids)
         
-        # Get images from your local library
+        # BM25 plus tag/weight boosts over the in-memory library index
         logging.info(f"Falling back to library search for '{query}'")
-        library_images = LibraryHelper.get_all_library_images(None, None)
-        
-        # For each image, calculate relevance score with more sophisticated weighting
-        for image in library_images:
-            score = 0
-            weights = image.get('weights', {}) or {}
-            description = (image.get('description', '') or '').lower()
-            tags = [t.lower() for t in image.get('tags', [])]
-            
-            # Check exact query match first (highest priority)
-            if query in description:
-                score += 3.0
-                
-            # Check tags for direct matches
-            if any(query in tag for tag in tags):
-                score += 2.5
-                
-            # Process individual keywords
-            for word in keywords:
-                matched = False
-                
-                # Match weights dictionary (structured data is highest quality)
-                if word in KNOWN_SUBJECTS:
-                    key = f"subject.{word}"
-                    if key in weights:
-                        score += weights[key] * 3
-                        matched = True
-                
-                if word in KNOWN_STYLES:
-                    key = f"style.{word}"
-                    if key in weights:
-                        score += weights[key] * 2
-                        matched = True
-                
-                if word in KNOWN_TECHNIQUES:
-                    key = f"technique.{word}"
-                    if key in weights:
-                        score += weights[key] * 1.5
-                        matched = True
-                
-                # Check tags (second priority)
-                if not matched and any(word in tag for tag in tags):
-                    score += 1.0
-                    matched = True
-                    
-                # Fallback: description keyword match (lowest priority)
-                if not matched and word in description:
-                    score += 0.2
-            
-            if score > 0:
-                image['relevance_score'] = score
-                results.append((score, image))
-        
-        # Sort and deduplicate
-        results.sort(key=lambda x: x[0], reverse=True)
-        seen = set()
-        unique_images = []
-        
-        for _, img in results:
-            img_id = img.get('id') or img.get('image_id') or img.get('url')
-            if img_id not in seen:
-                seen.add(img_id)
-                unique_images.append(img)
-            if len(unique_images) >= 50:  # Increased limit
-                break
+        unique_images = library_index.search(query, keywords, weight_hits, limit=50)
         
         # Update cache with results using the same LRU management
         if use_cache:
@@ -760,6 +932,21 @@ def smart_search():
         }), 500
 
 
+@app.route('/api/search/all')
+async def search_all_sources():
+    """Search every image source and the library concurrently, with query expansion"""
+    query = request.args.get('query', '').strip()
+    if not query:
+        return jsonify({'results': [], 'library': [], 'message': 'No query provided'}), 400
+
+    use_expansion = request.args.get('expand', 'true').lower() == 'true'
+    queries = expand(query) if use_expansion else [query]
+    sources = tuple(name.strip() for name in request.args.get('sources', 'unsplash,pexels,pixabay').lower().split(',')
+                    if name.strip())
+
+    remote, library = await multi_source_with_library(queries, sources)
+    return jsonify({'results': remote, 'library': library, 'expanded_terms': queries})
+
 @app.route('/api/search/suggest')
 def search_suggestions():
     """Provide fast search term suggestions based on partial queries"""
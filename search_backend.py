@@ -0,0 +1,186 @@
+"""Full-text search backends for /api/smartsearch
+
+The backend is picked once at startup from the SQLAlchemy engine dialect
+(see app.py) and stored in app.extensions['search_backend']. Each backend
+returns fully hydrated image dicts (Image.to_dict() shape plus `rank`) from
+a single statement.
+"""
+import logging
+from sqlalchemy import text
+from app import db
+
+
+def fts5_match_expression(terms, operator='OR', prefix=True):
+    """Build a safe FTS5 MATCH expression from free-text terms
+
+    Each term is quoted as an FTS5 string (so punctuation and keywords like
+    AND/NEAR are taken literally) and optionally turned into a prefix query.
+
+    Args:
+        terms (list): Search terms or a raw query string
+        operator (str): 'OR' or 'AND' between terms
+        prefix (bool): Match terms as prefixes ("rose" matches "roses")
+
+    Returns:
+        str: MATCH expression, or '' when no usable terms were given
+    """
+    if isinstance(terms, str):
+        terms = terms.split()
+
+    parts = []
+    for term in terms:
+        term = term.strip()
+        if not term:
+            continue
+        quoted = '"' + term.replace('"', '""') + '"'
+        parts.append(quoted + '*' if prefix else quoted)
+
+    return f' {operator} '.join(parts)
+
+
+class SearchBackend:
+    """Base class for smart search backends
+
+    Used as-is for dialects without full-text support: it finds nothing, so
+    smart_search goes straight to its library fallback.
+    """
+    name = 'no-op'
+
+    def search(self, keywords, limit=50):
+        """Return up to `limit` ranked image dicts matching any keyword"""
+        return []
+
+
+class PostgresSearchBackend(SearchBackend):
+    """tsvector/GIN + pg_trgm search (migration 1f3c2a9d4e7b)"""
+    name = 'PostgreSQL'
+
+    # search_vector (description + tag names) is trigger-maintained and
+    # GIN-indexed; tag substring matches go through the pg_trgm index on
+    # LOWER(tag.name). Each branch is index-driven, so they are UNIONed rather
+    # than OR'ed in one WHERE. Ranking is the expensive part, so the branches
+    # only collect ids and each distinct match is ranked once. The top hits
+    # are then hydrated in the same statement (columns, tag names and
+    # favorite flag).
+    SQL = """
+        WITH q AS (
+            SELECT to_tsquery('english', :search_terms) AS query
+        ),
+        matches AS (
+            SELECT i.id
+            FROM image i, q
+            WHERE i.search_vector @@ q.query
+            UNION
+            SELECT it.image_id
+            FROM tag t
+            JOIN image_tags it ON it.tag_id = t.id
+            WHERE LOWER(t.name) LIKE ANY(:tag_terms)
+        ),
+        ranked AS (
+            SELECT i.id, ts_rank_cd(i.search_vector, q.query) AS rank
+            FROM matches m
+            JOIN image i ON i.id = m.id
+            CROSS JOIN q
+            ORDER BY rank DESC
+            LIMIT :limit
+        )
+        SELECT i.id, i.unsplash_id, i.description, i.url, i.thumbnail_url,
+               i.width, i.height, i.author, i.author_username, i.date_added,
+               COALESCE(array_agg(t.name ORDER BY t.name)
+                        FILTER (WHERE t.name IS NOT NULL), '{}') AS tags,
+               f.image_id IS NOT NULL AS is_favorite,
+               r.rank
+        FROM ranked r
+        JOIN image i ON i.id = r.id
+        LEFT JOIN image_tags it ON it.image_id = i.id
+        LEFT JOIN tag t ON t.id = it.tag_id
+        LEFT JOIN (SELECT DISTINCT image_id FROM favorite) f ON f.image_id = i.id
+        GROUP BY i.id, r.rank, f.image_id
+        ORDER BY r.rank DESC
+    """
+
+    def search(self, keywords, limit=50):
+        from models import Image
+
+        params = {
+            'search_terms': ' | '.join(keywords),  # OR search
+            'tag_terms': [f"%{kw}%" for kw in keywords],
+            'limit': limit,
+        }
+        rows = db.session.execute(text(self.SQL), params).fetchall()
+
+        results = []
+        for row in rows:
+            image_dict = Image.row_to_dict(row)
+            image_dict['rank'] = float(row.rank)
+            results.append(image_dict)
+        return results
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """FTS5 search over image_fts (migration 5b8e1d0c7a42)"""
+    name = 'SQLite FTS5'
+
+    # bm25() is lower-is-better; descriptions weigh double relative to tags.
+    # Tags are joined with the unit separator so names containing commas or
+    # spaces survive the round trip (see Image.row_to_dict).
+    SQL = """
+        WITH ranked AS (
+            SELECT rowid AS id, bm25(image_fts, 2.0, 1.0) AS score
+            FROM image_fts
+            WHERE image_fts MATCH :match
+            ORDER BY score
+            LIMIT :limit
+        )
+        SELECT i.id, i.unsplash_id, i.description, i.url, i.thumbnail_url,
+               i.width, i.height, i.author, i.author_username, i.date_added,
+               group_concat(t.name, char(31)) AS tags,
+               MAX(f.image_id IS NOT NULL) AS is_favorite,
+               -r.score AS rank
+        FROM ranked r
+        JOIN image i ON i.id = r.id
+        LEFT JOIN image_tags it ON it.image_id = i.id
+        LEFT JOIN tag t ON t.id = it.tag_id
+        LEFT JOIN (SELECT DISTINCT image_id FROM favorite) f ON f.image_id = i.id
+        GROUP BY i.id
+        ORDER BY r.score
+    """
+
+    def search(self, keywords, limit=50):
+        from models import Image
+
+        match = fts5_match_expression(keywords, operator='OR', prefix=True)
+        if not match:
+            return []
+
+        rows = db.session.execute(text(self.SQL), {'match': match, 'limit': limit}).fetchall()
+
+        results = []
+        for row in rows:
+            image_dict = Image.row_to_dict(row)
+            image_dict['rank'] = float(row.rank)
+            results.append(image_dict)
+        return results
+
+
+SEARCH_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_search_backend(dialect_name):
+    """Instantiate the search backend for a SQLAlchemy dialect name
+
+    Args:
+        dialect_name (str): e.g. db.engine.dialect.name
+
+    Returns:
+        SearchBackend: The matching backend (a no-op one for unknown dialects)
+    """
+    backend_class = SEARCH_BACKENDS.get(dialect_name)
+    if backend_class is None:
+        logging.warning(f"No full-text search backend for dialect '{dialect_name}'")
+        backend_class = SearchBackend
+    logging.info(f"Using {backend_class.name} search backend")
+    return backend_class()
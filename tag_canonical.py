@@ -0,0 +1,92 @@
+"""Canonical tag names
+
+Tags arrive as raw titles from Unsplash, Pexels query tokens and Pixabay's
+comma-split keywords, so "Rose", "roses" and "rose " would otherwise become
+separate Tag rows. canonical_name() folds case and whitespace and reduces
+each word to its WordNet noun lemma ("roses" -> "rose"). Phrases the
+lemmatizer cannot fold ("rose flower") are mapped by the tag_alias table;
+see Tag.canonical().
+
+The lemmatizer uses the WordNet data fetched by download_nltk_data.py.
+Without NLTK or the data, names are only case- and whitespace-folded.
+"""
+import re
+import logging
+import threading
+
+try:
+    from nltk.stem import WordNetLemmatizer
+except ImportError:  # pragma: no cover - depends on the environment
+    WordNetLemmatizer = None
+
+MAX_TAG_LENGTH = 50              # Tag.name is String(50)
+
+# WordNet maps some short words to unrelated lemmas ("was" -> "wa",
+# "gas" -> "ga"); words this short are kept as they are
+MIN_LEMMATIZE_LENGTH = 4
+
+_SEPARATOR_RE = re.compile(r'[\s_]+')
+_EDGE_PUNCTUATION = ' \t\n.,;:!?\'"()[]{}#'
+
+_lemmatizer = None
+_lemmatizer_loaded = False
+_lemmatizer_lock = threading.Lock()
+
+
+def _get_lemmatizer():
+    """The WordNet lemmatizer, or None if NLTK or its data is missing"""
+    global _lemmatizer, _lemmatizer_loaded
+    if _lemmatizer_loaded:
+        return _lemmatizer
+    with _lemmatizer_lock:
+        if not _lemmatizer_loaded:
+            if WordNetLemmatizer is None:
+                logging.warning("NLTK is not installed; tags will not be lemmatized")
+            else:
+                try:
+                    lemmatizer = WordNetLemmatizer()
+                    lemmatizer.lemmatize('roses')  # loads the corpus, or raises
+                    _lemmatizer = lemmatizer
+                except LookupError:
+                    logging.warning("WordNet data not found (run download_nltk_data.py); "
+                                    "tags will not be lemmatized")
+            _lemmatizer_loaded = True
+    return _lemmatizer
+
+
+def normalize(name):
+    """Lowercase, trim surrounding punctuation and collapse whitespace
+
+    Returns:
+        str: The normalized name ('' if nothing is left)
+    """
+    name = _SEPARATOR_RE.sub(' ', (name or '').lower()).strip(_EDGE_PUNCTUATION)
+    return name[:MAX_TAG_LENGTH].strip()
+
+
+def lemmatize(name):
+    """Noun lemma of each word of an already normalized name"""
+    lemmatizer = _get_lemmatizer()
+    if lemmatizer is None:
+        return name
+
+    words = []
+    for word in name.split(' '):
+        # Only plain alphabetic words; "3d", "ak-47" and the like stay as is
+        if len(word) >= MIN_LEMMATIZE_LENGTH and word.isalpha():
+            word = lemmatizer.lemmatize(word, pos='n')
+        words.append(word)
+    return ' '.join(words)
+
+
+def canonical_name(name):
+    """Canonical form of a raw tag name, before any tag_alias mapping
+
+    Args:
+        name (str): Raw tag name
+
+    Returns:
+        str: The canonical name ('' if the name is empty)
+    """
+    name = normalize(name)
+    return lemmatize(name) if name else name
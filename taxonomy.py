@@ -0,0 +1,158 @@
+"""Tattoo taxonomy shared by library categorization and search
+
+The categories, the keywords that suggest each subcategory, the tag
+categories and the smart-search term buckets live in taxonomy.json and are
+loaded once at import. Every substring keyword is compiled into a single
+Aho-Corasick automaton, so classifying a tag is one pass over its
+characters no matter how many keywords there are.
+"""
+import os
+import json
+from collections import deque
+
+TAXONOMY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'taxonomy.json')
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton reporting which keywords occur in a text"""
+
+    def __init__(self, keywords):
+        """Compile the automaton
+
+        Args:
+            keywords (list): Keywords; matches are reported by list index
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+        for index, keyword in enumerate(keywords):
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = next_state
+            self._out[state] += (index,)
+
+        # Breadth-first failure links; each state also reports the keywords
+        # of its failure state (the suffixes that end at the same position)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._out[next_state] += self._out[self._fail[next_state]]
+
+    def find(self, text):
+        """Indices of the keywords that occur in text
+
+        Returns:
+            set: Keyword indices
+        """
+        found = set()
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+_data = _load(TAXONOMY_PATH)
+
+# Main category -> subcategories, in display order
+CATEGORIES = _data['categories']
+
+SUBCATEGORY_TO_MAIN = {
+    subcategory: main_category
+    for main_category, subcategories in CATEGORIES.items()
+    for subcategory in subcategories
+}
+
+# Smart-search buckets: bucket -> exact terms
+SEARCH_BUCKETS = {bucket: frozenset(terms) for bucket, terms in _data['search_buckets'].items()}
+
+DEFAULT_TAG_CATEGORY = _data['default_tag_category']
+
+# One automaton for every substring keyword. _matches[i] says what keyword i
+# means: ('subcategory', name) or ('tag_category', name). Keyword order is
+# kept, since earlier keywords win ties.
+_keywords = []
+_matches = []
+for section in _data['subcategory_keywords'].values():
+    for keyword, subcategory in section.items():
+        _keywords.append(keyword)
+        _matches.append(('subcategory', subcategory))
+for tag_category, keywords in _data['tag_categories'].items():
+    for keyword in keywords:
+        _keywords.append(keyword)
+        _matches.append(('tag_category', tag_category))
+
+_automaton = KeywordAutomaton(_keywords)
+
+
+def categorize(tag_names):
+    """Suggest a library category for an image from its tags
+
+    Each keyword found in a tag is one vote for its subcategory; the
+    subcategory with the most votes wins, ties going to the one matched
+    first (in tag order, then keyword order).
+
+    Args:
+        tag_names (list): Lowercase tag names
+
+    Returns:
+        dict: Suggested main_category and subcategory (None if no match)
+    """
+    votes = {}
+    for tag in tag_names:
+        for index in sorted(_automaton.find(tag)):
+            kind, subcategory = _matches[index]
+            if kind == 'subcategory':
+                votes[subcategory] = votes.get(subcategory, 0) + 1
+
+    best_subcategory = None
+    highest_count = 0
+    for subcategory, count in votes.items():
+        if count > highest_count:
+            highest_count = count
+            best_subcategory = subcategory
+
+    return {
+        "main_category": SUBCATEGORY_TO_MAIN.get(best_subcategory) if best_subcategory else None,
+        "subcategory": best_subcategory
+    }
+
+
+def tag_category(tag_name):
+    """Category for a new Tag row (Emotion, Angle, ... or the default)
+
+    Args:
+        tag_name (str): Lowercase tag name
+
+    Returns:
+        str: The first tag category, in taxonomy order, with a keyword in the name
+    """
+    for index in sorted(_automaton.find(tag_name)):
+        kind, category = _matches[index]
+        if kind == 'tag_category':
+            return category
+    return DEFAULT_TAG_CATEGORY
@@ -0,0 +1,50 @@
+"""Library snapshot cache: reads reflect every commit to the library in use"""
+import pytest
+
+import library_cache
+import library_db
+import models
+from library_db import library_connection
+
+
+@pytest.fixture
+def cached(library, monkeypatch):
+    monkeypatch.setattr(library_cache, 'ENABLED', True)
+    library_cache.invalidate()
+    yield library
+    library_cache.invalidate()
+
+
+def test_snapshot_reads_the_configured_database(cached, add_image):
+    image_id = add_image('koi', tags=['fish'])
+
+    assert library_cache.get_snapshot() is not None
+    assert [image['id'] for image in cached.get_all_library_images()] == [image_id]
+
+
+def test_reads_after_writes_are_fresh(cached, add_image):
+    first = add_image('koi')
+    assert [image['id'] for image in cached.get_all_library_images()] == [first]
+
+    # Through LibraryHelper, and directly on a connection
+    cached.add_custom_tags(first, 'fish')
+    second = add_image('wave')
+    with library_connection(immediate=True) as conn:
+        conn.execute("UPDATE library SET description = 'koi pond' WHERE id = ?", (first,))
+
+    images = {image['id']: image for image in cached.get_all_library_images()}
+    assert set(images) == {first, second}
+    assert images[first]['tags'] == ['fish']
+    assert images[first]['description'] == 'koi pond'
+    assert cached.get_library_image(second)['description'] == 'wave'
+
+
+def test_switching_databases_drops_the_snapshot(cached, add_image, tmp_path, monkeypatch):
+    add_image('koi')
+    assert len(cached.get_all_library_images()) == 1
+
+    library_db.close_connection()
+    monkeypatch.setattr(library_db, 'SQLITE_DB_PATH', str(tmp_path / 'other.db'))
+    models.update_sqlite_db()
+
+    assert cached.get_all_library_images() == []
@@ -0,0 +1,81 @@
+"""Library change log: delta sync, compaction and client reset"""
+from library_db import library_connection
+
+
+def test_changes_collapse_to_latest_state(library, add_image):
+    kept = add_image('koi', tags=['fish'])
+    deleted = add_image('wave')
+    library.add_custom_tags(kept, 'japanese')
+    library.delete_from_library(deleted)
+
+    changes = library.get_library_changes(since=0)
+
+    assert changes['success'] and not changes['reset'] and not changes['has_more']
+    assert [image['id'] for image in changes['upserts']] == [kept]
+    assert sorted(changes['upserts'][0]['tags']) == ['fish', 'japanese']
+    assert changes['deletes'] == [deleted]
+    assert changes['version'] == library.get_library_version()
+
+
+def test_changes_page_by_version(library, add_image):
+    ids = [add_image(f'image {i}') for i in range(5)]
+
+    first = library.get_library_changes(since=0, limit=2)
+    second = library.get_library_changes(since=first['version'], limit=2)
+    rest = library.get_library_changes(since=second['version'], limit=2)
+
+    assert first['has_more'] and second['has_more'] and not rest['has_more']
+    pages = [first, second, rest]
+    assert [image['id'] for page in pages for image in page['upserts']] == ids
+    assert library.get_library_changes(since=rest['version'])['upserts'] == []
+
+
+def test_compaction_drops_superseded_entries_only_up_to_clients(library, add_image):
+    image_id = add_image('koi')
+    other_id = add_image('wave')
+    library.add_custom_tags(image_id, 'fish')
+    library.add_custom_tags(image_id, 'japanese')
+    client_version = library.get_library_version()
+    library.add_custom_tags(other_id, 'sea')
+    library.record_sync_client('tablet', client_version)
+
+    result = library.compact_change_log()
+
+    assert result['success']
+    assert result['compacted_through'] == client_version
+    with library_connection() as conn:
+        remaining = conn.execute('SELECT library_id FROM library_changes ORDER BY version').fetchall()
+    # One entry per image at most, and only what the client has not read
+    assert [row[0] for row in remaining] == [other_id]
+    changes = library.get_library_changes(since=client_version)
+    assert not changes['reset']
+    assert [image['id'] for image in changes['upserts']] == [other_id]
+
+
+def test_client_behind_compaction_is_reset(library, add_image):
+    add_image('koi')
+    behind = library.get_library_version()
+    add_image('wave')
+
+    library.compact_change_log()
+
+    changes = library.get_library_changes(since=behind)
+    assert changes['reset']
+    assert changes['version'] == library.get_library_version()
+    assert changes['upserts'] == [] and changes['deletes'] == []
+    # A client reloading from the reset version is current again
+    assert not library.get_library_changes(since=changes['version'])['reset']
+
+
+def test_idle_clients_are_forgotten(library, add_image):
+    add_image('koi')
+    library.record_sync_client('old phone', 0)
+    with library_connection(immediate=True) as conn:
+        conn.execute("UPDATE library_sync_clients SET last_seen = datetime('now', '-60 days')")
+    add_image('wave')
+
+    result = library.compact_change_log(client_ttl_days=30)
+
+    assert result['stale_clients'] == 1
+    assert result['compacted_through'] == library.get_library_version()
+    assert library.get_library_changes(since=0)['reset']
@@ -0,0 +1,67 @@
+"""Per-thread library connections: released with their thread, kept across fork()"""
+import gc
+import os
+import threading
+
+import pytest
+
+import library_db
+
+
+def test_finished_threads_release_their_connections(library):
+    before = len(library_db._connections)
+    threads = [threading.Thread(target=library_db.get_connection) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    gc.collect()
+
+    assert len(library_db._connections) == before
+
+
+def test_connection_is_reused_within_a_thread(library):
+    assert library_db.get_connection() is library_db.get_connection()
+
+
+def test_close_connection_forgets_it(library):
+    conn = library_db.get_connection()
+    library_db.close_connection()
+
+    assert id(conn) not in library_db._connections
+    assert library_db.get_connection() is not conn
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork()")
+def test_forked_child_keeps_inherited_connections(library):
+    inherited = library_db.get_connection()
+    started = threading.Event()
+    done = threading.Event()
+
+    def hold():
+        library_db.get_connection()
+        started.set()
+        done.wait()
+
+    worker = threading.Thread(target=hold)
+    worker.start()
+    started.wait()
+    held = dict(library_db._connections)
+
+    pid = os.fork()
+    if pid == 0:
+        # The worker thread does not exist here; neither connection may be
+        # closed by garbage collection
+        ok = False
+        try:
+            fresh = library_db.get_connection()
+            gc.collect()
+            ok = (fresh is not inherited and set(held) <= set(library_db._connections)
+                  and fresh.execute('SELECT 1').fetchone()[0] == 1)
+        finally:
+            os._exit(0 if ok else 1)
+
+    done.set()
+    worker.join()
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,107 @@
+"""Keyset pagination of the library listing, for every sort in LIBRARY_SORTS"""
+import pytest
+
+import library_cache
+from models import LIBRARY_SORTS
+
+# Ties on every leading sort key, NULL categories, and equal pixel counts
+# from different dimensions
+IMAGES = [
+    dict(main_category='Animals', subcategory='Fish', width=100, height=200, date_added='2026-01-02 00:00:00'),
+    dict(main_category='Animals', subcategory='Fish', width=200, height=100, date_added='2026-01-02 00:00:00'),
+    dict(main_category='Animals', subcategory=None, width=100, height=100, date_added='2026-01-03 00:00:00'),
+    dict(main_category=None, subcategory=None, width=50, height=50, date_added='2026-01-01 00:00:00'),
+    dict(main_category='Animals', subcategory='Birds', width=100, height=200, date_added='2026-01-02 00:00:00'),
+    dict(main_category='Flowers', subcategory='Roses', width=300, height=300, date_added='2026-01-01 00:00:00'),
+    dict(main_category=None, subcategory=None, width=50, height=50, date_added='2026-01-01 00:00:00'),
+    dict(main_category='Flowers', subcategory=None, width=100, height=200, date_added='2026-01-03 00:00:00'),
+]
+
+
+def expected_order(rows, sort):
+    """Ids in the sort's order, by successive stable sorts from the last key"""
+    keys = {
+        'date_added': [('date_added', True), ('id', True)],
+        'category': [('main_category', False), ('subcategory', False), ('date_added', True), ('id', True)],
+        'dimensions': [('pixels', True), ('id', True)],
+    }[sort]
+    rows = list(rows)
+    for name, descending in reversed(keys):
+        rows.sort(key=lambda row: row[name], reverse=descending)
+    return [row['id'] for row in rows]
+
+
+@pytest.fixture
+def images(add_image):
+    rows = []
+    for fields in IMAGES:
+        row = dict(fields, id=add_image(**fields))
+        row['pixels'] = row['width'] * row['height']
+        row['main_category'] = row['main_category'] or ''
+        row['subcategory'] = row['subcategory'] or ''
+        rows.append(row)
+    return rows
+
+
+@pytest.mark.parametrize('sort', sorted(LIBRARY_SORTS))
+@pytest.mark.parametrize('limit', [1, 2, 3, len(IMAGES) - 1, len(IMAGES), 50])
+def test_pages_cover_the_sort_order_exactly_once(library, images, sort, limit):
+    seen = []
+    after = None
+    while True:
+        page = library.get_library_page(sort=sort, limit=limit, after=after)
+        assert len(page['images']) <= limit
+        seen.extend(image['id'] for image in page['images'])
+        if not page['has_more']:
+            break
+        assert len(page['images']) == limit
+        after = page['next_key']
+
+    assert seen == expected_order(images, sort)
+
+
+@pytest.mark.parametrize('sort', sorted(LIBRARY_SORTS))
+def test_pages_within_a_category(library, images, sort):
+    seen = []
+    after = None
+    while True:
+        page = library.get_library_page(main_category='Animals', sort=sort, limit=2, after=after)
+        seen.extend(image['id'] for image in page['images'])
+        if not page['has_more']:
+            break
+        after = page['next_key']
+
+    assert seen == expected_order([row for row in images if row['main_category'] == 'Animals'], sort)
+
+
+@pytest.mark.parametrize('sort', sorted(LIBRARY_SORTS))
+def test_last_page_has_no_more(library, images, sort):
+    page = library.get_library_page(sort=sort, limit=len(IMAGES))
+    assert not page['has_more']
+    assert page['next_key'] is not None
+
+    past_the_end = library.get_library_page(sort=sort, limit=len(IMAGES), after=page['next_key'])
+    assert past_the_end == {"images": [], "has_more": False, "next_key": None}
+
+
+def test_empty_library(library):
+    for sort in LIBRARY_SORTS:
+        assert library.get_library_page(sort=sort) == {"images": [], "has_more": False, "next_key": None}
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_uncategorized_filter_matches_its_count(library, images, monkeypatch, cached):
+    monkeypatch.setattr(library_cache, 'ENABLED', cached)
+    library_cache.invalidate()
+    uncategorized = [row['id'] for row in images if not row['main_category']]
+    no_subcategory = [row['id'] for row in images if row['main_category'] == 'Animals' and not row['subcategory']]
+
+    assert library.count_library_images('Uncategorized') == len(uncategorized)
+    page = library.get_library_page(main_category='Uncategorized', limit=50)
+    assert sorted(image['id'] for image in page['images']) == sorted(uncategorized)
+    assert sorted(image['id'] for image in library.get_all_library_images('Uncategorized')) == sorted(uncategorized)
+
+    assert library.count_library_images('Animals', 'Uncategorized') == len(no_subcategory)
+    page = library.get_library_page(main_category='Animals', subcategory='Uncategorized', limit=50)
+    assert [image['id'] for image in page['images']] == no_subcategory
+    library_cache.invalidate()
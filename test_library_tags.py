@@ -0,0 +1,53 @@
+"""Bulk library tag operations: merge, rename and apply"""
+from library_db import library_connection
+
+
+def tag_rows():
+    with library_connection() as conn:
+        return sorted(tuple(row) for row in conn.execute('SELECT library_id, tag_name FROM library_tags'))
+
+
+def test_merge_collapses_duplicates(library, add_image):
+    both = add_image(tags=['koi', 'carp'])
+    source_only = add_image(tags=['carp', 'nishikigoi'])
+    target_only = add_image(tags=['koi'])
+
+    result = library.merge_tags(['Carp', ' nishikigoi ', 'koi'], 'KOI')
+
+    assert result['success']
+    assert result['target'] == 'koi'
+    assert result['renamed'] == 1          # source_only's carp; its nishikigoi would duplicate it
+    assert result['duplicates_removed'] == 2
+    assert tag_rows() == [(both, 'koi'), (source_only, 'koi'), (target_only, 'koi')]
+
+
+def test_merge_needs_a_source_other_than_the_target(library, add_image):
+    add_image(tags=['koi'])
+
+    assert not library.merge_tags(['koi'], 'koi')['success']
+    assert not library.merge_tags(['carp'], ' ')['success']
+
+
+def test_rename_merges_into_an_existing_tag(library, add_image):
+    renamed = add_image(tags=['dragn'])
+    both = add_image(tags=['dragn', 'dragon'])
+
+    result = library.rename_tag('dragn', 'dragon')
+
+    assert result['success']
+    assert result['renamed'] == 1
+    assert result['duplicates_removed'] == 1
+    assert tag_rows() == [(renamed, 'dragon'), (both, 'dragon')]
+
+
+def test_apply_tags_requires_a_filter_or_all(library, add_image):
+    first = add_image('koi pond', main_category='Animals')
+    second = add_image('rose')
+
+    assert not library.apply_tags(['x'])['success']
+    assert tag_rows() == []
+
+    assert library.apply_tags(['fish'], search_query='koi')['added'] == 1
+    assert library.apply_tags(['flower'], library_ids=[second])['added'] == 1
+    assert library.apply_tags(['ref'], all_images=True)['added'] == 2
+    assert tag_rows() == [(first, 'fish'), (first, 'ref'), (second, 'flower'), (second, 'ref')]
@@ -0,0 +1,137 @@
+"""Group commit in library_writer: savepoint isolation and the individual retry"""
+import base64
+import sqlite3
+from concurrent.futures import Future
+
+import pytest
+
+import blob_store
+import library_writer
+from library_db import get_connection, library_connection
+from library_writer import LibraryWriter
+
+
+def add_tag(library_id, tag):
+    with library_connection(immediate=True) as conn:
+        conn.execute('INSERT INTO library_tags (library_id, tag_name) VALUES (?, ?)', (library_id, tag))
+    return tag
+
+
+def add_tag_then_fail(library_id, tag):
+    # Writes on the bare connection, so only the writer's savepoint can undo it
+    get_connection().execute('INSERT INTO library_tags (library_id, tag_name) VALUES (?, ?)', (library_id, tag))
+    raise ValueError(tag)
+
+
+def add_tag_in_block_then_fail(library_id, tag):
+    # Like a write method: its own block rolls back on the exception
+    with library_connection(immediate=True) as conn:
+        conn.execute('INSERT INTO library_tags (library_id, tag_name) VALUES (?, ?)', (library_id, tag))
+        raise ValueError(tag)
+
+
+def tags_of(library_id):
+    with library_connection() as conn:
+        return sorted(row[0] for row in conn.execute('SELECT tag_name FROM library_tags WHERE library_id = ?',
+                                                     (library_id,)))
+
+
+def batch_of(*writes):
+    return [(Future(), func, args, {}) for func, *args in writes]
+
+
+class FailingCommit:
+    """Connection stand-in whose first commit fails as if the database were locked"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.failed = False
+
+    def commit(self):
+        if not self.failed:
+            self.failed = True
+            raise sqlite3.OperationalError('database is locked')
+        self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def test_failed_write_only_undoes_its_own_savepoint(add_image):
+    library_id = add_image()
+    writer = LibraryWriter()
+    batch = batch_of((add_tag, library_id, 'koi'), (add_tag_then_fail, library_id, 'broken'),
+                     (add_tag, library_id, 'wave'))
+
+    writer._apply(batch)
+
+    assert [future.result() for future in (batch[0][0], batch[2][0])] == ['koi', 'wave']
+    with pytest.raises(ValueError):
+        batch[1][0].result()
+    assert tags_of(library_id) == ['koi', 'wave']
+    assert writer.metrics()['batches'] == 1
+    assert writer.metrics()['writes'] == 3
+    assert writer.metrics()['fallbacks'] == 0
+
+
+def test_failed_group_commit_retries_each_write_alone(add_image, monkeypatch):
+    library_id = add_image()
+    failing = FailingCommit(get_connection())
+    monkeypatch.setattr(library_writer, 'get_connection', lambda: failing)
+    writer = LibraryWriter()
+    batch = batch_of((add_tag, library_id, 'koi'), (add_tag_in_block_then_fail, library_id, 'broken'),
+                     (add_tag, library_id, 'wave'))
+
+    writer._apply(batch)
+
+    assert failing.failed
+    assert batch[0][0].result() == 'koi'
+    assert batch[2][0].result() == 'wave'
+    with pytest.raises(ValueError):
+        batch[1][0].result()
+    metrics = writer.metrics()
+    assert metrics['fallbacks'] == 1
+    assert metrics['batches'] == 3
+    assert metrics['max_batch_size'] == 1
+    # Each write ran once more in its own transaction after the rollback
+    assert tags_of(library_id) == ['koi', 'wave']
+
+
+def test_writer_thread_returns_each_result(add_image):
+    library_id = add_image()
+    writer = LibraryWriter()
+
+    futures = [writer.submit(add_tag, library_id, f'tag{i}') for i in range(20)]
+
+    assert [future.result(timeout=10) for future in futures] == [f'tag{i}' for i in range(20)]
+    assert tags_of(library_id) == sorted(f'tag{i}' for i in range(20))
+    metrics = writer.metrics()
+    assert metrics['writes'] == 20
+    assert 1 <= metrics['batches'] <= 20
+    assert metrics['queue_depth'] == 0
+
+
+def test_blob_maintenance_writes_go_through_the_writer(library, add_image, tmp_path, monkeypatch):
+    writer = LibraryWriter()
+    monkeypatch.setattr(library_writer, 'ENABLED', True)
+    monkeypatch.setattr(library_writer, 'writer', writer)
+    monkeypatch.setattr(blob_store, 'BLOB_ROOT', str(tmp_path / 'blobs'))
+    library_id = add_image()
+    png = b'\x89PNG\r\n\x1a\n' + bytes(16)
+    with library_connection(immediate=True) as conn:
+        conn.execute('UPDATE library SET url = ? WHERE id = ?',
+                     ('data:image/png;base64,' + base64.b64encode(png).decode(), library_id))
+
+    assert library.externalize_uploads()['moved'] == 1
+    digest = blob_store.digest_from_url(library.get_library_image(library_id)['url'])
+    assert digest and writer.metrics()['writes'] == 1
+
+    # Orphan the blob, then prune it
+    with library_connection(immediate=True) as conn:
+        conn.execute("UPDATE library SET url = 'url', thumbnail_url = 'thumb' WHERE id = ?", (library_id,))
+        conn.execute('INSERT INTO blob_images (digest, width, height) VALUES (?, 1, 1)', (digest,))
+
+    assert library.prune_blobs(min_age_seconds=-60)['removed'] == 1
+    assert writer.metrics()['writes'] == 2
+    with library_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM blob_images').fetchone()[0] == 0
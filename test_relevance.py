@@ -0,0 +1,169 @@
+"""Vectorized relevance scoring against the per-image loops it replaced"""
+import random
+
+import numpy as np
+import pytest
+
+import library_index
+import relevance
+from library_index import LibraryIndex, grams
+from bench_scoring import KEYWORDS, QUERY, SELECTED_TAGS, loop_fallback, loop_tag_filter, make_images, make_weights
+
+
+def stable_order(scores):
+    """Indices best first, ties in input order (what sorted() gives)"""
+    return sorted(range(len(scores)), key=lambda index: -scores[index])
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_top_k_matches_a_stable_sort(seed):
+    rng = random.Random(seed)
+    # Few distinct values, so most scores tie
+    scores = [rng.choice([0.0, 0.5, 1.0, 2.5]) for _ in range(rng.randint(1, 40))]
+
+    for k in [None, 0, 1, 2, len(scores) // 2, len(scores) - 1, len(scores), len(scores) + 5]:
+        expected = stable_order(scores) if k is None else stable_order(scores)[:max(k, 0)]
+        assert relevance.top_k(scores, k).tolist() == expected, k
+
+
+def test_top_k_keeps_every_tie_at_the_cut_in_input_order():
+    scores = [1.0, 3.0, 2.0, 3.0, 2.0, 2.0, 0.0]
+    assert relevance.top_k(scores, 3).tolist() == [1, 3, 2]
+    assert relevance.top_k(scores, 4).tolist() == [1, 3, 2, 4]
+    assert relevance.top_k(np.array([]), 3).tolist() == []
+
+
+def test_keyword_evidence_prefers_weights_then_tags_then_description():
+    weights = np.array([[2.0, np.nan], [np.nan, np.nan], [np.nan, 0.5]])
+    in_tags = np.array([[True, True], [False, True], [False, False]])
+    in_description = np.array([[True, True], [True, True], [True, False]])
+
+    scores = relevance.keyword_evidence(weights, in_tags, in_description, 1.0, 0.2)
+
+    assert scores.tolist() == pytest.approx([2.0 + 1.0, 0.2 + 1.0, 0.2 + 0.5])
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_rank_tag_filtered_matches_the_loop(seed):
+    images = make_images(500, seed=seed)
+    keyword_scores, _ = make_weights(images, seed=seed)
+
+    expected = loop_tag_filter([dict(image) for image in images], SELECTED_TAGS, keyword_scores, QUERY)
+    actual = relevance.rank_tag_filtered([dict(image) for image in images], SELECTED_TAGS, keyword_scores, QUERY)
+
+    assert [image['id'] for image in actual] == [image['id'] for image in expected]
+    assert [image['relevance_score'] for image in actual] == \
+        pytest.approx([image['relevance_score'] for image in expected])
+
+
+@pytest.mark.parametrize('query, keywords', [
+    (QUERY, KEYWORDS),
+    ('koi', ['koi']),
+    ('drag', ['drag', 'skul', 'o']),
+    ('black rose', ['black', 'rose', 'roses']),
+    ('nothing here', ['nothing']),
+])
+def test_index_search_adds_bm25_to_the_loop_scores(query, keywords):
+    images = make_images(800, seed=11)
+    _, weight_hits = make_weights(images, seed=11)
+    index = LibraryIndex()
+    for image in images:
+        index.add(image)
+
+    loop_scores = {image['id']: _loop_score(image, query, keywords, weight_hits) for image in images}
+    loop_scores = {image_id: score for image_id, score in loop_scores.items() if score > 0}
+    assert set(loop_scores) == {image['id'] for image in
+                                loop_fallback(images, query, keywords, weight_hits, limit=len(images))}
+    bm25 = index._bm25(keywords)
+    found = {image['id']: image['relevance_score']
+             for image in index.search(query, keywords, weight_hits, limit=len(images))}
+
+    assert set(loop_scores) <= set(found)
+    for image_id, score in found.items():
+        assert score == pytest.approx(loop_scores.get(image_id, 0.0) + bm25.get(image_id, 0.0))
+
+
+def _loop_score(image, query, keywords, weight_hits):
+    """The score loop_fallback gives one image (it returns only the images)"""
+    score = 0
+    hits = weight_hits.get(image.get('unsplash_id'), {})
+    description = (image.get('description', '') or '').lower()
+    tags = [tag.lower() for tag in image.get('tags', [])]
+    if query in description:
+        score += 3.0
+    if any(query in tag for tag in tags):
+        score += 2.5
+    for word in keywords:
+        if word in hits:
+            score += hits[word]
+        elif any(word in tag for tag in tags):
+            score += 1.0
+        elif word in description:
+            score += 0.2
+    return score
+
+
+def test_index_search_tracks_updates_and_removals():
+    index = LibraryIndex()
+    index.add({'id': 1, 'description': 'koi pond', 'tags': ['fish']})
+    index.add({'id': 2, 'description': 'rose', 'tags': ['koi fish']})
+    assert [image['id'] for image in index.search('koi', ['koi'], {})] == [2, 1]
+
+    index.add({'id': 2, 'description': 'rose', 'tags': ['flower']})
+    index.remove(1)
+
+    assert index.search('koi', ['koi'], {}) == []
+    assert [image['id'] for image in index.search('flow', ['flow'], {})] == [2]
+
+
+def test_index_copy_only_copies_what_a_change_touches():
+    images = make_images(300, seed=5)
+    index = LibraryIndex()
+    for image in images:
+        index.add(image)
+    before = index.search(QUERY, KEYWORDS, {}, limit=len(images))
+
+    changed = index.copy()
+    changed.add({'id': images[0]['id'], 'description': 'koi pond', 'tags': ['fish']})
+    changed.add({'id': 10_000, 'description': 'koi', 'tags': []})
+    changed.remove(images[1]['id'])
+
+    touched = set(index._doc_terms[images[0]['id']]) | set(index._doc_terms[images[1]['id']]) | {'koi', 'pond', 'fish'}
+    for term, postings in index._postings.items():
+        assert (changed._postings.get(term) is postings) == (term not in touched), term
+    words = set((images[0]['description'] + ' ' + images[1]['description']).lower().split()) | {'koi', 'pond'}
+    for word, image_ids in index._words._entries.items():
+        assert (changed._words._entries.get(word) is image_ids) == (word not in words), word
+    tags = {tag.lower() for image in images[:2] for tag in image['tags']} | {'fish'}
+    tag_grams = set().union(*(grams(tag, size) for tag in tags for size in (1, 2, 3)))
+    for gram, keys in index._tags._grams.items():
+        assert changed._tags._grams.get(gram) is keys or gram in tag_grams, gram
+
+    # The original still answers as before; the copy as a fresh build would
+    assert index.search(QUERY, KEYWORDS, {}, limit=len(images)) == before
+    rebuilt = LibraryIndex()
+    for image in images[2:] + [{'id': images[0]['id'], 'description': 'koi pond', 'tags': ['fish']},
+                               {'id': 10_000, 'description': 'koi', 'tags': []}]:
+        rebuilt.add(image)
+    for query, keywords in [(QUERY, KEYWORDS), ('koi', ['koi']), ('fish', ['fish'])]:
+        assert changed.search(query, keywords, {}, limit=400) == rebuilt.search(query, keywords, {}, limit=400)
+
+
+@pytest.mark.parametrize('enabled', [False, True])
+def test_search_looks_up_weights_for_library_images_only(library, add_image, monkeypatch, enabled):
+    monkeypatch.setattr(library_index, 'ENABLED', enabled)
+    library_index.invalidate()
+    koi = add_image('koi pond')
+    add_image('rose')
+    unsplash_ids = {image['unsplash_id']: image['id'] for image in library.get_all_library_images()}
+    asked = []
+
+    def weights(ids):
+        asked.append(set(ids))
+        return {unsplash_id: {'fish': 2.0} for unsplash_id in ids if unsplash_ids[unsplash_id] == koi}
+
+    found = library_index.search('koi fish', ['koi', 'fish'], weights)
+
+    assert asked == [set(unsplash_ids)]
+    assert [image['id'] for image in found] == [koi]
+    library_index.invalidate()
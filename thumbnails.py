@@ -0,0 +1,117 @@
+"""Background generation of downscaled variants for uploaded images
+
+Each stored upload gets WebP variants at VARIANT_WIDTHS, rendered in a
+process pool so the upload request returns as soon as the original is
+stored. Variants are blobs themselves (see blob_store); the library
+database records which variant belongs to which source and the source's
+real dimensions. /media/<digest>?w=N serves the smallest variant at least
+N pixels wide, falling back to the original until it has been rendered.
+
+Pillow is needed to render; without it uploads are served unscaled.
+"""
+import io
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import blob_store
+
+try:
+    from PIL import Image as PILImage
+except ImportError:  # pragma: no cover - depends on the environment
+    PILImage = None
+
+VARIANT_WIDTHS = (200, 400, 1024)
+THUMBNAIL_WIDTH = 400            # width library listings ask for
+WEBP_QUALITY = 80
+MAX_WORKERS = int(os.environ.get("THUMBNAIL_WORKERS", min(4, os.cpu_count() or 1)))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def render_variants(digest):
+    """Render and store the variants of one blob (runs in a worker process)
+
+    Args:
+        digest (str): Digest of the source image
+
+    Returns:
+        dict: Source width/height and a list of (width, height, digest) variants
+    """
+    with PILImage.open(blob_store.blob_path(digest)) as image:
+        width, height = image.size
+        # Animated GIFs keep their first frame; WebP needs RGB(A)
+        image.seek(0)
+        source = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    variants = []
+    for target_width in VARIANT_WIDTHS:
+        if target_width >= width:
+            break
+        target_height = max(1, round(height * target_width / width))
+        resized = source.resize((target_width, target_height), PILImage.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+        variants.append((target_width, target_height, blob_store.put(buffer.getvalue())))
+
+    return {"width": width, "height": height, "variants": variants}
+
+
+def _get_executor():
+    """Lazily start this process's worker pool"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # spawn, not fork: workers must not inherit the app's threads,
+            # locks or SQLite connections
+            _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _record(digest, future):
+    """Store a finished render in the library database"""
+    from models import LibraryHelper
+    try:
+        result = future.result()
+    except Exception as e:
+        logging.error(f"Thumbnail generation failed for {digest}: {str(e)}")
+        return
+    LibraryHelper.record_blob_variants(digest, result["width"], result["height"], result["variants"])
+
+
+def enqueue(digest):
+    """Queue variant generation for a stored blob; returns immediately
+
+    Returns:
+        bool: False if thumbnails are unavailable (Pillow is not installed)
+    """
+    if PILImage is None:
+        logging.warning("Pillow is not installed; skipping thumbnail generation")
+        return False
+
+    future = _get_executor().submit(render_variants, digest)
+    future.add_done_callback(lambda f: _record(digest, f))
+    return True
+
+
+def generate(digest):
+    """Render and record variants in the calling process (for maintenance)"""
+    from models import LibraryHelper
+    result = render_variants(digest)
+    LibraryHelper.record_blob_variants(digest, result["width"], result["height"], result["variants"])
+    return result
+
+
+def shutdown(wait=True):
+    """Stop the worker pool, waiting for queued renders by default"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=wait)
+        _executor = None
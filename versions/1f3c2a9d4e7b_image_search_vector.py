@@ -0,0 +1,118 @@
+"""indexed full-text search for image descriptions and tags
+
+Revision ID: 1f3c2a9d4e7b
+Revises:
+Create Date: 2026-10-19 09:12:44.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '1f3c2a9d4e7b'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# Description terms rank above tag terms ('A' vs 'B' weight)
+SEARCH_VECTOR_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION image_search_vector(target_id integer, target_description text)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('english', COALESCE(target_description, '')), 'A') ||
+           setweight(to_tsvector('english', COALESCE((
+               SELECT string_agg(t.name, ' ')
+               FROM image_tags it
+               JOIN tag t ON t.id = it.tag_id
+               WHERE it.image_id = target_id
+           ), '')), 'B')
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION image_search_vector_on_image() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := image_search_vector(NEW.id, NEW.description);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION image_search_vector_on_image_tags() RETURNS trigger AS $$
+DECLARE
+    target_id integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        target_id := OLD.image_id;
+    ELSE
+        target_id := NEW.image_id;
+    END IF;
+    UPDATE image SET search_vector = image_search_vector(id, description)
+    WHERE id = target_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION image_search_vector_on_tag() RETURNS trigger AS $$
+BEGIN
+    UPDATE image SET search_vector = image_search_vector(id, description)
+    WHERE id IN (SELECT image_id FROM image_tags WHERE tag_id = NEW.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+SEARCH_VECTOR_TRIGGERS = """
+CREATE TRIGGER image_search_vector_image
+    BEFORE INSERT OR UPDATE OF description ON image
+    FOR EACH ROW EXECUTE FUNCTION image_search_vector_on_image();
+
+CREATE TRIGGER image_search_vector_image_tags
+    AFTER INSERT OR DELETE ON image_tags
+    FOR EACH ROW EXECUTE FUNCTION image_search_vector_on_image_tags();
+
+CREATE TRIGGER image_search_vector_tag
+    AFTER UPDATE OF name ON tag
+    FOR EACH ROW EXECUTE FUNCTION image_search_vector_on_tag();
+"""
+
+
+def upgrade():
+    # tsvector, GIN and pg_trgm are PostgreSQL-only; the SQLite development
+    # database keeps using the library fallback search.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    op.add_column('image', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute(SEARCH_VECTOR_FUNCTIONS)
+    op.execute(SEARCH_VECTOR_TRIGGERS)
+
+    # Backfill existing rows in one statement
+    op.execute('UPDATE image SET search_vector = image_search_vector(id, description)')
+
+    op.create_index('ix_image_search_vector', 'image', ['search_vector'],
+                    postgresql_using='gin')
+    op.create_index('ix_tag_name_trgm', 'tag', [sa.text('LOWER(name) gin_trgm_ops')],
+                    postgresql_using='gin')
+    # image_tags is keyed (image_id, tag_id); tag -> images lookups need their own index
+    op.create_index('ix_image_tags_tag_id', 'image_tags', ['tag_id'])
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.drop_index('ix_image_tags_tag_id', table_name='image_tags')
+    op.drop_index('ix_tag_name_trgm', table_name='tag')
+    op.drop_index('ix_image_search_vector', table_name='image')
+
+    op.execute('DROP TRIGGER IF EXISTS image_search_vector_tag ON tag')
+    op.execute('DROP TRIGGER IF EXISTS image_search_vector_image_tags ON image_tags')
+    op.execute('DROP TRIGGER IF EXISTS image_search_vector_image ON image')
+    op.execute('DROP FUNCTION IF EXISTS image_search_vector_on_tag()')
+    op.execute('DROP FUNCTION IF EXISTS image_search_vector_on_image_tags()')
+    op.execute('DROP FUNCTION IF EXISTS image_search_vector_on_image()')
+    op.execute('DROP FUNCTION IF EXISTS image_search_vector(integer, text)')
+
+    op.drop_column('image', 'search_vector')
@@ -0,0 +1,96 @@
+"""FTS5 index over image descriptions and tags for SQLite
+
+Revision ID: 5b8e1d0c7a42
+Revises: 1f3c2a9d4e7b
+Create Date: 2026-10-19 11:40:02.551987
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e1d0c7a42'
+down_revision = '1f3c2a9d4e7b'
+branch_labels = None
+depends_on = None
+
+
+# Space-joined tag names for one image; {image_id} is NEW/OLD.image_id or a column
+TAGS_FOR_IMAGE = """COALESCE((
+    SELECT group_concat(t.name, ' ')
+    FROM image_tags it
+    JOIN tag t ON t.id = it.tag_id
+    WHERE it.image_id = {image_id}
+), '')"""
+
+# image_fts.rowid is image.id; SQLite runs one statement per execute()
+UPGRADE_STATEMENTS = [
+    """
+    CREATE VIRTUAL TABLE image_fts USING fts5(
+        description, tags,
+        tokenize = 'porter unicode61',
+        prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER image_fts_image_insert AFTER INSERT ON image BEGIN
+        INSERT INTO image_fts (rowid, description, tags)
+        VALUES (NEW.id, COALESCE(NEW.description, ''), '');
+    END
+    """,
+    """
+    CREATE TRIGGER image_fts_image_update AFTER UPDATE OF description ON image BEGIN
+        UPDATE image_fts SET description = COALESCE(NEW.description, '')
+        WHERE rowid = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER image_fts_image_delete AFTER DELETE ON image BEGIN
+        DELETE FROM image_fts WHERE rowid = OLD.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER image_fts_image_tags_insert AFTER INSERT ON image_tags BEGIN
+        UPDATE image_fts SET tags = {TAGS_FOR_IMAGE.format(image_id='NEW.image_id')}
+        WHERE rowid = NEW.image_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER image_fts_image_tags_delete AFTER DELETE ON image_tags BEGIN
+        UPDATE image_fts SET tags = {TAGS_FOR_IMAGE.format(image_id='OLD.image_id')}
+        WHERE rowid = OLD.image_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER image_fts_tag_update AFTER UPDATE OF name ON tag BEGIN
+        UPDATE image_fts SET tags = {TAGS_FOR_IMAGE.format(image_id='image_fts.rowid')}
+        WHERE rowid IN (SELECT image_id FROM image_tags WHERE tag_id = NEW.id);
+    END
+    """,
+    f"""
+    INSERT INTO image_fts (rowid, description, tags)
+    SELECT i.id, COALESCE(i.description, ''), {TAGS_FOR_IMAGE.format(image_id='i.id')}
+    FROM image i
+    """,
+]
+
+
+def upgrade():
+    # PostgreSQL uses image.search_vector (revision 1f3c2a9d4e7b) instead
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    for statement in UPGRADE_STATEMENTS:
+        op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    for trigger in ('image_fts_tag_update', 'image_fts_image_tags_delete',
+                    'image_fts_image_tags_insert', 'image_fts_image_delete',
+                    'image_fts_image_update', 'image_fts_image_insert'):
+        op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    op.execute('DROP TABLE IF EXISTS image_fts')
@@ -0,0 +1,67 @@
+"""normalized image_weight table backfilled from image.weights
+
+Revision ID: 8c4f2b6e1a93
+Revises: 5b8e1d0c7a42
+Create Date: 2026-10-19 13:05:37.402114
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4f2b6e1a93'
+down_revision = '5b8e1d0c7a42'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def upgrade():
+    image_weight = op.create_table(
+        'image_weight',
+        sa.Column('image_id', sa.Integer(), nullable=False),
+        sa.Column('category', sa.String(length=50), nullable=False),
+        sa.Column('term', sa.String(length=100), nullable=False),
+        sa.Column('weight', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['image_id'], ['image.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('image_id', 'category', 'term'),
+    )
+    op.create_index('ix_image_weight_category_term', 'image_weight',
+                    ['category', 'term', 'image_id', 'weight'])
+
+    # Backfill from the JSON column ({"category.term": weight})
+    image = sa.table('image', sa.column('id', sa.Integer), sa.column('weights', sa.JSON))
+    bind = op.get_bind()
+    result = bind.execute(sa.select(image.c.id, image.c.weights).where(image.c.weights.isnot(None)))
+
+    batch = []
+    for image_id, weights in result:
+        if isinstance(weights, str):
+            weights = json.loads(weights)
+        rows = {}
+        for key, weight in (weights or {}).items():
+            if not key:
+                continue
+            category, dot, term = key.lower().partition('.')
+            if not dot:
+                category, term = 'general', category
+            rows[(category, term)] = weight
+        batch.extend(
+            {'image_id': image_id, 'category': category, 'term': term, 'weight': float(weight)}
+            for (category, term), weight in rows.items()
+        )
+        if len(batch) >= BATCH_SIZE:
+            op.bulk_insert(image_weight, batch)
+            batch = []
+
+    if batch:
+        op.bulk_insert(image_weight, batch)
+
+
+def downgrade():
+    op.drop_index('ix_image_weight_category_term', table_name='image_weight')
+    op.drop_table('image_weight')
@@ -0,0 +1,26 @@
+"""indexes for keyset-paginated favorites
+
+Revision ID: b27d9e4f0c15
+Revises: 8c4f2b6e1a93
+Create Date: 2026-10-19 14:21:10.876530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b27d9e4f0c15'
+down_revision = '8c4f2b6e1a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_favorite_date_added_id', 'favorite', ['date_added', 'id'])
+    op.create_index('ix_favorite_image_id', 'favorite', ['image_id'])
+
+
+def downgrade():
+    op.drop_index('ix_favorite_image_id', table_name='favorite')
+    op.drop_index('ix_favorite_date_added_id', table_name='favorite')
@@ -0,0 +1,89 @@
+"""tag_alias table; merge tags that share a canonical name
+
+Revision ID: e4a7c91d2b58
+Revises: b27d9e4f0c15
+Create Date: 2026-10-19 16:02:44.190318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import tag_canonical
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c91d2b58'
+down_revision = 'b27d9e4f0c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'tag_alias',
+        sa.Column('alias', sa.String(length=50), nullable=False),
+        sa.Column('tag_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('alias'),
+    )
+    op.create_index('ix_tag_alias_tag_id', 'tag_alias', ['tag_id'])
+
+    merge_duplicate_tags(op.get_bind())
+
+
+def merge_duplicate_tags(bind):
+    """Fold every tag into the tag for its canonical name
+
+    Within a group the tag already named canonically wins, else the one on
+    the most images (renamed to the canonical name). The others' image links
+    move to the winner and their names become aliases of it.
+    """
+    tags = bind.execute(sa.text("""
+        SELECT t.id, t.name, COUNT(it.image_id) AS uses
+        FROM tag t
+        LEFT JOIN image_tags it ON it.tag_id = t.id
+        GROUP BY t.id, t.name
+    """)).fetchall()
+
+    groups = {}
+    for tag in tags:
+        canonical_name = tag_canonical.canonical_name(tag.name)
+        if canonical_name:
+            groups.setdefault(canonical_name, []).append(tag)
+    taken_names = {tag.name for tag in tags}
+
+    for canonical_name, group in groups.items():
+        if len(group) == 1 and group[0].name == canonical_name:
+            continue
+
+        group.sort(key=lambda tag: (tag.name != canonical_name, -tag.uses, tag.id))
+        target, sources = group[0], group[1:]
+        for source in sources:
+            bind.execute(sa.text("""
+                INSERT INTO image_tags (image_id, tag_id)
+                SELECT image_id, :target FROM image_tags
+                WHERE tag_id = :source
+                  AND image_id NOT IN (SELECT image_id FROM image_tags WHERE tag_id = :target)
+            """), {'source': source.id, 'target': target.id})
+            bind.execute(sa.text("DELETE FROM image_tags WHERE tag_id = :source"), {'source': source.id})
+            bind.execute(sa.text("DELETE FROM tag WHERE id = :source"), {'source': source.id})
+            taken_names.discard(source.name)
+
+        target_name = target.name
+        if target_name != canonical_name and canonical_name not in taken_names:
+            bind.execute(sa.text("UPDATE tag SET name = :name WHERE id = :id"),
+                         {'name': canonical_name, 'id': target.id})
+            taken_names.discard(target_name)
+            taken_names.add(canonical_name)
+
+        # Every other spelling in the group now resolves to the target
+        aliases = {tag_canonical.normalize(tag.name) for tag in group} - taken_names - {''}
+        for alias in sorted(aliases):
+            bind.execute(sa.text("INSERT INTO tag_alias (alias, tag_id) VALUES (:alias, :tag_id)"),
+                         {'alias': alias, 'tag_id': target.id})
+
+
+def downgrade():
+    # Merged tags are not split apart again; only the alias table goes
+    op.drop_index('ix_tag_alias_tag_id', table_name='tag_alias')
+    op.drop_table('tag_alias')